@@ -1,30 +1,36 @@
+import time
 import turtle
 import tkinter as tk
 import tkinter.ttk as ttk
-
-import matplotlib
-matplotlib.use("TkAgg")
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.ticker
+from tkinter import filedialog, messagebox
 
 from sim.map import Map
 from sim.signals import SignalController
 from sim.bus import Bus
+from sim.cache import ResultCache, fingerprint
+from sim.engine import Simulation
+from sim.geometry import adjacent, path_length, start_nodes
+from sim.history import DelayHistory
+from sim.profiler import TickProfiler, TimingOverlay
+from sim.recording import TrajectoryRecorder
+from sim.replay import Replay
 
 
 # Window setup
 
 def close_window():
+    stop_recording()
+    result_cache.close()
     turtle.bye()
 
 screen = turtle.Screen()
 screen.setup(800, 800)
 screen.title("Transit Signal Priority Simulation")
+screen.tracer(0) # no automatic redraws: the screen is updated once per frame (draw_frame)
 
 root = screen._root
 root.attributes('-fullscreen', True)
-root.bind("<Escape>", lambda e: turtle.bye())
+root.bind("<Escape>", lambda e: close_window())
 
 # Layout
 
@@ -44,26 +50,42 @@ notebook.add(grid_controls, text="Controls")
 plot_tab = tk.Frame(notebook)
 notebook.add(plot_tab, text="Live Plot")
 
-# Live plot
-fig = Figure(figsize=(5, 4), dpi=100)
-ax = fig.add_subplot(111)
+# Live plot: matplotlib is imported and the plot built when the tab is first opened, and the plot
+# only redraws while its tab is showing. Samples always go to plot_history, so the plot catches up
+# when it is shown.
+plot_history = DelayHistory()
+plot_initial_delay = 0 # s, sizes the plot's first view
+live_plot = None
+
+def plot_visible():
+    return live_plot is not None and notebook.select() == str(plot_tab)
+
+def on_tab_changed(event):
+    global live_plot
+
+    if notebook.select() != str(plot_tab):
+        return
+    if live_plot is None:
+        import matplotlib
+        matplotlib.use("TkAgg")
+        from sim.plot import LivePlot
+
+        live_plot = LivePlot(plot_tab, plot_history, plot_initial_delay)
+    live_plot.refresh()
 
-ax.set_xlabel("Simulation Time (s)", fontweight="bold", fontfamily="Arial", fontsize=12, labelpad=10)
-ax.set_ylabel("Delay (s)", fontweight="bold", fontfamily="Arial", fontsize=12)
-ax.set_title("Delay Recovery", fontweight="bold", fontfamily="Arial", fontsize=12)
+notebook.bind("<<NotebookTabChanged>>", on_tab_changed)
 
-line_tsp,    = ax.plot([], [], label="With TSP",    color="blue")
-line_shadow, = ax.plot([], [], label="Without TSP", color="red")
-ax.legend()
+def reset_plot(initial_delay=0):
+    global plot_initial_delay
 
-ax.spines["top"].set_visible(False)
-ax.spines["right"].set_visible(False)
-ax.yaxis.set_major_formatter(matplotlib.ticker.FormatStrFormatter('%.2f'))
-ax.xaxis.set_major_formatter(matplotlib.ticker.FormatStrFormatter('%.2f'))
+    plot_initial_delay = initial_delay
+    plot_history.clear()
+    if live_plot is not None:
+        live_plot.reset(initial_delay)
 
-plot_canvas = FigureCanvasTkAgg(fig, master=plot_tab)
-plot_canvas.get_tk_widget().pack(fill="both", expand=True)
-fig.tight_layout()
+def refresh_plot():
+    if plot_visible():
+        live_plot.refresh()
 
 title = tk.Label(
     grid_controls,
@@ -98,20 +120,6 @@ controls_frame.pack(fill="x", padx=15, pady=5)
 # Path selection
 selected_path = [] # list of nodes
 
-adjacent = {      # list of nodes adjacent to each node:
-    1: [2,4],     # 1-2-3
-    2: [1,3,5],   # | | |
-    3: [2,6],     # 4-5-6
-    4: [1,5,7],   # | | |
-    5: [2,4,6,8], # 7-8-9
-    6: [3,5,9],
-    7: [4,8],
-    8: [5,7,9],
-    9: [6,8]
-}
-
-start_nodes = {1,3,7,9} # a path cannot start at an intersection; these are the only starting nodes
-
 # Verify node selection
 
 def select_node(node):
@@ -134,7 +142,7 @@ def select_node(node):
 
     update_node_display()
 
-    if len(selected_path) == 4: # if the user has already selected 4 nodes
+    if len(selected_path) == path_length: # if the user has already selected 4 nodes
         lock_path()             # do not allow anymore selections
 
 def update_node_display():
@@ -233,6 +241,113 @@ delay_slider = tk.Scale(
 delay_slider.set(5000)
 delay_slider.pack(in_=controls_frame, pady=8, fill="x")
 
+# UI controls (playback speed)
+speed_frame = tk.LabelFrame(
+    grid_controls,
+    text="Playback Speed",
+    font=("Arial", 12, "bold"),
+    padx=10,
+    pady=5,
+    bg="#f2f2f2"
+)
+
+speed_frame.pack(fill="x", padx=15, pady=5)
+
+# model ticks per rendered frame; "max" runs as many as fit in max_frame_time
+speed_options = {"1x": 1, "4x": 4, "16x": 16, "max": None}
+max_frame_time = 0.05 # s of stepping per frame at "max"
+
+selected_speed = tk.StringVar(value="1x")
+
+for c, label in enumerate(speed_options):
+    tk.Radiobutton(
+        speed_frame,
+        text=label,
+        variable=selected_speed,
+        value=label,
+        font=("Arial", 9)
+    ).grid(row=0, column=c, padx=6)
+
+# frame timing overlay and export
+show_timings = tk.BooleanVar(value=False)
+
+tk.Checkbutton(
+    speed_frame,
+    text="Timing overlay",
+    variable=show_timings,
+    command=lambda: toggle_timings(),
+    font=("Arial", 9)
+).grid(row=1, column=0, columnspan=2, pady=(4, 0), sticky="w")
+
+tk.Button(
+    speed_frame,
+    text="Export timings",
+    command=lambda: export_timings(),
+    font=("Arial", 9)
+).grid(row=1, column=2, columnspan=2, pady=(4, 0), sticky="e")
+
+# log every tick to a binary trajectory file (trace-<date>-<time>.tsprec)
+record_trace = tk.BooleanVar(value=False)
+
+tk.Checkbutton(
+    speed_frame,
+    text="Record trajectory",
+    variable=record_trace,
+    font=("Arial", 9)
+).grid(row=2, column=0, columnspan=2, pady=(4, 0), sticky="w")
+
+# Replay of a recorded run
+replay_frame = tk.LabelFrame(
+    grid_controls,
+    text="Replay",
+    font=("Arial", 12, "bold"),
+    padx=10,
+    pady=5,
+    bg="#f2f2f2"
+)
+
+replay_frame.pack(fill="x", padx=15, pady=5)
+replay_frame.columnconfigure(1, weight=1)
+
+tk.Button(
+    replay_frame,
+    text="Open recording",
+    command=lambda: open_replay(),
+    font=("Arial", 9)
+).grid(row=0, column=0, columnspan=3, pady=(0, 4))
+
+replay_slider = tk.Scale(
+    replay_frame,
+    from_=0, to=0,
+    orient="horizontal",
+    showvalue=False,
+    state="disabled",
+    command=lambda value: seek_replay(int(float(value)))
+)
+replay_slider.grid(row=1, column=0, columnspan=3, sticky="ew")
+
+tk.Button(
+    replay_frame,
+    text="◀ GREEN+",
+    command=lambda: jump_extension(-1),
+    font=("Arial", 9)
+).grid(row=2, column=0, sticky="w")
+
+replay_time_var = tk.StringVar(value="")
+
+tk.Label(
+    replay_frame,
+    textvariable=replay_time_var,
+    font=("Arial", 9)
+).grid(row=2, column=1)
+
+tk.Button(
+    replay_frame,
+    text="GREEN+ ▶",
+    command=lambda: jump_extension(1),
+    font=("Arial", 9)
+).grid(row=2, column=2, sticky="e")
+
 # Results Table
 
 results_frame = tk.LabelFrame(
@@ -311,19 +426,10 @@ controller = SignalController(screen, my_map.stoplines)
 # Simulation state
 
 sim_running = False
-sim_time = 0
 sim_tick = 20
-dt = sim_tick / 1000
-
-initial_delay = 0
-initial_delay_sec = 0
 
 display_counter = 0
 
-plot_times = []
-plot_delay_tsp = []
-plot_delay_shadow = []
-
 # Bus initialization
 late_bus = Bus(
     screen,
@@ -334,85 +440,204 @@ late_bus = Bus(
     is_late=True
 )
 
-# Shadow bus initialization
-base_shadow_distance = 0
-scheduled_time = 0
-late_shadow_distance = 0
-late_shadow_time = 0
-base_shadow_clock_time = 0
-late_shadow_clock_time = 0
+# Headless model driven by the GUI (late bus, controller and both shadow buses)
+simulation = Simulation(controller, late_bus, tick=sim_tick)
+simulation.record = True    # the full delay series for the cache (plot_history is thinned by LTTB)
+
+# Frame timing: the parts of each frame and how late its timer fired (when the overlay is on)
+profiler = TickProfiler()
+timing_overlay = TimingOverlay(canvas, profiler)
+frame_due = None # when the next frame's timer should fire (perf_counter s)
+
+result_cache = ResultCache()
+cache_max_time = 600000 # runs that recover later are not stored (as in run_scenario)
+cache_key = None        # fingerprint of the running scenario
+
+def toggle_timings():
+    if show_timings.get():
+        profiler.clear()
+        simulation.profiler = profiler
+        timing_overlay.show()
+    else:
+        simulation.profiler = None
+        timing_overlay.hide()
+
+def start_recording():
+    if not record_trace.get():
+        return
+    scenario = dict(path=list(selected_path), lane=selected_lane.get(), green_time=controller.green_time,
+                    yellow_time=controller.yellow_time, extension_time=controller.extension_time,
+                    delay=delay_slider.get())
+    path = time.strftime("trace-%Y%m%d-%H%M%S.tsprec")
+    simulation.recorder = TrajectoryRecorder(path, scenario, sim_tick, late_bus.go_speed)
+
+def stop_recording():
+    if simulation.recorder is not None:
+        simulation.recorder.close()
+        simulation.recorder = None
+
+# Replay: the bus and stoplines are set straight from the recording, nothing is simulated
+replay = None
+
+def open_replay():
+    global replay
+
+    path = filedialog.askopenfilename(filetypes=[("Trajectory recordings", "*.tsprec"), ("All files", "*")])
+    if not path:
+        return
+
+    reset_sim()
+    replay = Replay(path)
+    if replay.count == 0:
+        close_replay()
+        return
+    controller.plan = replay.plan
+
+    initial_tsp.set(f"{replay.initial_delay:.2f}")
+    initial_shadow.set(f"{replay.initial_delay:.2f}")
+    replay_slider.config(state="normal", to=replay.count - 1)
+    replay_slider.set(0)
+    seek_replay(0)
+
+# leave replay mode: the bus and signals go back to their start state
+def close_replay():
+    global replay
+    if replay is not None:
+        replay.close()
+        replay = None
+        late_bus.reset()
+        controller.plan = None
+        controller.reset()
+        draw_frame()
+    replay_slider.set(0)
+    replay_slider.config(state="disabled", to=0)
+    replay_time_var.set("")
+
+def seek_replay(i):
+    if replay is None:
+        return
+    frame = replay.frame(i)
+
+    late_bus.x, late_bus.y, late_bus.heading = frame.x, frame.y, frame.heading
+    controller.phase_index, controller.phase, controller.state = frame.phase_index, frame.phase, frame.state
+    controller.apply_colors()
+    if frame.extension_used:
+        controller.notify("GREEN+")
+    else:
+        controller.clear_notice()
+    draw_frame()
+
+    replay_time_var.set(f"{frame.time:.2f} s" + ("  GREEN+ granted" if frame.extended else ""))
+    current_tsp.set(f"{frame.delay_tsp:.2f}")
+    current_shadow.set(f"{frame.delay_shadow:.2f}")
+    recovered_tsp.set(f"{max(0, replay.initial_delay - frame.delay_tsp):.2f}")
+    recovered_shadow.set(f"{max(0, replay.initial_delay - frame.delay_shadow):.2f}")
+
+# move the slider to the previous (-1) or next (1) extension grant
+def jump_extension(direction):
+    if replay is None:
+        return
+    i = replay_slider.get()
+    target = replay.next_extension(i) if direction > 0 else replay.previous_extension(i)
+    if target is not None:
+        replay_slider.set(target)
+        seek_replay(target)
+
+def export_timings():
+    path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV", "*.csv")],
+                                        initialfile="timings.csv")
+    if path:
+        profiler.write_csv(path)
+
+# push bus motion and signal changes to the screen in a single update
+def draw_frame():
+    late_bus.draw()
+    controller.draw()
+    screen.update()
+
+draw_frame()
 
 def start_sim():
-    global sim_running
+    global sim_running, frame_due
 
-    if len(selected_path) != 4:
+    if len(selected_path) != path_length:
         return
 
     if sim_running:
         return
 
-    # Get selected path and initialize bus pos
-    path = [my_map.grid[selected_lane.get()][n] for n in selected_path]
-    late_bus.chassis.hideturtle()
-    late_bus.chassis.path = late_bus.close_loop(path, my_map.grid[selected_lane.get()])
-    late_bus.chassis.goto(late_bus.chassis.path[0])
-    late_bus.chassis.target_index = 1
-    late_bus.chassis.showturtle()
+    close_replay()
 
+    # Get selected path and initialize bus pos
     # Set stoplines and approaches on selected path
-    late_bus.approaches = late_bus.infer_approaches()
-    late_bus.current_leg_index = 0
-    late_bus.current_stop_index = 0
-    late_bus.active = True
-    late_bus.priority_requested = False
+    path = [my_map.grid[selected_lane.get()][n] for n in selected_path]
+    late_bus.set_path(late_bus.close_loop(path, my_map.grid[selected_lane.get()]))
 
     # Set signal times
     controller.green_time = green_slider.get()
     controller.yellow_time = yellow_slider.get()
     controller.extension_time = extension_slider.get()
 
-    global initial_delay_sec, initial_delay
-    initial_delay = delay_slider.get()
-    initial_delay_sec = initial_delay / 1000.0
+    initial_delay_sec = delay_slider.get() / 1000.0
 
     initial_tsp.set(f"{initial_delay_sec:.2f}")
     initial_shadow.set(f"{initial_delay_sec:.2f}")
+    reset_plot(initial_delay_sec)
 
-    global base_shadow_distance, late_shadow_distance
-    base_shadow_distance = initial_delay / sim_tick * late_bus.go_speed
-    late_shadow_distance = 0
-
-    # The baseline clock starts at 5.0s, the late buses start at 0.0s
-    global base_shadow_clock_time, late_shadow_clock_time, sim_time
-    sim_time = 0
-    base_shadow_clock_time = 0              # ms for controller
-    late_shadow_clock_time = 0              # ms for controller
+    if show_cached():
+        return
 
     sim_running = True
-    controller.start()
+    simulation.start(delay_slider.get())
+    start_recording()
+    frame_due = time.perf_counter()
     sim_loop()
 
+# Result of the scenario set on the sliders, if it was run before (here or by a sweep)
+def scenario_key():
+    return fingerprint(
+        selected_path, selected_lane.get(), green_slider.get(), yellow_slider.get(), extension_slider.get(),
+        delay_slider.get(), max_time=cache_max_time,
+    )
+
+# offer the cached result instead of running; True if it was shown
+def show_cached():
+    global cache_key
+
+    cache_key = scenario_key()
+    result = result_cache.get(cache_key)
+    if result is None:
+        return False
+    if not messagebox.askyesno("Cached result", "This scenario has been run before. Show the cached result?"):
+        return False
+
+    recovery_time_var.set("-" if result.recovery_time is None else f"{result.recovery_time:.2f}")
+    current_tsp.set(f"{result.delay_tsp:.2f}")
+    recovered_tsp.set(f"{result.recovered_tsp:.2f}")
+    current_shadow.set(f"{result.delay_shadow:.2f}")
+    recovered_shadow.set(f"{result.recovered_shadow:.2f}")
+
+    # sweeps store no delay series; then only the numbers are shown
+    for sample in zip(*result.series):
+        plot_history.append(*sample)
+    refresh_plot()
+    return True
+
+# store the result of a live run, with its full delay series as headless runs store it
+def store_result():
+    if simulation.sim_time > cache_max_time:
+        return
+    result_cache.put(cache_key, simulation.result())
+
 def reset_sim():
     global sim_running
 
     sim_running = False
+    stop_recording()
+    close_replay()
 
-    # Reset distances
-    global base_shadow_distance, late_shadow_distance
-    base_shadow_distance = 0  # Will be recalculated in start_sim
-    late_shadow_distance = 0
-
-    # Reset clocks
-    global base_shadow_clock_time, late_shadow_clock_time, sim_time
-    sim_time = 0
-    base_shadow_clock_time = 0
-    late_shadow_clock_time = 0
-
-    # Reset timers
-    global actual_time, scheduled_time, late_shadow_time, base_shadow_time
-    actual_time = 0
-    scheduled_time = 0
-    late_shadow_time = 0
+    # Reset distances, clocks and timers
+    simulation.reset()
 
     selected_path.clear()
 
@@ -421,28 +646,10 @@ def reset_sim():
 
     late_bus.reset()
     controller.reset()
-
-    global line_tsp, line_shadow
+    draw_frame()
 
     # Reset plot
-
-    plot_times.clear()
-    plot_delay_tsp.clear()
-    plot_delay_shadow.clear()
-    ax.cla()
-    ax.set_xlabel("Simulation Time (s)", fontweight="bold", fontfamily="Arial", fontsize=12, labelpad=10)
-    ax.set_ylabel("Delay (s)", fontweight="bold", fontfamily="Arial", fontsize=12)
-    ax.set_title("Delay Recovery", fontweight="bold", fontfamily="Arial", fontsize=12)
-    line_tsp, = ax.plot([], [], label="With TSP", color="blue")
-    line_shadow, = ax.plot([], [], label="Without TSP", color="red")
-    ax.legend()
-    ax.legend()
-    ax.spines["top"].set_visible(False)
-    ax.spines["right"].set_visible(False)
-    ax.yaxis.set_major_formatter(matplotlib.ticker.FormatStrFormatter('%.2f'))
-    ax.xaxis.set_major_formatter(matplotlib.ticker.FormatStrFormatter('%.2f'))
-    fig.tight_layout()
-    plot_canvas.draw()
+    reset_plot()
 
     recovery_time_var.set("0.00")
     current_tsp.set("0.00")
@@ -450,80 +657,87 @@ def reset_sim():
     current_shadow.set("0.00")
     recovered_shadow.set("0.00")
 
+def show_delays():
+    current_tsp.set(f"{simulation.current_delay:.2f}")
+    recovered_tsp.set(f"{simulation.recovered_delay:.2f}")
+
+    current_shadow.set(f"{simulation.current_shadow_delay:.2f}")
+    recovered_shadow.set(f"{simulation.recovered_shadow_delay:.2f}")
+
 # Loop simulation
+# each frame runs one or more model ticks, then redraws once
 def sim_loop():
 
     if not sim_running:
         return
 
-    controller.tick(sim_tick)
-    late_bus.move()
-
-    if late_bus.active:
-        global sim_time
-        global base_shadow_clock_time
-        global late_shadow_clock_time
-        global base_shadow_distance
-        global late_shadow_distance
-        global actual_time
-        global scheduled_time
-        global late_shadow_time
-        global display_counter
-
-        sim_time += sim_tick
-        base_shadow_clock_time += sim_tick
-        late_shadow_clock_time += sim_tick
-
-        baseline_approach = late_bus.get_approach_at_distance(base_shadow_distance)
-        baseline_red = controller.would_be_red_without_tsp(baseline_approach, base_shadow_clock_time)
-        base_shadow_distance += late_bus.get_shadow_speed(base_shadow_distance, baseline_red)
-
-        late_shadow_approach = late_bus.get_approach_at_distance(late_shadow_distance)
-        shadow_red = controller.would_be_red_without_tsp(late_shadow_approach, late_shadow_clock_time)
-        late_shadow_distance += late_bus.get_shadow_speed(late_shadow_distance, shadow_red)
-
-        actual_time = late_bus.distance_travelled / late_bus.go_speed * dt
-        scheduled_time = base_shadow_distance / late_bus.go_speed * dt
-        late_shadow_time = late_shadow_distance / late_bus.go_speed * dt
-
-        current_delay = max(0, scheduled_time - actual_time)
-        current_shadow_delay = max(0, scheduled_time - late_shadow_time)
-
-        recovered_delay = max(0, initial_delay_sec - current_delay)
-        recovered_shadow_delay = max(0, initial_delay_sec - current_shadow_delay)
-
-        display_counter += 1
-
-        if late_bus.is_late and display_counter % 5 == 0:
-            plot_times.append(sim_time/1000)
-            plot_delay_tsp.append(current_delay)
-            plot_delay_shadow.append(current_shadow_delay)
-
-            line_tsp.set_data(plot_times, plot_delay_tsp)
-            line_shadow.set_data(plot_times, plot_delay_shadow)
-            ax.relim()
-            ax.autoscale_view()
-            plot_canvas.draw()
-
-        if late_bus.is_late and current_delay == 0:
-            late_bus.is_late = False
-            recovery_time_var.set(f"{sim_time/1000:.2f}")
-
-            current_tsp.set(f"{current_delay:.2f}")
-            recovered_tsp.set(f"{recovered_delay:.2f}")
-
-            current_shadow.set(f"{current_shadow_delay:.2f}")
-            recovered_shadow.set(f"{recovered_shadow_delay:.2f}")
-
-        if late_bus.is_late and display_counter % 10 == 0:
-            recovery_time_var.set(f"{sim_time/1000:.2f}")
-
-            current_tsp.set(f"{current_delay:.2f}")
-            recovered_tsp.set(f"{recovered_delay:.2f}")
-
-            current_shadow.set(f"{current_shadow_delay:.2f}")
-            recovered_shadow.set(f"{recovered_shadow_delay:.2f}")
-
+    global display_counter, frame_due
+
+    profiling = simulation.profiler is not None
+    if profiling:
+        now = time.perf_counter()
+        profiler.begin_frame(max(0.0, now - frame_due))
+
+    steps = speed_options[selected_speed.get()]
+    deadline = time.perf_counter() + max_frame_time
+
+    new_samples = False # plot samples taken during this frame
+    refresh = False     # results table due for a refresh
+    recovered = False   # the late bus recovered during this frame
+
+    ticks = 0
+    while True:
+        was_late = late_bus.is_late
+
+        simulation.step()
+        ticks += 1
+
+        if late_bus.active:
+            display_counter += 1
+
+            # sample every 5 ticks whatever the speed, so the plot matches real-time playback
+            if was_late and display_counter % 5 == 0:
+                plot_history.append(simulation.sim_time/1000, simulation.current_delay, simulation.current_shadow_delay)
+                new_samples = True
+
+            if simulation.just_recovered:
+                recovered = True
+                break # show the recovery point
+
+            if late_bus.is_late and display_counter % 10 == 0:
+                refresh = True
+
+        if steps is None:
+            if time.perf_counter() >= deadline:
+                break
+        elif ticks >= steps:
+            break
+
+    t = time.perf_counter()
+    draw_frame()
+    if profiling:
+        t = profiler.lap("draw", t)
+
+    if new_samples:
+        refresh_plot()
+    if profiling:
+        t = profiler.lap("plot", t)
+
+    if recovered or refresh:
+        recovery_time_var.set(f"{simulation.sim_time/1000:.2f}")
+        show_delays()
+    if recovered:
+        store_result()
+    if profiling:
+        profiler.lap("labels", t)
+        profiler.end_frame(ticks)
+        timing_overlay.end_frame()
+
+    # after fast-forwarding to the recovery point, carry on in real time
+    if recovered and steps is None:
+        selected_speed.set("1x")
+
+    frame_due = time.perf_counter() + sim_tick / 1000
     screen.ontimer(sim_loop, sim_tick)
 
 # Buttons
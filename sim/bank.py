@@ -0,0 +1,171 @@
+import numpy as np
+
+from sim.network import Network
+from sim.signal_model import Phase
+
+GREEN = 0
+YELLOW = 1
+NS = 0
+EW = 1
+
+colors = ("green", "yellow")
+
+
+# SignalModel for many intersections (or scenarios) at once: the timing and state of controller i
+# are element i of each array, and tick advances all of them together with the same rules.
+class ControllerBank:
+    def __init__(self, green_time, yellow_time, extension_time, offset=0):
+        self.green, self.yellow, self.extension, self.offset = (
+            a.astype(float) for a in np.broadcast_arrays(green_time, yellow_time, extension_time, offset))
+        self.n = self.green.size
+        self.extend_below = self.yellow + 200   # extensions are granted with less than this left
+
+        self.phase = np.full(self.n, NS, dtype=np.int8)
+        self.state = np.full(self.n, GREEN, dtype=np.int8)
+        self.remaining = self.green.copy()
+        self.time_debt = np.zeros(self.n)
+        self.extension_granted = np.zeros(self.n)
+        self.priority_requested = np.zeros(self.n, dtype=bool)
+        self.extension_used = np.zeros(self.n, dtype=bool)
+
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self.remaining = self.green.copy()
+        if self.offset.any():
+            self.seek(self.offset)
+
+    # SignalModel.seek for every controller
+    def seek(self, time):
+        phase_length = self.green + self.yellow
+        t = np.asarray(time) % (phase_length * 2)
+
+        self.phase = np.where(t < phase_length, NS, EW).astype(np.int8)
+        t = t % phase_length
+        green = t < self.green
+        self.state = np.where(green, GREEN, YELLOW).astype(np.int8)
+        self.remaining = np.where(green, self.green - t, phase_length - t)
+
+    def reset(self):
+        self.running = False
+        self.phase[:] = NS
+        self.state[:] = GREEN
+        self.priority_requested[:] = False
+        self.extension_used[:] = False
+        self.remaining = self.green.copy()
+        self.time_debt[:] = 0
+        self.extension_granted[:] = 0
+
+    # SignalModel.tick for every controller
+    def tick(self, dt):
+        if not self.running:
+            return
+
+        remaining = self.remaining
+        in_phase = remaining > 0
+
+        # extensions: priority requested, not yet used this phase, and less than yellow_time + 200 ms left
+        grant = in_phase & self.priority_requested & ~self.extension_used & (remaining < self.extend_below)
+        if grant.any():
+            remaining[grant] += self.extension[grant]
+            self.time_debt[grant] += self.extension[grant]
+            self.extension_granted[grant] += self.extension[grant]
+            self.extension_used |= grant
+
+        np.subtract(remaining, dt, out=remaining, where=in_phase)
+
+        expired = ~in_phase
+        if not expired.any():
+            return
+
+        # green expires into yellow
+        green = self.state == GREEN
+        to_yellow = expired & green
+        self.state[to_yellow] = YELLOW
+        remaining[to_yellow] = self.yellow[to_yellow]
+
+        # yellow expires into the other phase, with the time debt recovery capped at 20 % of green
+        swap = expired & ~green
+        if swap.any():
+            reduction = np.minimum(self.time_debt[swap], self.green[swap] * 0.2)
+            self.phase[swap] ^= 1
+            self.state[swap] = GREEN
+            self.priority_requested[swap] = False
+            self.extension_used[swap] = False
+            remaining[swap] = self.green[swap] - reduction
+            self.time_debt[swap] -= reduction
+
+    # color shown to an approach of the given phase (NS or EW) at controller i
+    def get_color(self, i, phase):
+        if self.phase[i] != phase:
+            return "red"
+        return colors[self.state[i]]
+
+    # requests are accepted during GREEN on the active phase
+    def accepts_priority(self, i, phase):
+        return self.state[i] == GREEN and self.phase[i] == phase
+
+    def request_priority(self, i, phase):
+        if self.accepts_priority(i, phase):
+            self.priority_requested[i] = True
+            return True
+        return False
+
+
+# Network whose intersections are stepped as one ControllerBank.
+# Timing plans and offsets are set on the SignalModels as usual and copied into the bank on start;
+# natural green windows (for the shadows) are still read from the SignalModels.
+class BankNetwork(Network):
+    def __init__(self, geometry, green_time=1200, yellow_time=500, extension_time=700, offsets=None):
+        super().__init__(geometry, green_time, yellow_time, extension_time, offsets)
+
+        nodes = list(self.controllers)
+        index = {node: i for i, node in enumerate(nodes)}
+        self.nodes = nodes
+        self.index_of = {}                # stopline key -> (controller index, phase)
+        for node in nodes:
+            for key in geometry.approaches[node]:
+                phase = NS if geometry.stopline_geometry[key].phase == Phase.NS else EW
+                self.index_of[key] = (index[node], phase)
+        self.controller_bank = self.make_bank()
+
+    def make_bank(self):
+        controllers = [self.controllers[node] for node in self.nodes]
+        if any(c.plan is not None for c in controllers):
+            raise ValueError("the controller bank only runs two-phase timings; use Network for timing plans")
+        return ControllerBank(
+            [c.green_time for c in controllers],
+            [c.yellow_time for c in controllers],
+            [c.extension_time for c in controllers],
+            [c.offset for c in controllers],
+        )
+
+    def start(self):
+        self.controller_bank = self.make_bank()
+        self.controller_bank.start()
+
+    def reset(self):
+        self.controller_bank.reset()
+
+    def tick(self, dt):
+        self.controller_bank.tick(dt)
+
+    @property
+    def time_debt(self):
+        return float(self.controller_bank.time_debt.sum())
+
+    @property
+    def extension_granted(self):
+        return float(self.controller_bank.extension_granted.sum())
+
+    def get_color(self, approach):
+        return self.controller_bank.get_color(*self.index_of[approach])
+
+    def request_priority(self, approach):
+        index = self.index_of.get(approach)
+        return index is not None and self.controller_bank.request_priority(*index)
+
+    def accepts_priority(self, approach):
+        index = self.index_of.get(approach)
+        return index is not None and self.controller_bank.accepts_priority(*index)
@@ -0,0 +1,252 @@
+from collections import namedtuple
+
+import numpy as np
+
+from sim.bank import EW, GREEN, NS, ControllerBank
+from sim.bus_model import BusModel
+from sim.geometry import MapGeometry
+from sim.signal_model import Phase, SignalModel
+
+# Outcome of a batch run, one entry (column) per scenario.
+# recovery_time is NaN where the late bus did not recover within max_time.
+# The delay series are sampled like the live plot and are NaN once a scenario has recovered.
+BatchResult = namedtuple("BatchResult", [
+    "green_time",
+    "yellow_time",
+    "extension_time",
+    "delay",
+    "recovery_time",   # s
+    "delay_tsp",       # s, delay of the late bus (with TSP) when the run ended
+    "delay_shadow",    # s, delay of the late shadow (without TSP) when the run ended
+    "time_debt",       # ms of green still owed by each controller when the run ended
+    "extension_granted",  # ms of extension granted by each controller during the run
+    "times",           # s, sample times (rows of the series)
+    "series_tsp",      # samples x scenarios
+    "series_shadow",   # samples x scenarios
+])
+
+# every combination of the given timings, flattened into one array per parameter
+def timing_grid(green_times, yellow_times, extension_times, delays):
+    grids = np.meshgrid(green_times, yellow_times, extension_times, delays, indexing="ij")
+    return tuple(g.ravel() for g in grids)
+
+
+class Batch:
+    def __init__(self, nodes, lane, green_time, yellow_time, extension_time, delay, tick=20, geometry=None):
+        geometry = geometry or MapGeometry()
+        self.tick = tick
+        self.dt = tick / 1000
+
+        # scenario parameters, one lane of each array per scenario
+        self.green = np.asarray(green_time, dtype=float)
+        self.yellow = np.asarray(yellow_time, dtype=float)
+        self.extension = np.asarray(extension_time, dtype=float)
+        self.delay = np.asarray(delay, dtype=float)
+        self.green, self.yellow, self.extension, self.delay = np.broadcast_arrays(
+            self.green, self.yellow, self.extension, self.delay)
+        n = self.green.size
+
+        # route geometry shared by every scenario, taken from a scalar bus
+        controller = SignalModel(geometry.stopline_geometry)
+        g = geometry.grid[lane]
+        bus = BusModel(controller, geometry, lane=lane, path=[g[k] for k in nodes], is_late=True)
+        self.go_speed = bus.go_speed
+        self.slow_speed = bus.slow_speed
+        self.stop_zone = bus.stop_zone
+        self.slow_zone = bus.slow_zone
+
+        keys = list(geometry.stopline_geometry)
+        ids = {key: i for i, key in enumerate(keys)}
+        self.stop_x = np.array([geometry.stopline_geometry[k].x for k in keys], dtype=float)
+        self.stop_y = np.array([geometry.stopline_geometry[k].y for k in keys], dtype=float)
+        self.stop_phase = np.array([NS if controller.approach_phase(k) == Phase.NS else EW for k in keys])
+
+        path = bus.path
+        self.n_legs = len(path)
+        self.node_x = np.array([p[0] for p in path], dtype=float)
+        self.node_y = np.array([p[1] for p in path], dtype=float)
+
+        # stoplines on each leg, padded to the longest leg
+        width = max(1, max(len(leg) for leg in bus.approaches))
+        self.leg_stops = np.zeros((self.n_legs, width), dtype=int)
+        self.leg_n_stops = np.zeros(self.n_legs, dtype=int)
+        for i, leg in enumerate(bus.approaches):
+            self.leg_n_stops[i] = len(leg)
+            self.leg_stops[i, :len(leg)] = [ids[k] for k in leg]
+
+        # route index for the shadow buses
+        route = bus.route
+        self.leg_starts = np.array(route.leg_starts, dtype=float)
+        self.loop_length = route.loop_length
+        self.leg_approach = np.array([-1 if k is None else ids[k] for k in route.leg_approach])
+        self.leg_has_approach = self.leg_approach >= 0
+        self.leg_stop_offset = np.array(
+            [0.0 if k is None else route.stopline_offsets[k] for k in route.leg_approach], dtype=float)
+        self.leg_phase = np.where(self.leg_has_approach, self.stop_phase[np.maximum(self.leg_approach, 0)], NS)
+
+        # one controller per scenario
+        self.controllers = ControllerBank(self.green, self.yellow, self.extension)
+        self.controllers.start()
+
+        # bus state
+        self.leg = np.zeros(n, dtype=int)
+        self.stop_index = np.zeros(n, dtype=int)
+        self.x = np.full(n, self.node_x[0])
+        self.y = np.full(n, self.node_y[0])
+        self.distance_travelled = np.zeros(n)
+        self.bus_priority = np.zeros(n, dtype=bool)
+        self.is_late = np.ones(n, dtype=bool)
+
+        # shadow buses
+        self.base_shadow_distance = self.delay / tick * self.go_speed
+        self.late_shadow_distance = np.zeros(n)
+
+        self.sim_time = 0
+        self.ticks = 0
+        self.recovery_time = np.full(n, np.nan)
+        self.current_delay = self.delay / 1000.0
+        self.current_shadow_delay = self.delay / 1000.0
+
+    # Bus.move for every scenario
+    def move_buses(self):
+        go = self.go_speed
+        x, y = self.x, self.y
+
+        target = (self.leg + 1) % self.n_legs
+        tx = self.node_x[target]
+        ty = self.node_y[target]
+
+        n_stops = self.leg_n_stops[self.leg]
+        has_stop = n_stops > 0
+        stop = self.leg_stops[self.leg, self.stop_index]
+        sx = np.where(has_stop, self.stop_x[stop], tx)
+        sy = np.where(has_stop, self.stop_y[stop], ty)
+
+        # a stopline shows red or yellow unless its phase is active and green
+        stop_phase = self.stop_phase[stop]
+        controllers = self.controllers
+        holding = has_stop & ~((stop_phase == controllers.phase) & (controllers.state == GREEN))
+
+        horizontal = np.abs(tx - x) >= go
+        dist = np.where(
+            horizontal,
+            (sx - x) * np.where(tx > x, 1, -1),
+            (sy - y) * np.where(ty > y, 1, -1),
+        )
+
+        step = np.where(
+            dist <= 0, go,
+            np.where(holding & (dist <= self.stop_zone), 0,
+                     np.where(holding & (dist <= self.slow_zone), self.slow_speed, go)))
+
+        # advance to the next stopline once the current one is cleared
+        cleared = has_stop & (dist < 0) & (self.stop_index < n_stops - 1)
+        self.stop_index = self.stop_index + cleared
+
+        # priority requests are granted during GREEN on the active phase
+        request = self.is_late & ~self.bus_priority & (self.stop_zone < dist) & (dist < self.slow_zone) & has_stop
+        granted = request & (controllers.state == GREEN) & (stop_phase == controllers.phase)
+        controllers.priority_requested |= granted
+        self.bus_priority |= granted
+
+        # snap to the target node when close enough, otherwise drive
+        dx = tx - x
+        dy = ty - y
+        snap = np.sqrt(dx ** 2 + dy ** 2) < go
+
+        self.leg = np.where(snap, target, self.leg)
+        self.stop_index = np.where(snap, 0, self.stop_index)
+        self.bus_priority &= ~snap
+
+        step = np.where(snap, 0, step)
+        self.distance_travelled = self.distance_travelled + step
+        along_x = np.abs(dx) >= go
+        self.x = np.where(snap, tx, np.where(along_x, x + np.where(dx > 0, step, -step), x))
+        self.y = np.where(snap, ty, np.where(along_x, y, y + np.where(dy > 0, step, -step)))
+
+    # Bus.get_shadow_speed with SignalController.would_be_red_without_tsp for every scenario
+    def shadow_speed(self, distance, time):
+        loop_length = self.loop_length
+        leg = np.searchsorted(self.leg_starts, distance % loop_length, side="right") - 1
+
+        # natural green window of the leg's first approach
+        phase_length = self.green + self.yellow
+        start = np.where(self.leg_phase[leg] == NS, 0, phase_length)
+        red = self.leg_has_approach[leg] & ((time - start) % (phase_length * 2) >= self.green)
+
+        stopline = (distance // loop_length) * loop_length + self.leg_stop_offset[leg]
+        dist = stopline - distance
+
+        return np.where(
+            ~red, self.go_speed,
+            np.where(dist <= self.stop_zone, 0,
+                     np.where(dist <= self.slow_zone,
+                              np.minimum(self.slow_speed, dist - self.stop_zone),
+                              np.minimum(self.go_speed, dist - self.stop_zone))))
+
+    def step(self):
+        self.controllers.tick(self.tick)
+        self.move_buses()
+
+        self.sim_time += self.tick
+        self.ticks += 1
+
+        self.base_shadow_distance = self.base_shadow_distance + self.shadow_speed(self.base_shadow_distance, self.sim_time)
+        self.late_shadow_distance = self.late_shadow_distance + self.shadow_speed(self.late_shadow_distance, self.sim_time)
+
+        go, dt = self.go_speed, self.dt
+        actual_time = self.distance_travelled / go * dt
+        scheduled_time = self.base_shadow_distance / go * dt
+        late_shadow_time = self.late_shadow_distance / go * dt
+
+        self.current_delay = np.maximum(0, scheduled_time - actual_time)
+        self.current_shadow_delay = np.maximum(0, scheduled_time - late_shadow_time)
+
+    # step until every late bus recovers its delay or max_time (ms) elapses
+    def run(self, max_time=600000, sample_every=5, record=True):
+        times, series_tsp, series_shadow = [], [], []
+        final_tsp = self.current_delay
+        final_shadow = self.current_shadow_delay
+        final_debt = self.controllers.time_debt.copy()
+        final_granted = self.controllers.extension_granted.copy()
+
+        while self.is_late.any() and self.sim_time < max_time:
+            was_late = self.is_late
+            self.step()
+
+            if record and self.ticks % sample_every == 0:
+                times.append(self.sim_time / 1000)
+                series_tsp.append(np.where(was_late, self.current_delay, np.nan))
+                series_shadow.append(np.where(was_late, self.current_shadow_delay, np.nan))
+
+            # results freeze at the tick each scenario recovers
+            final_tsp = np.where(was_late, self.current_delay, final_tsp)
+            final_shadow = np.where(was_late, self.current_shadow_delay, final_shadow)
+            final_debt = np.where(was_late, self.controllers.time_debt, final_debt)
+            final_granted = np.where(was_late, self.controllers.extension_granted, final_granted)
+
+            recovered = self.is_late & (self.current_delay == 0)
+            self.recovery_time = np.where(recovered, self.sim_time / 1000, self.recovery_time)
+            self.is_late = self.is_late & ~recovered
+
+        n = self.green.size
+        return BatchResult(
+            green_time=self.green,
+            yellow_time=self.yellow,
+            extension_time=self.extension,
+            delay=self.delay,
+            recovery_time=self.recovery_time,
+            delay_tsp=final_tsp,
+            delay_shadow=final_shadow,
+            time_debt=final_debt,
+            extension_granted=final_granted,
+            times=np.array(times),
+            series_tsp=np.array(series_tsp).reshape(len(times), n),
+            series_shadow=np.array(series_shadow).reshape(len(times), n),
+        )
+
+
+# run every (green, yellow, extension, delay) scenario for one route together
+def run_batch(nodes, lane="R", green_time=1200, yellow_time=500, extension_time=700, delay=5000,
+              max_time=600000, record=True):
+    return Batch(nodes, lane, green_time, yellow_time, extension_time, delay).run(max_time, record=record)
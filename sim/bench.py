@@ -0,0 +1,272 @@
+# Micro and macro benchmarks of the headless simulation:
+#
+#     python -m sim.bench -o bench.json
+#     python -m sim.bench -o new.json --compare bench.json --threshold 0.2
+#
+# Each benchmark is timed several times and its best time per operation is kept; results are written
+# as JSON so runs can be compared across commits. With --compare, benchmarks more than --threshold
+# slower than the baseline are reported as regressions and the exit status is 1.
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+
+from sim.bus_model import BusModel
+from sim.engine import run_scenario
+from sim.fleet import Fleet, build_fleet
+from sim.geometry import MapGeometry, valid_paths
+from sim.network import grid_network
+from sim import shadow
+from sim.signal_model import SignalModel
+from sim.sweep import run_chunk
+
+benchmarks = {}     # name -> (kind, setup); setup returns (run, ops): run() performs ops operations
+
+
+def benchmark(name, kind="micro"):
+    def register(setup):
+        benchmarks[name] = (kind, setup)
+        return setup
+    return register
+
+
+def make_bus(path=(7, 8, 9, 6), lane="R"):
+    geometry = MapGeometry()
+    controller = SignalModel(geometry.stopline_geometry)
+    controller.green_time, controller.yellow_time, controller.extension_time = 1200, 500, 700
+    g = geometry.grid[lane]
+    bus = BusModel(controller, geometry, lane=lane, path=[g[n] for n in path], is_late=True)
+    controller.start()
+    return bus, controller
+
+
+# micro: the per-tick hot paths
+
+# the signals keep cycling, so the bus drives, slows and waits at red as in a run
+# (includes one controller tick per move)
+@benchmark("bus_move")
+def bench_bus_move():
+    bus, controller = make_bus()
+
+    def run():
+        for _ in range(10000):
+            controller.tick(20)
+            bus.move()
+    return run, 10000
+
+
+@benchmark("controller_tick")
+def bench_controller_tick():
+    _, controller = make_bus()
+    controller.priority_requested = True
+
+    def run():
+        for _ in range(10000):
+            controller.tick(20)
+    return run, 10000
+
+
+@benchmark("would_be_red_without_tsp")
+def bench_would_be_red():
+    _, controller = make_bus()
+    keys = list(controller.stoplines) * 50
+
+    def run():
+        t = 0
+        for key in keys:
+            controller.would_be_red_without_tsp(key, t)
+            t += 20
+    return run, len(keys)
+
+
+@benchmark("get_shadow_speed")
+def bench_shadow_speed():
+    bus, _ = make_bus()
+    distances = [d * 0.5 for d in range(int(bus.route.loop_length * 2))]
+
+    def run():
+        for i, d in enumerate(distances):
+            bus.get_shadow_speed(d, i & 1)
+    return run, len(distances)
+
+
+@benchmark("get_approach_at_distance")
+def bench_approach_at_distance():
+    bus, _ = make_bus()
+    distances = [d * 0.5 for d in range(int(bus.route.loop_length * 2))]
+
+    def run():
+        for d in distances:
+            bus.get_approach_at_distance(d)
+    return run, len(distances)
+
+
+@benchmark("infer_approaches")
+def bench_infer_approaches():
+    bus, _ = make_bus()
+
+    def run():
+        for _ in range(1000):
+            bus.infer_approaches()
+    return run, 1000
+
+
+# macro: end-to-end headless runs (one op = one run); each run starts with an empty shadow cache,
+# as a fresh process would, so the warm-up in measure() does not leave the trajectories cached
+
+@benchmark("scenario", "macro")
+def bench_scenario():
+    def run():
+        shadow._cache.clear()
+        run_scenario([7, 8, 9, 6], "R", 1200, 500, 700, 15000)
+    return run, 1
+
+
+@benchmark("scenario_tick", "macro")
+def bench_scenario_tick():
+    def run():
+        shadow._cache.clear()
+        run_scenario([7, 8, 9, 6], "R", 1200, 500, 700, 15000, engine="tick")
+    return run, 1
+
+
+@benchmark("fleet_100", "macro")
+def bench_fleet():
+    def run():
+        shadow._cache.clear()
+        fleet = build_fleet(1200, 500, 700)
+        fleet.add_route([7, 8, 9, 6], "R", count=50, headway=10000, delay=8000)
+        fleet.add_route([1, 2, 3, 6], "L", count=50, headway=10000, delay=8000)
+        fleet.start()
+        fleet.run(max_time=120000)
+    return run, 1
+
+
+@benchmark("network_20x20", "macro")
+def bench_network():
+    def run():
+        shadow._cache.clear()
+        network = grid_network(20, 20)
+        fleet = Fleet(network, network.geometry)
+        for r in range(0, 20, 4):
+            fleet.add_route([r * 20 + 1, r * 20 + 2, r * 20 + 3, r * 20 + 4], "R", count=4, headway=20000, delay=8000)
+        fleet.start()
+        fleet.run(max_time=60000)
+    return run, 1
+
+
+@benchmark("sweep_chunk", "macro")
+def bench_sweep():
+    paths = valid_paths()[:8]
+    timings = [(g, 500, e, 8000) for g in (600, 1200, 2400) for e in (0, 700)]
+
+    def run():
+        shadow._cache.clear()
+        for path in paths:
+            run_chunk((path, "R", timings), 600000, "scalar")
+    return run, 1
+
+
+# best and median seconds per operation over repeat timings;
+# each timing calls run as many times as it takes to last at least min_time seconds
+def measure(setup, repeat, min_time=0.2):
+    run, ops = setup()
+
+    loops = 1
+    while True:     # also warms up caches
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        if time.perf_counter() - start >= min_time:
+            break
+        loops *= 2
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        times.append((time.perf_counter() - start) / (loops * ops))
+    times.sort()
+    return {"best": times[0], "median": times[len(times) // 2], "ops": loops * ops, "repeat": repeat}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(names, repeat, stream=sys.stderr):
+    results = {}
+    for name in names:
+        kind, setup = benchmarks[name]
+        results[name] = dict(kind=kind, **measure(setup, repeat))
+        stream.write(f"{name:<28} {format_time(results[name]['best'])}\n")
+        stream.flush()
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+# (name, baseline, new, ratio) for each benchmark in both runs; ratio > 1 + threshold is a regression
+def compare(baseline, new, threshold, stream=sys.stdout):
+    regressions = []
+    stream.write(f"{'benchmark':<28} {'baseline':>10} {'new':>10}  change\n")
+    for name, result in new["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        ratio = result["best"] / old["best"]
+        flag = "  SLOWER" if ratio > 1 + threshold else ""
+        stream.write(f"{name:<28} {format_time(old['best']):>10} {format_time(result['best']):>10}  "
+                     f"{(ratio - 1) * 100:+.1f}%{flag}\n")
+        if flag:
+            regressions.append((name, old["best"], result["best"], ratio))
+    return regressions
+
+
+def format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.1f} ns"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the headless simulation.")
+    parser.add_argument("-o", "--output", default="bench.json", help="JSON file to write")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown flagged as a regression (0.2 = 20%%)")
+    parser.add_argument("--repeat", type=int, default=5, help="timings per benchmark")
+    parser.add_argument("--kind", choices=("micro", "macro"), help="run only micro or macro benchmarks")
+    parser.add_argument("-k", "--filter", default="", help="run only benchmarks whose name contains this")
+    args = parser.parse_args(argv)
+
+    names = [name for name, (kind, _) in benchmarks.items()
+             if args.filter in name and (args.kind is None or kind == args.kind)]
+    results = run_benchmarks(names, args.repeat)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            sys.stderr.write(f"{len(regressions)} benchmark(s) slower than the baseline by more than "
+                             f"{args.threshold:.0%}\n")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
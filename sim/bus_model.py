@@ -0,0 +1,294 @@
+from sim.route import RouteIndex
+
+
+class BusModel:
+    def __init__(self, controller, map, lane="R", path=None, is_late=False, delay=0):
+        self.controller = controller
+
+        # World Geometry
+        self.w = map.world                                # half-size of world
+        self.m = map.inner_margin                         # map edge
+        self.rw = map.road_width                          # road width
+        self.h = map.rw / 2                               # width of one lane = 0.5 * road_width
+        self.inner = self.m - self.rw                     # "concrete" block edge
+        self.ring_mid = self.inner + self.h               # centre lane of ring road
+        self.ring_outer_lane = self.ring_mid + self.h / 2 # outer lane of ring road (lane on map edge)
+        self.ring_inner_lane = self.ring_mid - self.h / 2 # inner lane of ring road (lane on city block edge)
+
+        # Ring road nodes in clockwise order (used to close the loop)
+        self.ring_nodes = map.ring_nodes
+
+        # Stopline geometry table and its index by road
+        self.stoplines = map.stopline_geometry
+        self.stopline_index = map.stopline_index
+
+        # Driving speeds
+        self.go_speed = 4
+        self.slow_speed = 1.5
+        self.step = self.go_speed
+
+        # Stopline tracking
+        self.current_leg_index = 0
+        self.current_stop_index = 0
+
+        # Priority
+        self.is_late = is_late
+        self.delay = delay              # lateness is simulated by "delay"
+        self.active = delay == 0        # the bus starts moving when delay == 0
+        self.priority_requested = False
+
+        # Zones
+        self.slow_zone = 60 # distance from the stopline at which te bus begins to slow
+        self.stop_zone = 20 # distance from the stopline at which the bus stops
+
+        # Map nodes for the specified lane
+        g = map.grid[lane] # the grid is as follows:
+                           # 1-2-3
+                           # | | |
+                           # 4-5-6
+                           # | | |
+                           # 7-8-9
+
+        # Bus position and heading
+        raw_path = path or [g[7], g[9], g[3], g[1]]
+        self.set_path(self.close_loop(raw_path, g))
+
+        self.distance_travelled = 0
+
+    # changing the path rebuilds the approaches and the route index
+    def set_path(self, path):
+        self.path = path                 # bus path
+        self.x, self.y = self.path[0]    # go to starting node (first node on path)
+        self.heading = 0
+        self.target_index = 1            # the first target node is the second node on the path
+
+        # Approaches/Stoplines on the defined path
+        self.approaches = self.infer_approaches()
+        self.current_leg_index = 0
+        self.current_stop_index = 0
+
+    def close_loop(self, path, grid):
+        # ring road nodes in clockwise order
+        ring = [grid[node] for node in self.ring_nodes]
+        n = len(ring)
+
+        # find the first and last ring nodes in the path
+        first_ring_node = next((p for p in path if p in ring), None)
+        last_ring_node = next((p for p in reversed(path) if p in ring), None)
+
+        # can't close the loop if no ring nodes are found
+        if last_ring_node is None or first_ring_node is None:
+            return path
+        # already closed if the path starts and ends on the same ring node
+        if last_ring_node == first_ring_node:
+            return path
+
+        # index of the last ring node in the ring (return journey starts here)
+        si = ring.index(last_ring_node)
+        # index of the first ring node in the ring (return journey ends here)
+        ei = ring.index(first_ring_node)
+
+        # extract only the ring nodes from the path, preserving order
+        ring_nodes_in_path = [p for p in path if p in ring]
+
+        # vote on direction by checking each consecutive ring node pair
+        cw_votes = 0
+        ccw_votes = 0
+        for i in range(len(ring_nodes_in_path)):  # include last node
+            i1 = ring.index(ring_nodes_in_path[i])
+            i2 = ring.index(ring_nodes_in_path[(i + 1) % len(ring_nodes_in_path)])  # wrap to first node
+            cw_steps = (i2 - i1) % n
+            ccw_steps = (i1 - i2) % n
+            if cw_steps <= ccw_steps:
+                cw_votes += 1
+            else:
+                ccw_votes += 1
+
+        # the majority vote determines the overall direction
+        going_cw = cw_votes >= ccw_votes
+
+        # build the return leg indices by stepping from si in the inferred direction
+        if going_cw:
+            indices = [(si + i) % n for i in range(1, n)] # step forward through ring
+        else:
+            indices = [(si - i) % n for i in range(1, n)] # step backward through ring
+
+        # convert indices back to coordinates
+        route = [ring[i] for i in indices]
+        if first_ring_node in route:
+            return_leg = route[:route.index(first_ring_node)]
+            return path + return_leg
+
+        return path # return original path if something went wrong
+
+    def infer_approaches(self):
+        path = self.path                       # bus path
+        approaches = []                        # empty list of approaches
+
+        for i in range(len(path)):             # for each node/path segment...
+            x1, y1 = path[i]                   # coordinates of the current node
+            x2, y2 = path[(i + 1) % len(path)] # coordinates of the next node
+                                               # modulo allows the path to wrap around (closed loop route)
+
+            # stoplines on this path segment that hold the bus's direction of travel, sorted by distance
+            leg_stops = self.stopline_index.on_segment(x1, y1, x2, y2)
+
+            # remove stoplines that are less than one road_width from the node
+            # effectively removes stoplines/approaches to the central node for the default path around ring road
+            chosen = [key for d, key in leg_stops if d > self.rw]
+
+            # store the approaches associated with this path segment
+            approaches.append(chosen)
+
+        # index leg offsets and stopline distances once, for the shadow bus lookups
+        self.route = RouteIndex(path, approaches, self.stoplines)
+
+        # return list of approaches for the full route
+        return approaches
+
+    # return stopline coordinates
+    def stop_point_for(self, key):
+        s = self.stoplines[key]
+        return s.x, s.y
+
+    # return current stopline on approach
+    def current_approach(self):
+        leg = self.approaches[self.current_leg_index]
+        return leg[self.current_stop_index] if leg else None
+
+    # return distance to stopline or target node
+    def dist_remaining(self, tx, ty, x, y, sx, sy):
+        if abs(tx - x) >= self.go_speed:
+            # return horizontal distance if bus heading is horizontal
+            return (sx - x) * (1 if tx > x else -1)
+        else:
+            # return vertical distance if bus heading is vertical
+            return (sy - y) * (1 if ty > y else -1)
+
+    # return bus speed
+    def decide_speed(self, color, dist):
+        # if already on stopline, clear the intersection
+        if dist <= 0:
+            return self.go_speed
+
+        # if within stop_zone and stopline is red or yellow, stop
+        elif color in ("red", "yellow") and dist <= self.stop_zone:
+            return 0
+
+        # if within slow_zone and stopline is red or yellow, slow down
+        elif color in ("red", "yellow") and dist <= self.slow_zone:
+            return self.slow_speed
+
+        # if green, go
+        else:
+            return self.go_speed
+
+    # ignore current stopline once cleared
+    def advance_stopline(self, approach, dist, leg):
+        if approach and dist < 0:                      # if the current stopline has been cleared
+            if self.current_stop_index < len(leg) - 1: # and there are more path segments to cover
+                self.current_stop_index += 1           # advance to the next stopline
+
+    def request_priority(self, approach, dist):
+        # conditions to request priority:
+        # 1. bus is late
+        # 2. bus has not already requested priority on this path segment
+        # 3. bus is within the request zone
+        if self.is_late and not self.priority_requested and self.stop_zone < dist < self.slow_zone:
+            if approach and self.controller.request_priority(approach):
+                self.priority_requested = True
+
+    def move(self):
+        # Count down to start
+        if not self.active:
+            self.delay -= 20        # lateness is simulated by "delay"
+            if self.delay <= 0:     # the bus starts moving when delay == 0
+                self.active = True
+            else:
+                return
+
+        tx, ty = self.path[self.target_index] # current target node
+        x, y = self.x, self.y                 # current bus position
+
+        leg = self.approaches[self.current_leg_index] # list of stoplines associated with this path segment
+        approach = self.current_approach()            # current stopline on approach
+
+        if approach:                                    # if there is a stopline on the current approach...
+            color = self.controller.get_color(approach) # get its color and position
+            sx, sy = self.stop_point_for(approach)
+        else:                                         # if there is no stopline on the current approach...
+            color = "green"                           # behave as though there is a green stoplight (go)
+            sx, sy = tx, ty                           # the target node becomes the stop point
+
+        dist = self.dist_remaining(tx, ty, x, y, sx, sy) # distance to stopline or target node
+        self.step = self.decide_speed(color, dist)
+        self.advance_stopline(approach, dist, leg)       # advance to next stopline once current one is cleared
+        self.request_priority(approach, dist)            # request priority if conditions are met
+
+        # Distance to target node
+        dx = tx - x
+        dy = ty - y
+
+        dist_to_target = (dx ** 2 + dy ** 2) ** 0.5
+
+        if dist_to_target < self.go_speed:                                               # if near the target node...
+            self.x, self.y = tx, ty                                                      # snap to fit
+            self.target_index = (self.target_index + 1) % len(self.path)                 # advance to next node
+            self.current_leg_index = (self.current_leg_index + 1) % len(self.approaches) # advance to next path segment
+            self.current_stop_index = 0                                                  # first stopline on new segment
+            self.priority_requested = False                                              # reset priority request for new segment
+            self.controller.clear_notice()
+            return
+
+        # set the travel direction and advance the bus
+        self.distance_travelled += self.step
+        if abs(dx) >= self.go_speed:
+            self.heading = 0 if dx > 0 else 180   # east or west
+            self.x += self.step if dx > 0 else -self.step
+        else:
+            self.heading = 90 if dy > 0 else 270  # north or south
+            self.y += self.step if dy > 0 else -self.step
+
+    def reset(self):
+        self.active = False
+        self.x, self.y = self.path[0]
+        self.target_index = 1
+        self.current_leg_index = 0
+        self.current_stop_index = 0
+        self.distance_travelled = 0
+        self.priority_requested = False
+        self.is_late=True
+
+    # Virtual Bus Functions
+
+    def get_approach_at_distance(self, total_dist):
+        return self.route.approach_at(total_dist)
+
+    def get_stopline_distance(self, key, total_dist=None):
+        return self.route.stopline_distance(key, total_dist)
+
+    def get_shadow_speed(self, shadow_distance, signal_red):
+        if not signal_red:
+            return self.go_speed
+
+        route = self.route
+        key = route.approach_at(shadow_distance)
+        if not key:
+            return self.go_speed
+
+        stopline_abs = route.stopline_distance(key, shadow_distance)
+        if stopline_abs is None:
+            return self.go_speed
+
+        dist_to_stop = stopline_abs - shadow_distance
+
+        if dist_to_stop <= 0:
+            return 0  # already at or past stopline while red — hold position
+        elif dist_to_stop <= self.stop_zone:
+            return 0
+        elif dist_to_stop <= self.slow_zone:
+            # clamp so we don't overshoot stop_zone in one tick
+            return min(self.slow_speed, dist_to_stop - self.stop_zone)
+        else:
+            # clamp so we don't overshoot slow_zone in one tick
+            return min(self.go_speed, dist_to_stop - self.stop_zone)
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from sim.engine import ENGINE_VERSION, Result
+
+# default location; TSP_CACHE overrides it
+default_path = os.environ.get("TSP_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "tsp-sim", "results.sqlite"))
+
+
+# hash of everything that determines a run's Result
+def fingerprint(nodes, lane, green_time, yellow_time, extension_time, delay, max_time=600000,
+                version=ENGINE_VERSION, plan=None):
+    key = json.dumps([list(nodes), lane, green_time, yellow_time, extension_time, delay, max_time, version,
+                      plan_key(plan)])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+# canonical form of a TimingPlan (None for the two-phase timing): its phases in order, each with its
+# approaches sorted, since the order they are listed in does not change the run
+def plan_key(plan):
+    if plan is None:
+        return None
+    return [[str(p.name), sorted(p.approaches), p.green, p.yellow, p.all_red] for p in plan.phases]
+
+
+# Results on disk, keyed by fingerprint. Once the stored results exceed max_bytes, the least
+# recently used are evicted.
+class ResultCache:
+    def __init__(self, path=default_path, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self.db.commit()
+
+    # the cached Result, or None; a hit counts as a use
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    # {key: Result} for the keys among these that are cached, read with their values (500 keys per
+    # query); the hits are marked used in one transaction
+    def get_many(self, keys):
+        found = {}
+        keys = list(keys)
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = self.db.execute(
+                f"SELECT key, value FROM results WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+            found.update((key, decode(value)) for key, value in rows)
+        if found:
+            now = time.time()
+            with self.db:
+                self.db.executemany("UPDATE results SET last_used = ? WHERE key = ?", ((now, k) for k in found))
+        return found
+
+    def put(self, key, result):
+        self.put_many([(key, result)])
+
+    # store (key, Result) pairs in one transaction, then evict down to max_bytes
+    def put_many(self, items):
+        now = time.time()
+        rows = []
+        for key, result in items:
+            value = encode(result)
+            rows.append((key, value, len(value), now))
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", rows)
+        self.evict()
+
+    def evict(self):
+        (total,) = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()
+        if total <= self.max_bytes:
+            return
+        doomed = []
+        for key, size in self.db.execute("SELECT key, size FROM results ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        with self.db:
+            self.db.executemany("DELETE FROM results WHERE key = ?", doomed)
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def clear(self):
+        with self.db:
+            self.db.execute("DELETE FROM results")
+
+    def close(self):
+        self.db.close()
+
+
+def encode(result):
+    return json.dumps(result._asdict())
+
+
+def decode(value):
+    fields = json.loads(value)
+    times, delay_tsp, delay_shadow = fields["series"] or ([], [], [])
+    fields["series"] = (times, delay_tsp, delay_shadow)
+    return Result(**fields)
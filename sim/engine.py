@@ -0,0 +1,571 @@
+from collections import namedtuple
+from time import perf_counter
+
+from sim.bus_model import BusModel
+from sim.events import EventScheduler
+from sim.geometry import MapGeometry
+from sim.recording import TrajectoryRecorder
+from sim.shadow import shadow_trajectory
+from sim.signal_model import SignalModel, SignalState
+
+# Bump when a change to the model changes results, so cached results (sim/cache.py) are not reused
+ENGINE_VERSION = 3
+
+# Outcome of a headless run. Times are in seconds, delays in seconds.
+# recovery_time is None if the late bus did not recover within max_time.
+Result = namedtuple("Result", [
+    "recovery_time",
+    "initial_delay",
+    "delay_tsp",          # delay of the late bus (with TSP) when the run ended
+    "delay_shadow",       # delay of the late shadow (without TSP) when the run ended
+    "recovered_tsp",
+    "recovered_shadow",
+    "time_debt",          # green time (ms) still owed by the controller when the run ended
+    "extension_granted",  # total extension time (ms) granted during the run, repaid or not
+    "series",             # (times, delay_tsp, delay_shadow) sampled like the live plot
+])
+
+
+class Simulation:
+    def __init__(self, controller, bus, tick=20, shadows="tick"):
+        self.controller = controller
+        self.bus = bus
+        self.tick = tick                 # ms per step
+        self.dt = tick / 1000
+
+        # "tick" steps the shadow buses every tick like the live GUI;
+        # "analytic" reads them off event-stepped trajectories (same distances, far cheaper)
+        self.shadows = shadows
+        self.base_trajectory = None
+        self.late_trajectory = None
+
+        self.sample_every = 5            # ticks between plot samples (as in the live plot)
+        self.record = False              # headless runs may keep the delay series
+        self.times = []
+        self.delay_tsp = []
+        self.delay_shadow = []
+
+        self.profiler = None             # a TickProfiler times the parts of each step when set
+        self.recorder = None             # a TrajectoryRecorder logs every step when set
+
+        self.reset(0)
+
+    def start(self, initial_delay):
+        self.reset(initial_delay)
+        self.bus.active = True
+        self.bus.priority_requested = False
+        self.controller.start()
+
+        if self.shadows == "analytic":
+            self.base_trajectory = shadow_trajectory(self.bus, self.controller, self.tick, self.base_shadow_distance)
+            self.late_trajectory = shadow_trajectory(self.bus, self.controller, self.tick, self.late_shadow_distance)
+
+    # clear the clocks, shadow distances and delays
+    def reset(self, initial_delay=0):
+        self.initial_delay = initial_delay
+        self.initial_delay_sec = initial_delay / 1000.0
+
+        # the baseline shadow starts as far ahead as it would have driven during the delay
+        self.base_shadow_distance = initial_delay / self.tick * self.bus.go_speed
+        self.late_shadow_distance = 0
+
+        # The baseline clock starts at 5.0s, the late buses start at 0.0s
+        self.sim_time = 0
+        self.base_shadow_clock_time = 0   # ms for controller
+        self.late_shadow_clock_time = 0   # ms for controller
+        self.ticks = 0
+
+        self.current_delay = self.initial_delay_sec
+        self.current_shadow_delay = self.initial_delay_sec
+        self.recovered_delay = 0
+        self.recovered_shadow_delay = 0
+        self.recovery_time = None        # ms
+        self.just_recovered = False
+
+        self.times.clear()
+        self.delay_tsp.clear()
+        self.delay_shadow.clear()
+
+        self.base_trajectory = None
+        self.late_trajectory = None
+
+    def step(self):
+        controller = self.controller
+        bus = self.bus
+        tick = self.tick
+        profiler = self.profiler
+        if profiler:
+            t = perf_counter()
+
+        controller.tick(tick)
+        if profiler:
+            t = profiler.lap("controller", t)
+        bus.move()
+        if profiler:
+            t = profiler.lap("bus", t)
+
+        self.just_recovered = False
+        if not bus.active:
+            return
+
+        self.sim_time += tick
+        self.base_shadow_clock_time += tick
+        self.late_shadow_clock_time += tick
+
+        if self.base_trajectory is not None:
+            self.base_shadow_distance = self.base_trajectory.distance_at(self.ticks + 1)
+            if profiler:
+                t = profiler.lap("base_shadow", t)
+            self.late_shadow_distance = self.late_trajectory.distance_at(self.ticks + 1)
+        else:
+            baseline_approach = bus.get_approach_at_distance(self.base_shadow_distance)
+            baseline_red = controller.would_be_red_without_tsp(baseline_approach, self.base_shadow_clock_time)
+            self.base_shadow_distance += bus.get_shadow_speed(self.base_shadow_distance, baseline_red)
+            if profiler:
+                t = profiler.lap("base_shadow", t)
+
+            late_shadow_approach = bus.get_approach_at_distance(self.late_shadow_distance)
+            shadow_red = controller.would_be_red_without_tsp(late_shadow_approach, self.late_shadow_clock_time)
+            self.late_shadow_distance += bus.get_shadow_speed(self.late_shadow_distance, shadow_red)
+        if profiler:
+            profiler.lap("late_shadow", t)
+
+        dt = self.dt
+        actual_time = bus.distance_travelled / bus.go_speed * dt
+        scheduled_time = self.base_shadow_distance / bus.go_speed * dt
+        late_shadow_time = self.late_shadow_distance / bus.go_speed * dt
+
+        self.current_delay = max(0, scheduled_time - actual_time)
+        self.current_shadow_delay = max(0, scheduled_time - late_shadow_time)
+
+        self.recovered_delay = max(0, self.initial_delay_sec - self.current_delay)
+        self.recovered_shadow_delay = max(0, self.initial_delay_sec - self.current_shadow_delay)
+
+        self.ticks += 1
+
+        if self.record and bus.is_late and self.ticks % self.sample_every == 0:
+            self.times.append(self.sim_time / 1000)
+            self.delay_tsp.append(self.current_delay)
+            self.delay_shadow.append(self.current_shadow_delay)
+
+        if bus.is_late and self.current_delay == 0:
+            bus.is_late = False
+            self.recovery_time = self.sim_time
+            self.just_recovered = True
+
+        if self.recorder:
+            self.recorder.record(self)
+
+    # step until the late bus recovers its delay or max_time (ms) elapses
+    def run(self, max_time=600000):
+        bus = self.bus
+        while bus.is_late and self.sim_time < max_time:
+            self.step()
+        return self.result()
+
+    def result(self):
+        return Result(
+            recovery_time=None if self.recovery_time is None else self.recovery_time / 1000,
+            initial_delay=self.initial_delay_sec,
+            delay_tsp=self.current_delay,
+            delay_shadow=self.current_shadow_delay,
+            recovered_tsp=self.recovered_delay,
+            recovered_shadow=self.recovered_shadow_delay,
+            time_debt=self.controller.time_debt,
+            extension_granted=self.controller.extension_granted,
+            series=(list(self.times), list(self.delay_tsp), list(self.delay_shadow)),
+        )
+
+
+# events at the same tick: the controller ticks before the bus moves
+CONTROLLER = 0
+BUS = 1
+
+
+# Same model as Simulation, driven by an event queue instead of stepping every tick.
+# Only ticks where something discrete can happen are simulated (phase expiries, extension grants,
+# the bus entering a zone, clearing a stopline or reaching a node, the end of its delay);
+# in between, the controller only counts down and the bus drives at constant speed, so those
+# stretches are skipped and the shadows are read off their analytic trajectories.
+# Results are identical to stepping the tick loop.
+# The events are planned from the countdown of a single SignalModel; a Network of controllers
+# runs on the tick loop (Simulation) or in a Fleet.
+class EventSimulation(Simulation):
+    def __init__(self, controller, bus, tick=20):
+        if not isinstance(controller, SignalModel):
+            raise TypeError(f"the event engine runs a single SignalModel, not {type(controller).__name__}; "
+                            "use Simulation (the tick engine) for a network")
+        self.scheduler = EventScheduler()
+        super().__init__(controller, bus, tick, shadows="analytic")
+
+    def start(self, initial_delay):
+        super().start(initial_delay)
+        self.offset = 0 if self.bus.active else None   # ticks before the bus started moving
+        self.phase_remaining = self.controller.remaining
+        self.plan_controller(0)
+        self.plan_bus(0)
+
+    def reset(self, initial_delay=0):
+        super().reset(initial_delay)
+        self.scheduler.clear()
+        self.now = 0                 # last tick simulated
+        self.offset = None
+
+        # controller countdown: remaining green/yellow time after tick phase_tick
+        self.phase_tick = 0
+        self.phase_remaining = self.controller.remaining
+        self.controller_event = None
+
+        # bus cruise: position, distance and speed after tick cruise_tick, constant until the next bus event
+        self.cruise_tick = 0
+        self.cruise = None
+        self.countdown = None        # delay left after cruise_tick while the bus waits to start
+        self.bus_event = None
+
+    # controller events: the next phase expiry or extension grant
+    def plan_controller(self, now):
+        controller = self.controller
+        tick = self.tick
+        self.scheduler.cancel(self.controller_event)
+        self.controller_event = None
+        if not controller.running:
+            return
+
+        start, remaining = self.phase_tick, self.phase_remaining
+
+        # the phase expires on the tick after its countdown reaches zero
+        k = first_tick_below(remaining, tick, 0, 0, inclusive=True)
+        expiry = start + k + 1
+
+        # an extension is granted on the first tick after now with less than yellow + 200 ms left
+        event = expiry
+        if (controller.priority_requested and not controller.extension_used
+                and controller.state != SignalState.ALL_RED):
+            j = first_tick_below(remaining, tick, controller.extension_level(), now - start, inclusive=False)
+            if start + j + 1 < expiry:
+                event = start + j + 1
+
+        self.controller_event = self.scheduler.schedule(event, self.tick_controller, CONTROLLER)
+
+    def tick_controller(self):
+        controller = self.controller
+        t = self.controller_event[0]
+
+        # count down to the tick before this one, then tick for real
+        self.settle_controller(t - 1)
+        controller.tick(self.tick)
+        self.phase_tick, self.phase_remaining = t, controller.remaining
+        self.plan_controller(t)
+
+        # the signal may have changed: the bus has to look again on this tick
+        self.settle_bus(t - 1)
+        self.scheduler.cancel(self.bus_event)
+        self.bus_event = self.scheduler.schedule(t, self.move_bus, BUS)
+
+    # bring the controller countdown up to date with tick t (before its next event)
+    def settle_controller(self, t):
+        self.controller.remaining = self.phase_remaining - (t - self.phase_tick) * self.tick
+
+    # bus events: the next tick on which Bus.move does anything but drive on at the same speed
+    def plan_bus(self, now):
+        bus = self.bus
+        self.scheduler.cancel(self.bus_event)
+        self.bus_event = None
+        self.cruise_tick = now
+        self.cruise = None
+        self.countdown = None
+
+        if not bus.active:
+            # end of the delay countdown
+            k = max(1, -(-bus.delay // 20))
+            self.countdown = bus.delay
+            self.bus_event = self.scheduler.schedule(now + k, self.move_bus, BUS)
+            return
+
+        x, y = bus.x, bus.y
+        signature, pure, step, ux, uy, heading, dist, dist_to_target = self.preview(x, y)
+        if not pure:
+            self.bus_event = self.scheduler.schedule(now + 1, self.move_bus, BUS)
+            return
+
+        self.cruise = (x, y, bus.distance_travelled, step, ux, uy, heading)
+        if step == 0:
+            return  # held at a stopline until the signal changes
+
+        # every zone boundary is crossed once, so the ticks that look like the next one form a run
+        def same(j):
+            return self.preview(x + (j - 1) * step * ux, y + (j - 1) * step * uy)[0] == signature
+
+        # the run ends where the bus reaches the next zone boundary or its target node
+        ticks = [(dist_to_target - bus.go_speed) // step + 1]
+        for boundary in (bus.slow_zone, bus.stop_zone, 0):
+            if dist > boundary:
+                ticks.append(-(-(dist - boundary) // step))
+        lo = int(min(ticks))
+
+        if lo < 1 or not same(lo) or same(lo + 1):
+            # fall back to searching for the end of the run
+            lo, hi = 1, 2
+            while same(hi):
+                lo, hi = hi, hi * 2
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                if same(mid):
+                    lo = mid
+                else:
+                    hi = mid
+
+        self.bus_event = self.scheduler.schedule(now + lo + 1, self.move_bus, BUS)
+
+    # what Bus.move would do from (x, y), without doing it
+    def preview(self, x, y):
+        bus = self.bus
+        controller = self.controller
+        go = bus.go_speed
+
+        tx, ty = bus.path[bus.target_index]
+        leg = bus.approaches[bus.current_leg_index]
+        approach = bus.current_approach()
+        if approach:
+            color = controller.get_color(approach)
+            sx, sy = bus.stop_point_for(approach)
+        else:
+            color = "green"
+            sx, sy = tx, ty
+
+        dist = bus.dist_remaining(tx, ty, x, y, sx, sy)
+        dx = tx - x
+        dy = ty - y
+        dist_to_target = (dx ** 2 + dy ** 2) ** 0.5
+        snap = dist_to_target < go
+        in_request_zone = bus.stop_zone < dist < bus.slow_zone
+
+        signature = (
+            abs(dx) >= go, dx > 0, dy > 0, dist <= 0, dist < 0,
+            dist <= bus.stop_zone, dist <= bus.slow_zone, in_request_zone, snap,
+        )
+        advance = approach and dist < 0 and bus.current_stop_index < len(leg) - 1
+        request = (bus.is_late and not bus.priority_requested and in_request_zone
+                   and approach and controller.accepts_priority(approach))
+
+        if abs(dx) >= go:
+            ux, uy, heading = (1 if dx > 0 else -1), 0, (0 if dx > 0 else 180)
+        else:
+            ux, uy, heading = 0, (1 if dy > 0 else -1), (90 if dy > 0 else 270)
+
+        pure = not (snap or advance or request)
+        return signature, pure, bus.decide_speed(color, dist), ux, uy, heading, dist, dist_to_target
+
+    # bring the bus up to date with tick t of its current cruise
+    def settle_bus(self, t):
+        bus = self.bus
+        k = t - self.cruise_tick
+        if k <= 0:
+            return
+
+        if self.countdown is not None:
+            bus.delay = self.countdown - k * 20
+            return
+        if self.cruise is None:
+            return
+
+        x, y, distance, step, ux, uy, heading = self.cruise
+        if ux:
+            bus.x = x + k * step * ux
+        if uy:
+            bus.y = y + k * step * uy
+        bus.distance_travelled = distance + k * step
+        bus.heading = heading
+        bus.step = step
+
+    def move_bus(self):
+        bus = self.bus
+        controller = self.controller
+        t = self.bus_event[0]
+
+        self.settle_bus(t - 1)
+        requested = controller.priority_requested
+        bus.move()
+
+        if self.offset is None and bus.active:
+            self.offset = t - 1
+        if controller.priority_requested and not requested:
+            self.plan_controller(t)
+        self.plan_bus(t)
+
+    # distance travelled by the bus after tick t of its current cruise
+    def bus_distance(self, t):
+        if self.cruise is None:
+            return self.bus.distance_travelled
+        return self.cruise[2] + (t - self.cruise_tick) * self.cruise[3]
+
+    def recovered_at(self, n):
+        bus = self.bus
+        dt = self.dt
+        actual_time = self.bus_distance(n + self.offset) / bus.go_speed * dt
+        scheduled_time = self.base_trajectory.distance_at(n) / bus.go_speed * dt
+        return max(0, scheduled_time - actual_time) == 0
+
+    # first tick in (n0, n1] on which the bus has caught up with its schedule, or None;
+    # between shadow speed changes both distances are linear, so the check is monotone
+    def first_recovery(self, n0, n1):
+        u = n0 + 1
+        while u <= n1:
+            w = min(n1, self.base_trajectory.next_change(u - 1))
+            if self.recovered_at(u):
+                return u
+            if self.recovered_at(w):
+                lo, hi = u, w
+                while hi - lo > 1:
+                    mid = (lo + hi) // 2
+                    if self.recovered_at(mid):
+                        hi = mid
+                    else:
+                        lo = mid
+                return hi
+            u = w + 1
+        return None
+
+    # the delays on every tick up to t: samples and recovery
+    def observe(self, t):
+        bus = self.bus
+        t0, self.now = self.now, t
+        if self.offset is None or not bus.is_late:
+            return
+
+        n0 = max(0, t0 - self.offset)
+        n1 = t - self.offset
+        if n1 <= n0:
+            return
+
+        recovery = self.first_recovery(n0, n1)
+        if recovery is not None:
+            n1 = recovery
+            self.now = n1 + self.offset
+
+        if self.record:
+            for n in range(n0 + self.sample_every - n0 % self.sample_every, n1 + 1, self.sample_every):
+                self.set_state(n)
+                self.times.append(self.sim_time / 1000)
+                self.delay_tsp.append(self.current_delay)
+                self.delay_shadow.append(self.current_shadow_delay)
+
+        if recovery is not None:
+            self.set_state(n1)
+            self.just_recovered = True
+            bus.is_late = False
+            self.recovery_time = self.sim_time
+
+    # clocks, shadows and delays after n ticks, as Simulation.step leaves them
+    def set_state(self, n):
+        bus = self.bus
+        self.ticks = n
+        self.sim_time = n * self.tick
+        self.base_shadow_clock_time = self.sim_time
+        self.late_shadow_clock_time = self.sim_time
+        self.base_shadow_distance = self.base_trajectory.distance_at(n)
+        self.late_shadow_distance = self.late_trajectory.distance_at(n)
+
+        dt = self.dt
+        actual_time = self.bus_distance(n + self.offset) / bus.go_speed * dt
+        scheduled_time = self.base_shadow_distance / bus.go_speed * dt
+        late_shadow_time = self.late_shadow_distance / bus.go_speed * dt
+
+        self.current_delay = max(0, scheduled_time - actual_time)
+        self.current_shadow_delay = max(0, scheduled_time - late_shadow_time)
+
+        self.recovered_delay = max(0, self.initial_delay_sec - self.current_delay)
+        self.recovered_shadow_delay = max(0, self.initial_delay_sec - self.current_shadow_delay)
+
+    # run events until the late bus recovers its delay or max_time (ms) elapses
+    def run(self, max_time=600000):
+        bus = self.bus
+        scheduler = self.scheduler
+        last = -(-max_time // self.tick)    # ticks the tick loop would step (once the bus is moving)
+
+        while bus.is_late:
+            limit = None if self.offset is None else self.offset + last
+            if limit is not None and self.now >= limit:
+                break
+
+            t = scheduler.peek()
+            if t is None or (limit is not None and t > limit):
+                if limit is not None:
+                    self.observe(limit)
+                break
+
+            self.observe(t - 1)             # nothing but driving until the event
+            if not bus.is_late:
+                break
+
+            while scheduler.peek() == t:
+                scheduler.pop()()
+            self.observe(t)
+
+        self.settle_controller(self.now)
+        self.settle_bus(self.now)
+        if bus.is_late and self.offset is not None and self.now > self.offset:
+            self.set_state(self.now - self.offset)
+        return self.result()
+
+
+# smallest k >= k_min for which remaining - k * tick drops to (or, if not inclusive, below) level
+def first_tick_below(remaining, tick, level, k_min, inclusive):
+    def below(k):
+        left = remaining - k * tick
+        return left <= level if inclusive else left < level
+
+    k = max(k_min, int((remaining - level) // tick))
+    while k > k_min and below(k - 1):
+        k -= 1
+    while not below(k):
+        k += 1
+    return k
+
+
+# build a headless simulation for a path of grid nodes (e.g. [7, 8, 9, 6]) in the given lane
+# ("event" runs the event-driven engine, "tick" steps every tick with the given shadows)
+# (a TimingPlan replaces the two phases of green_time and yellow_time)
+def build(nodes, lane="R", green_time=1200, yellow_time=500, extension_time=700, delay=5000, geometry=None,
+          shadows="analytic", engine="event", plan=None):
+    geometry = geometry or MapGeometry()
+    controller = SignalModel(geometry.stopline_geometry)
+    controller.green_time = green_time
+    controller.yellow_time = yellow_time
+    controller.extension_time = extension_time
+    if plan is not None:
+        controller.plan = plan
+        controller.reset()
+
+    g = geometry.grid[lane]
+    bus = BusModel(controller, geometry, lane=lane, path=[g[n] for n in nodes], is_late=True)
+
+    if engine == "event":
+        simulation = EventSimulation(controller, bus)
+    else:
+        simulation = Simulation(controller, bus, shadows=shadows)
+    simulation.start(delay)
+    return simulation
+
+
+# run one scenario headless and return its Result;
+# with a recording path every tick is stepped and logged there (see sim/recording.py)
+def run_scenario(nodes, lane="R", green_time=1200, yellow_time=500, extension_time=700, delay=5000,
+                 max_time=600000, record=False, shadows="analytic", engine="event", recording=None, plan=None):
+    if recording is not None:
+        engine = "tick"
+    simulation = build(nodes, lane, green_time, yellow_time, extension_time, delay, shadows=shadows, engine=engine,
+                       plan=plan)
+    simulation.record = record
+    if recording is None:
+        return simulation.run(max_time)
+
+    scenario = dict(path=list(nodes), lane=lane, green_time=green_time, yellow_time=yellow_time,
+                    extension_time=extension_time, delay=delay)
+    if plan is not None:
+        scenario["plan"] = [[str(p.name), list(p.approaches), p.green, p.yellow, p.all_red] for p in plan.phases]
+    simulation.recorder = TrajectoryRecorder(recording, scenario, simulation.tick, simulation.bus.go_speed)
+    try:
+        return simulation.run(max_time)
+    finally:
+        simulation.recorder.close()
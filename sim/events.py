@@ -0,0 +1,35 @@
+import heapq
+
+
+# Priority queue of events at integer ticks.
+# Events at the same tick run by priority (lowest first), then in the order they were scheduled.
+class EventScheduler:
+    def __init__(self):
+        self.queue = []
+        self.count = 0
+
+    def schedule(self, tick, action, priority=0):
+        event = [tick, priority, self.count, action]
+        self.count += 1
+        heapq.heappush(self.queue, event)
+        return event
+
+    # cancelled events stay queued and are dropped when they reach the front
+    def cancel(self, event):
+        if event is not None:
+            event[3] = None
+
+    # tick of the next live event, or None if nothing is scheduled
+    def peek(self):
+        queue = self.queue
+        while queue and queue[0][3] is None:
+            heapq.heappop(queue)
+        return queue[0][0] if queue else None
+
+    # remove the next live event and return its action
+    def pop(self):
+        self.peek()
+        return heapq.heappop(self.queue)[3]
+
+    def clear(self):
+        self.queue.clear()
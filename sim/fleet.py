@@ -0,0 +1,232 @@
+from sim.bus_model import BusModel
+from sim.engine import Result
+from sim.geometry import MapGeometry
+from sim.shadow import shadow_trajectory
+from sim.signal_model import SignalModel
+
+
+# Everything the buses on one path and lane share: the closed loop, its approaches and route index.
+# A BusModel is kept as the template for the geometry and the speed/zone rules.
+class Route:
+    def __init__(self, controller, geometry, nodes, lane="R"):
+        g = geometry.grid[lane]
+        self.nodes = list(nodes)
+        self.lane = lane
+        self.model = BusModel(controller, geometry, lane=lane, path=[g[n] for n in nodes], is_late=True)
+        self.path = self.model.path
+        self.approaches = self.model.approaches
+        self.index = self.model.route
+
+
+# Per-bus state; the route is shared
+class FleetBus:
+    __slots__ = (
+        "route", "delay", "dispatch",
+        "x", "y", "heading", "step", "target_index", "leg", "stop_index", "distance_travelled",
+        "countdown", "active", "is_late", "priority_requested",
+        "ticks", "base", "late",                    # ticks since the bus started, shadow trajectories
+        "current_delay", "current_shadow_delay", "recovery_time",
+    )
+
+    def __init__(self, route, delay=0, dispatch=0):
+        self.route = route
+        self.delay = delay              # ms the bus is late by
+        self.dispatch = dispatch        # ms after the start of the run at which the bus leaves
+
+        self.x, self.y = route.path[0]
+        self.heading = 0
+        self.step = route.model.go_speed
+        self.target_index = 1
+        self.leg = 0
+        self.stop_index = 0
+        self.distance_travelled = 0
+
+        self.countdown = dispatch
+        self.active = dispatch == 0
+        self.is_late = True             # as in the engine, a bus with no delay recovers on its first tick
+        self.priority_requested = False
+
+        self.ticks = 0
+        self.base = None
+        self.late = None
+        self.current_delay = delay / 1000.0
+        self.current_shadow_delay = delay / 1000.0
+        self.recovery_time = None       # ms after dispatch
+
+
+# Many buses on one or more routes through the shared signal controller.
+# Buses don't block each other; they interact through the controller, so priority requests and
+# extensions are shared. Each bus has its own delay, dispatch time and pair of shadow buses.
+class Fleet:
+    def __init__(self, controller, geometry=None, tick=20):
+        self.controller = controller
+        self.geometry = geometry or MapGeometry()
+        self.tick = tick
+        self.dt = tick / 1000
+
+        self.routes = {}
+        self.buses = []
+        self.sim_time = 0
+
+    def route(self, nodes, lane="R"):
+        key = (tuple(nodes), lane)
+        if key not in self.routes:
+            self.routes[key] = Route(self.controller, self.geometry, nodes, lane)
+        return self.routes[key]
+
+    def add_bus(self, nodes, lane="R", delay=0, dispatch=0):
+        bus = FleetBus(self.route(nodes, lane), delay, dispatch)
+        self.buses.append(bus)
+        return bus
+
+    # count buses leaving every headway ms; delay is one value for all of them or one per bus
+    def add_route(self, nodes, lane="R", count=1, headway=60000, delay=0, first=0):
+        delays = delay if isinstance(delay, (list, tuple)) else [delay] * count
+        return [self.add_bus(nodes, lane, delays[i], first + i * headway) for i in range(count)]
+
+    def start(self):
+        self.sim_time = 0
+        self.controller.start()
+        for bus in self.buses:
+            if bus.active:
+                self.depart(bus, 0)
+
+    # the bus starts moving: its shadows start from the signal clock at that tick
+    def depart(self, bus, clock):
+        model = bus.route.model
+        bus.base = shadow_trajectory(model, self.controller, self.tick, bus.delay / self.tick * model.go_speed, clock)
+        bus.late = shadow_trajectory(model, self.controller, self.tick, 0, clock)
+
+    # BusModel.move for one bus
+    def move(self, bus):
+        if not bus.active:
+            bus.countdown -= self.tick
+            if bus.countdown > 0:
+                return
+            bus.active = True
+            self.depart(bus, self.sim_time)
+
+        route = bus.route
+        model = route.model
+        controller = self.controller
+        go = model.go_speed
+
+        tx, ty = route.path[bus.target_index]
+        x, y = bus.x, bus.y
+
+        leg = route.approaches[bus.leg]
+        approach = leg[bus.stop_index] if leg else None
+
+        if approach:
+            color = controller.get_color(approach)
+            sx, sy = model.stop_point_for(approach)
+        else:
+            color = "green"
+            sx, sy = tx, ty
+
+        dist = model.dist_remaining(tx, ty, x, y, sx, sy)
+        bus.step = model.decide_speed(color, dist)
+
+        # advance to the next stopline once the current one is cleared
+        if approach and dist < 0 and bus.stop_index < len(leg) - 1:
+            bus.stop_index += 1
+
+        # request priority (shared by every bus at this controller)
+        if bus.is_late and not bus.priority_requested and model.stop_zone < dist < model.slow_zone:
+            if approach and controller.request_priority(approach):
+                bus.priority_requested = True
+
+        dx = tx - x
+        dy = ty - y
+
+        if (dx ** 2 + dy ** 2) ** 0.5 < go:
+            bus.x, bus.y = tx, ty
+            bus.target_index = (bus.target_index + 1) % len(route.path)
+            bus.leg = (bus.leg + 1) % len(route.approaches)
+            bus.stop_index = 0
+            bus.priority_requested = False
+            return
+
+        bus.distance_travelled += bus.step
+        if abs(dx) >= go:
+            bus.heading = 0 if dx > 0 else 180
+            bus.x += bus.step if dx > 0 else -bus.step
+        else:
+            bus.heading = 90 if dy > 0 else 270
+            bus.y += bus.step if dy > 0 else -bus.step
+
+    def step(self):
+        self.controller.tick(self.tick)
+        for bus in self.buses:
+            self.move(bus)
+
+        self.sim_time += self.tick
+
+        dt = self.dt
+        for bus in self.buses:
+            if not bus.active:
+                continue
+            bus.ticks += 1
+            if not bus.is_late:
+                continue
+
+            go = bus.route.model.go_speed
+            actual_time = bus.distance_travelled / go * dt
+            scheduled_time = bus.base.distance_at(bus.ticks) / go * dt
+            bus.current_delay = max(0, scheduled_time - actual_time)
+
+            if bus.current_delay == 0:
+                bus.is_late = False
+                bus.recovery_time = bus.ticks * self.tick
+                bus.current_shadow_delay = self.shadow_delay(bus)
+
+    # delay of the bus's late shadow (without TSP) against its schedule
+    def shadow_delay(self, bus):
+        go = bus.route.model.go_speed
+        scheduled_time = bus.base.distance_at(bus.ticks) / go * self.dt
+        late_shadow_time = bus.late.distance_at(bus.ticks) / go * self.dt
+        return max(0, scheduled_time - late_shadow_time)
+
+    # step until every late bus recovers its delay or max_time (ms) elapses; one Result per bus
+    def run(self, max_time=600000):
+        while self.sim_time < max_time and any(bus.is_late for bus in self.buses):
+            self.step()
+        return [self.result(bus) for bus in self.buses]
+
+    def result(self, bus):
+        initial = bus.delay / 1000.0
+        shadow = bus.current_shadow_delay
+        if bus.is_late and bus.late is not None:
+            shadow = self.shadow_delay(bus)
+        return Result(
+            recovery_time=None if bus.recovery_time is None else bus.recovery_time / 1000,
+            initial_delay=initial,
+            delay_tsp=bus.current_delay,
+            delay_shadow=shadow,
+            recovered_tsp=max(0, initial - bus.current_delay),
+            recovered_shadow=max(0, initial - shadow),
+            time_debt=self.controller.time_debt,
+            extension_granted=self.controller.extension_granted,
+            series=([], [], []),
+        )
+
+    # time gaps (s) between consecutive buses on each route, from the distance each has driven;
+    # shrinking gaps are buses bunching
+    def gaps(self):
+        gaps = {}
+        for key, route in self.routes.items():
+            buses = sorted((b for b in self.buses if b.route is route), key=lambda b: b.dispatch)
+            go = route.model.go_speed
+            gaps[key] = [(a.distance_travelled - b.distance_travelled) / go * self.dt
+                         for a, b in zip(buses, buses[1:])]
+        return gaps
+
+
+# a fleet with its own controller, timed like the GUI sliders
+def build_fleet(green_time=1200, yellow_time=500, extension_time=700, geometry=None, tick=20):
+    geometry = geometry or MapGeometry()
+    controller = SignalModel(geometry.stopline_geometry)
+    controller.green_time = green_time
+    controller.yellow_time = yellow_time
+    controller.extension_time = extension_time
+    return Fleet(controller, geometry, tick)
@@ -0,0 +1,200 @@
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from types import MappingProxyType
+
+from sim.signal_model import NS_KEYS, Phase
+
+# Stopline geometry: centre position (x, y) and extent (w, h) in world units,
+# orientation of the bar ("vertical" bars cross horizontal roads), the phase group that controls it
+# and the direction of travel it holds ("N", "S", "E" or "W")
+StoplineGeometry = namedtuple("StoplineGeometry", ["x", "y", "w", "h", "orientation", "phase", "direction"])
+
+
+def stopline(key, x, y, w, h, direction):
+    return StoplineGeometry(
+        x, y, w, h,
+        "vertical" if h > w else "horizontal",
+        Phase.NS if key in NS_KEYS else Phase.EW,
+        direction,
+    )
+
+adjacent = {      # list of nodes adjacent to each node:
+    1: [2,4],     # 1-2-3
+    2: [1,3,5],   # | | |
+    3: [2,6],     # 4-5-6
+    4: [1,5,7],   # | | |
+    5: [2,4,6,8], # 7-8-9
+    6: [3,5,9],
+    7: [4,8],
+    8: [5,7,9],
+    9: [6,8]
+}
+
+ring_nodes = (1, 2, 3, 6, 9, 8, 7, 4) # ring road nodes in clockwise order
+
+start_nodes = {1,3,7,9} # a path cannot start at an intersection; these are the only starting nodes
+
+path_length = 4 # the user selects 4 nodes
+
+
+# every path the node buttons allow: a start node followed by adjacent nodes
+def valid_paths(length=path_length):
+    paths = [[n] for n in sorted(start_nodes)]
+    for _ in range(length - 1):
+        paths = [p + [n] for p in paths for n in adjacent[p[-1]]]
+    return paths
+
+
+class MapGeometry:
+    def __init__(self):
+        # Geometry constants
+        self.world = 300               # half-size of world
+        self.road_width = 60           # road width
+        self.inner_margin = self.world # map edge
+        self.stop_setback = 12         # setback distance of stoplines from city block edge
+        self.stop_thickness = 6        # thickness of stoplines
+
+        # Derived geometry (used by Bus)
+        self.m = self.inner_margin          # map edge
+        self.rw = self.road_width           # road width
+        self.h = self.rw / 2                # lane width = 0.5 * road_width
+        self.inner = self.m - self.rw       # city block edge
+        self.ring_mid = self.inner + self.h # centre lane of ring road
+
+        rol = self.ring_mid + self.h / 2  # ring_outer_lane
+        ril = self.ring_mid - self.h / 2  # ring_inner_lane
+        lo = self.h / 2  # lane offset for central roads = 15
+
+        self.grid = {
+            "R": {1: (-rol, rol), # Right lane, "R", for each node:
+                  2: (lo, rol),   # 1-2-3
+                  3: (rol, rol),  # | | |
+                  4: (-rol, -lo), # 4-5-6
+                  5: (lo, -lo),   # | | |
+                  6: (rol, -lo),  # 7-8-9
+                  7: (-rol, -rol),
+                  8: (lo, -rol),
+                  9: (rol, -rol),
+                  },
+            "L": {1: (-ril, ril), # Left lane, "L", for each node:
+                  2: (-lo, ril),  # 1-2-3
+                  3: (ril, ril),  # | | |
+                  4: (-ril, lo),  # 4-5-6
+                  5: (-lo, lo),   # | | |
+                  6: (ril, lo),   # 7-8-9
+                  7: (-ril, -ril),
+                  8: (-lo, -ril),
+                  9: (ril, -ril),
+                  }
+        }
+
+        self.ring_nodes = ring_nodes
+
+        # Lane centers
+        self.ring_lane_offset = 15
+        self.central_lane_offset = 15
+
+        # Stopline geometry table, keyed by approach (read-only), and its index by road
+        table = {}
+        table.update(self.central_stop_lines())
+        table.update(self.ring_stop_lines())
+        self.stopline_geometry = MappingProxyType(table)
+        self.stopline_index = StoplineIndex(self.stopline_geometry)
+
+    def central_stop_lines(self):
+        rw = self.road_width    # road width
+        h = rw / 2              # lane width = 0.5 * road_width
+        s = self.stop_setback   # setback distance of stoplines from city block edge
+        t = self.stop_thickness # thickness of stoplines
+
+        return {
+            "NB": stopline("NB", 0, -(h + s + t / 2), rw, t, "N"), # northbound approaching center
+            "SB": stopline("SB", 0, (h + s + t / 2), rw, t, "S"),
+            "WB": stopline("WB", (h + s + t / 2), 0, t, rw, "W"),
+            "EB": stopline("EB", -(h + s + t / 2), 0, t, rw, "E"),
+        }
+
+    def ring_stop_lines(self):
+        rw = self.road_width    # road width
+        m = self.inner_margin   # map edge
+
+        d = self.stop_setback   # setback distance of stoplines from city block edge
+        t = self.stop_thickness # thickness of stoplines
+
+        h = rw / 2              # lane width = 0.5 * road_width
+        inner = m - rw          # city block edge
+
+        ring_height = (m - inner)  # thickness of ring road band
+
+        return {
+            # North ring stoplines
+            "RN_L": stopline("RN_L", -(h + d) - t / 2, (inner + m) / 2, t, ring_height, "E"),
+            "RN_R": stopline("RN_R", (h + d) + t / 2, (inner + m) / 2, t, ring_height, "W"),
+            "RN_C": stopline("RN_C", 0, inner - d - t / 2, rw, t, "N"),
+
+            # East ring stoplines
+            "RE_T": stopline("RE_T", (inner + m) / 2, (h + d) + t / 2, ring_height, t, "S"),
+            "RE_B": stopline("RE_B", (inner + m) / 2, -(h + d) - t / 2, ring_height, t, "N"),
+            "RE_C": stopline("RE_C", inner - d - t / 2, 0, t, rw, "E"),
+
+            # South ring stoplines
+            "RS_L": stopline("RS_L", -(h + d) - t / 2, -(inner + m) / 2, t, ring_height, "E"),
+            "RS_R": stopline("RS_R", (h + d) + t / 2, -(inner + m) / 2, t, ring_height, "W"),
+            "RS_C": stopline("RS_C", 0, -inner + d + t / 2, rw, t, "S"),
+
+            # West ring stoplines
+            "RW_T": stopline("RW_T", -(inner + m) / 2, (h + d) + t / 2, ring_height, t, "S"),
+            "RW_B": stopline("RW_B", -(inner + m) / 2, -(h + d) - t / 2, ring_height, t, "N"),
+            "RW_C": stopline("RW_C", -inner + d + t / 2, 0, t, rw, "W"),
+        }
+
+
+# Stoplines indexed by road: for each direction of travel, the roads (by their centre line) and the
+# stoplines along each road sorted by position, so the stoplines on a segment are found by bisection.
+class StoplineIndex:
+    def __init__(self, stoplines, tolerance=20):
+        self.tolerance = tolerance  # max distance between a lane and the centre of a stopline across it
+
+        roads = {}
+        for key, s in stoplines.items():
+            if s.orientation == "vertical": # a vertical bar crosses a horizontal road
+                road, position = s.y, s.x
+            else:
+                road, position = s.x, s.y
+            roads.setdefault(s.direction, {}).setdefault(road, []).append((position, key))
+
+        self.roads = {}
+        for direction, lines in roads.items():
+            centres = sorted(lines)
+            stops = [sorted(lines[c]) for c in centres]
+            self.roads[direction] = (
+                centres,
+                [[p for p, _ in line] for line in stops],
+                [[k for _, k in line] for line in stops],
+            )
+
+    # stoplines holding travel from (x1, y1) to (x2, y2) that lie strictly between the two nodes,
+    # as (distance from the start node, key), nearest first
+    def on_segment(self, x1, y1, x2, y2):
+        if y1 == y2:
+            direction = "E" if x2 > x1 else "W"
+            lane, start, end = y1, x1, x2
+        else:
+            direction = "N" if y2 > y1 else "S"
+            lane, start, end = x1, y1, y2
+
+        if direction not in self.roads:
+            return []
+        centres, positions, keys = self.roads[direction]
+
+        found = []
+        lo, hi = min(start, end), max(start, end)
+        i = bisect_right(centres, lane - self.tolerance)
+        while i < len(centres) and centres[i] < lane + self.tolerance:
+            line = positions[i]
+            for j in range(bisect_right(line, lo), bisect_left(line, hi)):
+                found.append((abs(line[j] - start), keys[i][j]))
+            i += 1
+
+        found.sort()
+        return found
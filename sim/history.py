@@ -0,0 +1,73 @@
+import numpy as np
+
+
+# Largest-Triangle-Three-Buckets: indices of at most n_out points of (x, ys) that keep the shape of the curves.
+# ys holds one row per series; a point's triangle area is summed over the series so they share x values.
+# Buckets span equal ranges of x, so data that was already thinned keeps its share of the points.
+def lttb(x, ys, n_out):
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # the first and last points are kept; the rest are split into n_out - 2 buckets (some may be empty)
+    edges = np.searchsorted(x, np.linspace(x[1], x[n - 1], n_out - 1))
+    edges[0], edges[-1] = 1, n - 1
+    buckets = [(lo, hi) for lo, hi in zip(edges[:-1], edges[1:]) if hi > lo]
+
+    indices = [0]
+    a = 0
+    for i, (lo, hi) in enumerate(buckets):
+        # average of the next bucket (the last point for the final bucket)
+        if i + 1 < len(buckets):
+            nlo, nhi = buckets[i + 1]
+            cx = x[nlo:nhi].mean()
+            cy = ys[:, nlo:nhi].mean(axis=1)
+        else:
+            cx = x[n - 1]
+            cy = ys[:, n - 1]
+
+        px, py = x[a], ys[:, a]
+        area = np.abs(
+            (px - cx) * (ys[:, lo:hi] - py[:, None]) - (px - x[lo:hi]) * (cy - py)[:, None]
+        ).sum(axis=0)
+
+        a = lo + int(area.argmax())
+        indices.append(a)
+
+    indices.append(n - 1)
+    return np.array(indices)
+
+
+# Preallocated sample history. When it fills up it is halved with LTTB, so a long run keeps
+# its whole time span at a coarser resolution instead of growing or dropping its start.
+class DelayHistory:
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.data = np.empty((3, capacity)) # rows: time, delay with TSP, delay without TSP
+        self.count = 0
+
+    def append(self, time, delay_tsp, delay_shadow):
+        if self.count == self.capacity:
+            self.compact()
+        self.data[:, self.count] = time, delay_tsp, delay_shadow
+        self.count += 1
+
+    def compact(self):
+        keep = lttb(self.data[0], self.data[1:], self.capacity // 2)
+        self.data[:, :len(keep)] = self.data[:, keep]
+        self.count = len(keep)
+
+    def clear(self):
+        self.count = 0
+
+    @property
+    def times(self):
+        return self.data[0, :self.count]
+
+    @property
+    def delay_tsp(self):
+        return self.data[1, :self.count]
+
+    @property
+    def delay_shadow(self):
+        return self.data[2, :self.count]
@@ -0,0 +1,301 @@
+# Monte Carlo runs of one route: initial delay, bus speed and signal offset are drawn per run from
+# seeded distributions, and the outcomes are folded into streaming statistics:
+#
+#     python -m sim.montecarlo --path 7-8-9-6 --runs 10000 --delay uniform:2000:20000 \
+#         --speed normal:1:0.05 --offset uniform:0:3400
+#
+# Distributions are "const:v", "uniform:lo:hi", "normal:mean:sd", "lognormal:mu:sigma",
+# "triangular:lo:hi:mode" or "choice:a,b,c"; normal draws are clipped at zero, and speed factors
+# at min_speed so that every bus moves.
+# Run i is seeded from (--seed, i), so any replication can be reproduced on its own.
+# Workers return merged statistics rather than results, so memory does not grow with --runs.
+import argparse
+import math
+import os
+import random
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from sim.bus_model import BusModel
+from sim.engine import EventSimulation
+from sim.geometry import MapGeometry
+from sim.signal_model import SignalModel
+
+min_speed = 0.05    # slowest speed factor drawn (a zero speed would never reach the next stopline)
+
+
+class Distribution:
+    def __init__(self, spec):
+        self.spec = spec
+        kind, _, args = spec.partition(":")
+        self.kind = kind
+        if kind == "choice":
+            self.values = [float(v) for v in args.split(",")]
+        else:
+            self.values = [float(v) for v in args.split(":")] if args else []
+
+        arity = {"const": 1, "uniform": 2, "normal": 2, "lognormal": 2, "triangular": 3}
+        if kind != "choice" and arity.get(kind) != len(self.values):
+            raise ValueError(f"bad distribution: {spec!r}")
+
+    def sample(self, rng):
+        v = self.values
+        if self.kind == "const":
+            return v[0]
+        if self.kind == "uniform":
+            return rng.uniform(v[0], v[1])
+        if self.kind == "normal":
+            return max(0.0, rng.gauss(v[0], v[1]))
+        if self.kind == "lognormal":
+            return rng.lognormvariate(v[0], v[1])
+        if self.kind == "triangular":
+            return rng.triangular(v[0], v[1], v[2])
+        return rng.choice(v)
+
+
+# Welford's online mean and variance; merges with Chan's parallel update
+class RunningStats:
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    def merge(self, other):
+        if other.n == 0:
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta ** 2 * self.n * other.n / n
+        self.n = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+
+# Quantiles to a relative accuracy: values are counted in logarithmic buckets (as in DDSketch),
+# so the number of buckets depends on the range of the values, not on how many there are.
+# Negative values are bucketed by magnitude in a store of their own.
+class QuantileSketch:
+    def __init__(self, accuracy=0.01):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.negative = {}      # buckets of -x for negative x
+        self.zeros = 0          # values too close to zero to bucket (|x| <= 1e-9)
+        self.n = 0
+
+    def add(self, x):
+        self.n += 1
+        if abs(x) <= 1e-9:
+            self.zeros += 1
+            return
+        buckets = self.buckets if x > 0 else self.negative
+        key = math.ceil(math.log(abs(x)) / self.log_gamma)
+        buckets[key] = buckets.get(key, 0) + 1
+
+    def merge(self, other):
+        self.n += other.n
+        self.zeros += other.zeros
+        for mine, theirs in ((self.buckets, other.buckets), (self.negative, other.negative)):
+            for key, count in theirs.items():
+                mine[key] = mine.get(key, 0) + count
+
+    # midpoint of a bucket
+    def value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q):
+        if self.n == 0:
+            return math.nan
+        rank = q * (self.n - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):     # most negative first
+            seen += self.negative[key]
+            if rank < seen:
+                return -self.value(key)
+        seen += self.zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                return self.value(key)
+        if self.buckets:
+            return self.value(max(self.buckets))
+        return 0.0 if self.zeros else -self.value(min(self.negative))
+
+
+# Streaming statistics of a set of runs; summaries of disjoint runs merge into one
+class Summary:
+    def __init__(self, accuracy=0.01):
+        self.runs = 0
+        self.recovered = 0
+        self.recovery_time = RunningStats()     # s, over the runs that recovered
+        self.recovery_quantiles = QuantileSketch(accuracy)
+        self.delay_tsp = RunningStats()         # s, delay left at the end of each run, with TSP
+        self.benefit = RunningStats()           # s, delay saved by TSP (without minus with)
+        self.benefit_quantiles = QuantileSketch(accuracy)
+
+    def add(self, result):
+        self.runs += 1
+        if result.recovery_time is not None:
+            self.recovered += 1
+            self.recovery_time.add(result.recovery_time)
+            self.recovery_quantiles.add(result.recovery_time)
+        self.delay_tsp.add(result.delay_tsp)
+        benefit = result.delay_shadow - result.delay_tsp
+        self.benefit.add(benefit)
+        self.benefit_quantiles.add(benefit)
+
+    def merge(self, other):
+        self.runs += other.runs
+        self.recovered += other.recovered
+        self.recovery_time.merge(other.recovery_time)
+        self.recovery_quantiles.merge(other.recovery_quantiles)
+        self.delay_tsp.merge(other.delay_tsp)
+        self.benefit.merge(other.benefit)
+        self.benefit_quantiles.merge(other.benefit_quantiles)
+
+    # share of runs that recovered fully, with a 95 % Wilson interval
+    def recovery_probability(self, z=1.96):
+        n = self.runs
+        if n == 0:
+            return math.nan, math.nan, math.nan
+        p = self.recovered / n
+        centre = (p + z * z / (2 * n)) / (1 + z * z / n)
+        half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+        return p, centre - half, centre + half
+
+    def report(self, stream=sys.stdout):
+        p, lo, hi = self.recovery_probability()
+        rt = self.recovery_time
+        stream.write(f"runs                {self.runs}\n")
+        stream.write(f"P(full recovery)    {p:.4f}  (95% CI {lo:.4f}-{hi:.4f})\n")
+        if rt.n == 0:
+            stream.write("recovery time (s)   n/a (no run recovered)\n")
+        else:
+            stream.write(f"recovery time (s)   mean {rt.mean:.2f}  sd {rt.std:.2f}  min {rt.min:.2f}  max {rt.max:.2f}\n")
+            qs = "  ".join(f"p{int(q * 100)} {self.recovery_quantiles.quantile(q):.2f}" for q in (0.5, 0.9, 0.95, 0.99))
+            stream.write(f"                    {qs}\n")
+        stream.write(f"TSP benefit (s)     mean {self.benefit.mean:.2f}  sd {self.benefit.std:.2f}  "
+                     f"p50 {self.benefit_quantiles.quantile(0.5):.2f}  p95 {self.benefit_quantiles.quantile(0.95):.2f}\n")
+        stream.write(f"final delay (s)     mean {self.delay_tsp.mean:.2f}  max {self.delay_tsp.max:.2f}\n")
+
+
+# One replication: its own seeded draws of delay (ms), speed factor and signal offset (ms)
+def run_once(config, i):
+    rng = random.Random(f"{config['seed']}:{i}")
+    delay = config["delay"].sample(rng)
+    speed = max(min_speed, config["speed"].sample(rng))
+    offset = config["offset"].sample(rng)
+
+    geometry = MapGeometry()
+    controller = SignalModel(geometry.stopline_geometry)
+    controller.green_time = config["green_time"]
+    controller.yellow_time = config["yellow_time"]
+    controller.extension_time = config["extension_time"]
+    controller.offset = offset
+
+    g = geometry.grid[config["lane"]]
+    bus = BusModel(controller, geometry, lane=config["lane"], path=[g[n] for n in config["path"]], is_late=True)
+    bus.go_speed *= speed
+    bus.slow_speed *= speed
+    bus.step = bus.go_speed
+
+    simulation = EventSimulation(controller, bus)
+    simulation.start(delay)
+    return simulation.run(config["max_time"])
+
+
+# worker entry point: a block of replications folded into one Summary
+def run_block(config, first, count):
+    summary = Summary(config["accuracy"])
+    for i in range(first, first + count):
+        summary.add(run_once(config, i))
+    return summary
+
+
+# run the replications in blocks on a process pool, keeping only a few blocks in flight
+def run_montecarlo(config, runs, workers=None, block=100, progress=None):
+    workers = workers or os.cpu_count()
+    summary = Summary(config["accuracy"])
+    blocks = ((first, min(block, runs - first)) for first in range(0, runs, block))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = set()
+        for first, count in blocks:
+            in_flight.add(pool.submit(run_block, config, first, count))
+            if len(in_flight) >= workers * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    summary.merge(future.result())
+                    if progress:
+                        progress(summary)
+        for future in in_flight:
+            summary.merge(future.result())
+            if progress:
+                progress(summary)
+    return summary
+
+
+def make_config(path, lane="R", green_time=1200, yellow_time=500, extension_time=700,
+                delay="const:5000", speed="const:1", offset="const:0", seed=0, max_time=600000, accuracy=0.01):
+    return dict(
+        path=list(path), lane=lane, green_time=green_time, yellow_time=yellow_time,
+        extension_time=extension_time, delay=Distribution(delay), speed=Distribution(speed),
+        offset=Distribution(offset), seed=seed, max_time=max_time, accuracy=accuracy,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monte Carlo runs of one route with streaming statistics.")
+    parser.add_argument("--path", default="7-8-9-6", help="grid nodes, e.g. 7-8-9-6")
+    parser.add_argument("--lane", default="R", choices=("R", "L"))
+    parser.add_argument("--green", type=int, default=1200, help="green time (ms)")
+    parser.add_argument("--yellow", type=int, default=500, help="yellow time (ms)")
+    parser.add_argument("--extension", type=int, default=700, help="TSP extension time (ms)")
+    parser.add_argument("--delay", default="uniform:2000:20000", help="initial delay distribution (ms)")
+    parser.add_argument("--speed", default="const:1", help="bus speed factor distribution")
+    parser.add_argument("--offset", default="const:0", help="signal offset distribution (ms into the cycle)")
+    parser.add_argument("--runs", type=int, default=1000, help="replications")
+    parser.add_argument("--seed", type=int, default=0, help="base seed")
+    parser.add_argument("--max-time", type=int, default=600000, help="give up on a run after this long (ms)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--block", type=int, default=100, help="replications per task")
+    args = parser.parse_args(argv)
+
+    config = make_config(
+        [int(n) for n in args.path.split("-")], args.lane, args.green, args.yellow, args.extension,
+        args.delay, args.speed, args.offset, args.seed, args.max_time,
+    )
+
+    def progress(summary):
+        sys.stderr.write(f"\r{summary.runs}/{args.runs} runs")
+        sys.stderr.flush()
+
+    summary = run_montecarlo(config, args.runs, args.workers, args.block, progress)
+    sys.stderr.write("\n")
+    summary.report()
+
+
+if __name__ == "__main__":
+    main()
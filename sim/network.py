@@ -0,0 +1,225 @@
+from types import MappingProxyType
+
+from sim.geometry import StoplineGeometry, StoplineIndex
+from sim.signal_model import Phase, SignalModel
+
+# unit vector of each direction of travel
+directions = {"N": (0, 1), "S": (0, -1), "E": (1, 0), "W": (-1, 0)}
+
+
+# direction of travel along a horizontal or vertical road from a to b
+def travel_direction(a, b):
+    (x1, y1), (x2, y2) = a, b
+    if y1 == y2 and x1 != x2:
+        return "E" if x2 > x1 else "W"
+    if x1 == x2 and y1 != y2:
+        return "N" if y2 > y1 else "S"
+    raise ValueError("roads must be horizontal or vertical: %r -> %r" % (a, b))
+
+
+# Road network of any shape: node positions (road centres) and two-way roads between them.
+# Every node where three or more roads meet is a signalised intersection with a stopline on each
+# road entering it; stopline keys are generated as "<node>:<direction>B", e.g. "5:NB".
+# Has the attributes BusModel reads from MapGeometry, so buses and fleets run on it unchanged.
+class NetworkGeometry:
+    def __init__(self, positions, roads, ring_nodes=(), road_width=60, stop_setback=12, stop_thickness=6):
+        self.positions = dict(positions)
+        self.road_width = road_width
+        self.stop_setback = stop_setback
+        self.stop_thickness = stop_thickness
+        self.ring_nodes = tuple(ring_nodes)     # perimeter in clockwise order, used to close open paths
+
+        self.neighbours = {node: [] for node in self.positions}
+        for a, b in roads:
+            travel_direction(self.positions[a], self.positions[b])
+            self.neighbours[a].append(b)
+            self.neighbours[b].append(a)
+
+        # Derived geometry (used by BusModel)
+        extent = max(max(abs(x), abs(y)) for x, y in self.positions.values())
+        self.world = extent + road_width
+        self.inner_margin = self.world
+        self.m = self.inner_margin
+        self.rw = road_width
+        self.h = self.rw / 2
+
+        # lane centres: right lane below/right of the road centre, left lane above/left (as on the 3×3 map)
+        lo = self.h / 2
+        self.grid = {
+            "R": {node: (x + lo, y - lo) for node, (x, y) in self.positions.items()},
+            "L": {node: (x - lo, y + lo) for node, (x, y) in self.positions.items()},
+        }
+
+        # signalised intersections and the stoplines on the roads entering them
+        self.intersections = [node for node, roads in self.neighbours.items() if len(roads) >= 3]
+        self.approaches = {}                    # node -> stopline keys entering it
+        table = {}
+        for node in self.intersections:
+            keys = []
+            for other in self.neighbours[node]:
+                key, geometry = self.entry_stop_line(other, node)
+                table[key] = geometry
+                keys.append(key)
+            self.approaches[node] = keys
+
+        self.stopline_geometry = MappingProxyType(table)
+        self.stopline_index = StoplineIndex(self.stopline_geometry)
+
+    # stopline across the road from a, set back from intersection b
+    def entry_stop_line(self, a, b):
+        direction = travel_direction(self.positions[a], self.positions[b])
+        ux, uy = directions[direction]
+        x, y = self.positions[b]
+        rw = self.road_width
+        t = self.stop_thickness
+        back = self.h + self.stop_setback + t / 2   # from the intersection centre
+
+        w, h = (t, rw) if uy == 0 else (rw, t)      # bars cross the road
+        phase = Phase.NS if uy else Phase.EW
+        key = "%s:%sB" % (b, direction)
+        return key, StoplineGeometry(
+            x - ux * back, y - uy * back, w, h,
+            "vertical" if h > w else "horizontal",
+            phase,
+            direction,
+        )
+
+    # the stopline keys of an intersection controlled by each phase
+    def phase_keys(self, node):
+        keys = self.approaches[node]
+        return (
+            tuple(k for k in keys if self.stopline_geometry[k].phase == Phase.NS),
+            tuple(k for k in keys if self.stopline_geometry[k].phase == Phase.EW),
+        )
+
+
+# N×M grid numbered row by row from the top left, like the 3×3 map:
+# 1-2-3
+# | | |
+# 4-5-6
+def grid_geometry(rows, cols, spacing=240, **kwargs):
+    positions = {}
+    for r in range(rows):
+        for c in range(cols):
+            positions[r * cols + c + 1] = ((c - (cols - 1) / 2) * spacing, ((rows - 1) / 2 - r) * spacing)
+
+    roads = []
+    for r in range(rows):
+        for c in range(cols):
+            node = r * cols + c + 1
+            if c + 1 < cols:
+                roads.append((node, node + 1))
+            if r + 1 < rows:
+                roads.append((node, node + cols))
+
+    # perimeter, clockwise from the top left
+    ring = [c + 1 for c in range(cols)]
+    ring += [r * cols + cols for r in range(1, rows)]
+    if rows > 1:
+        ring += [(rows - 1) * cols + c + 1 for c in range(cols - 2, -1, -1)]
+    if cols > 1:
+        ring += [r * cols + 1 for r in range(rows - 2, 0, -1)]
+
+    return NetworkGeometry(positions, roads, ring, **kwargs)
+
+
+# One SignalModel per intersection, each with its own timing plan and offset.
+# Looks like a single controller to buses, fleets and shadow trajectories: calls about a stopline
+# are passed to the controller of its intersection. A tick costs one controller tick per intersection.
+class Network:
+    def __init__(self, geometry, green_time=1200, yellow_time=500, extension_time=700, offsets=None):
+        self.geometry = geometry
+        self.stoplines = geometry.stopline_geometry
+        offsets = offsets or {}
+
+        self.controllers = {}           # node -> SignalModel
+        self.controller_of = {}         # stopline key -> SignalModel
+        for node in geometry.intersections:
+            ns_keys, ew_keys = geometry.phase_keys(node)
+            controller = SignalModel(geometry.approaches[node], ns_keys, ew_keys)
+            controller.green_time = green_time
+            controller.yellow_time = yellow_time
+            controller.extension_time = extension_time
+            controller.offset = offsets.get(node, 0)
+            controller.remaining = green_time
+            self.controllers[node] = controller
+            for key in geometry.approaches[node]:
+                self.controller_of[key] = controller
+        self.bank = list(self.controllers.values())
+
+    # change the timing plan of one intersection (before start); a TimingPlan replaces its two phases
+    def set_timing(self, node, green_time=None, yellow_time=None, extension_time=None, offset=None, plan=None):
+        controller = self.controllers[node]
+        if green_time is not None:
+            controller.green_time = green_time
+            controller.remaining = green_time
+        if yellow_time is not None:
+            controller.yellow_time = yellow_time
+        if extension_time is not None:
+            controller.extension_time = extension_time
+        if offset is not None:
+            controller.offset = offset
+        if plan is not None:
+            controller.plan = plan
+            controller.reset()
+
+    # offsets for an eastbound (EW) or northbound (NS) green wave: each intersection turns green
+    # later by the travel time from x = 0 (or y = 0) at the given speed (world units per second)
+    def green_wave(self, speed, phase=Phase.EW):
+        positions = self.geometry.positions
+        for node, controller in self.controllers.items():
+            x, y = positions[node]
+            distance = x if phase == Phase.EW else y
+            start = 0 if phase == Phase.NS else controller.green_time + controller.yellow_time
+            controller.offset = int(start - distance / speed * 1000) % (2 * (controller.green_time + controller.yellow_time))
+
+    def start(self):
+        for controller in self.bank:
+            controller.start()
+
+    def reset(self):
+        for controller in self.bank:
+            controller.reset()
+
+    def tick(self, dt):
+        for controller in self.bank:
+            controller.tick(dt)
+
+    @property
+    def time_debt(self):
+        return sum(controller.time_debt for controller in self.bank)
+
+    @property
+    def extension_granted(self):
+        return sum(controller.extension_granted for controller in self.bank)
+
+    def get_color(self, approach):
+        return self.controller_of[approach].get_color(approach)
+
+    def request_priority(self, approach):
+        controller = self.controller_of.get(approach)
+        return controller is not None and controller.request_priority(approach)
+
+    def accepts_priority(self, approach):
+        controller = self.controller_of.get(approach)
+        return controller is not None and controller.accepts_priority(approach)
+
+    def would_be_red_without_tsp(self, approach, time):
+        if approach is None:
+            return False
+        return self.controller_of[approach].would_be_red_without_tsp(approach, time)
+
+    def natural_green(self, approach):
+        return self.controller_of[approach].natural_green(approach)
+
+    def approach_phase(self, approach):
+        controller = self.controller_of.get(approach)
+        return None if controller is None else controller.approach_phase(approach)
+
+    def clear_notice(self):
+        pass
+
+
+# an N×M grid with a controller at every intersection
+def grid_network(rows, cols, spacing=240, green_time=1200, yellow_time=500, extension_time=700, offsets=None):
+    return Network(grid_geometry(rows, cols, spacing), green_time, yellow_time, extension_time, offsets)
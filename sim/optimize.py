@@ -0,0 +1,247 @@
+# Search the signal timings of one route for the fastest recovery of the late bus, and the trade-off
+# between recovery time and the green time taken from the cross street (the total extension time
+# granted during the run, whether or not it was repaid):
+#
+#     python -m sim.optimize --path 7-8-9-6 --lane R --delay 5000 --debt-cap 1400
+#
+# A coarse grid over --green, --yellow and --extension (inclusive start:stop ranges, in ms) is refined
+# around the Pareto front for --levels rounds, halving the step each time down to --resolution.
+# Candidates run in parallel. A run that has not recovered after --slack times the best recovery so far
+# is stopped if some candidate already recovered by then with no more extension time than the run has
+# been granted (it can only get slower and take more); otherwise it runs on to --max-time. Stopped runs
+# are left out of the front. Results come from and go to the results cache (sim/cache.py) unless
+# --no-cache is given.
+import argparse
+import csv
+import itertools
+import math
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from sim.cache import ResultCache, default_path, fingerprint
+from sim.engine import run_scenario
+
+# one evaluated timing; recovery_time is None if the run was stopped or did not recover, and then
+# extension_granted is what had been granted by the end of the run
+Candidate = namedtuple("Candidate", [
+    "green_time", "yellow_time", "extension_time", "recovery_time", "extension_granted", "stopped",
+])
+
+
+# "600:3000" -> (600, 3000)
+def parse_range(text):
+    lo, _, hi = text.partition(":")
+    return int(lo), int(hi or lo)
+
+
+# n values spread over [lo, hi], rounded to the resolution
+def spread(lo, hi, n, resolution):
+    if n < 2 or hi <= lo:
+        return [lo]
+    return sorted({snap(lo + (hi - lo) * i / (n - 1), lo, hi, resolution) for i in range(n)})
+
+
+def snap(value, lo, hi, resolution):
+    return min(hi, max(lo, int(round(value / resolution)) * resolution))
+
+
+# candidates neither faster nor cheaper than another, by recovery time then extension time granted
+def pareto_front(candidates):
+    front = []
+    for c in sorted((c for c in candidates if c.recovery_time is not None),
+                    key=lambda c: (c.recovery_time, c.extension_granted)):
+        if not front or c.extension_granted < front[-1].extension_granted:
+            front.append(c)
+    return front
+
+
+# the fastest candidate within the debt cap, or None
+def best_within(candidates, debt_cap):
+    feasible = [c for c in candidates if c.recovery_time is not None and c.extension_granted <= debt_cap]
+    return min(feasible, key=lambda c: (c.recovery_time, c.extension_granted), default=None)
+
+
+# whether a run still late at the cutoff (ms), having been granted this much extension time, is already
+# beaten on both axes by a point of the front (recovery time, extension granted)
+def dominated(front, cutoff, granted):
+    return any(recovery * 1000 <= cutoff and g <= granted for recovery, g in front)
+
+
+# worker entry point: run each timing, stopping at the cutoff (ms) the runs that are dominated by then
+def run_candidates(path, lane, delay, timings, cutoff, front, max_time):
+    results = []
+    for timing in timings:
+        result = run_scenario(path, lane, *timing, delay=delay, max_time=cutoff)
+        stopped = result.recovery_time is None and cutoff < max_time
+        if stopped and not dominated(front, cutoff, result.extension_granted):
+            result = run_scenario(path, lane, *timing, delay=delay, max_time=max_time)
+            stopped = False
+        results.append((timing, result, stopped))
+    return results
+
+
+class Optimizer:
+    def __init__(self, path, lane="R", delay=5000, green=(100, 5000), yellow=(100, 5000), extension=(0, 5000),
+                 debt_cap=math.inf, points=5, levels=3, resolution=100, slack=2.0, max_time=600000,
+                 workers=None, chunk_size=8, cache=None):
+        self.path = list(path)
+        self.lane = lane
+        self.delay = delay
+        self.ranges = (green, yellow, extension)
+        self.debt_cap = debt_cap
+        self.points = points
+        self.levels = levels
+        self.resolution = resolution
+        self.slack = slack
+        self.max_time = max_time
+        self.workers = workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.cache = cache
+
+        self.evaluated = {}     # timing -> Candidate
+        self.runs = 0           # scenarios run (not found in the cache)
+        self.stopped = 0        # runs stopped at the cutoff as dominated
+
+    def key(self, timing):
+        return fingerprint(self.path, self.lane, *timing, self.delay, max_time=self.max_time)
+
+    # a candidate that has not recovered by then clearly loses to the best so far
+    def cutoff(self):
+        best = best_within(self.evaluated.values(), self.debt_cap)
+        if best is None:
+            return self.max_time
+        return min(self.max_time, int(best.recovery_time * 1000 * self.slack) + 1)
+
+    # Chunks are submitted as workers free up, each with the cutoff and front of the candidates
+    # evaluated so far, so that every level (the coarse grid too) stops its losers early.
+    def evaluate(self, timings, pool):
+        timings = [t for t in dict.fromkeys(timings) if t not in self.evaluated]
+
+        keys = {self.key(timing): timing for timing in timings}
+        found = self.cache.get_many(keys) if self.cache is not None else {}
+        for key, result in found.items():
+            self.add(keys[key], result)
+        todo = [timing for key, timing in keys.items() if key not in found]
+
+        chunks = [todo[i:i + self.chunk_size] for i in range(0, len(todo), self.chunk_size)]
+        chunks.reverse()
+        running = set()
+        stored = []
+        while chunks or running:
+            while chunks and len(running) < self.workers:
+                front = [(c.recovery_time, c.extension_granted) for c in pareto_front(self.evaluated.values())]
+                running.add(pool.submit(run_candidates, self.path, self.lane, self.delay, chunks.pop(),
+                                        self.cutoff(), front, self.max_time))
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                for timing, result, stopped in future.result():
+                    self.runs += 1
+                    if stopped:
+                        self.stopped += 1
+                    else:
+                        stored.append((self.key(timing), result))
+                    self.add(timing, result, stopped)
+        if self.cache is not None and stored:
+            self.cache.put_many(stored)
+
+    def add(self, timing, result, stopped=False):
+        self.evaluated[timing] = Candidate(*timing, result.recovery_time, result.extension_granted, stopped)
+
+    # the coarse grid, then finer grids around the front (and the best feasible candidate)
+    def run(self, progress=None):
+        steps = [max(self.resolution, (hi - lo) / max(1, self.points - 1)) for lo, hi in self.ranges]
+        axes = [spread(lo, hi, self.points, self.resolution) for lo, hi in self.ranges]
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            self.evaluate(list(itertools.product(*axes)), pool)
+            if progress:
+                progress(self, 0)
+
+            for level in range(1, self.levels + 1):
+                steps = [max(self.resolution, step / 2) for step in steps]
+                centres = set(pareto_front(self.evaluated.values()))
+                best = best_within(self.evaluated.values(), self.debt_cap)
+                if best is not None:
+                    centres.add(best)
+
+                timings = []
+                for c in centres:
+                    timing = (c.green_time, c.yellow_time, c.extension_time)
+                    axes = [
+                        sorted({snap(v + d * step, lo, hi, self.resolution) for d in (-1, 0, 1)})
+                        for v, step, (lo, hi) in zip(timing, steps, self.ranges)
+                    ]
+                    timings.extend(itertools.product(*axes))
+                self.evaluate(timings, pool)
+                if progress:
+                    progress(self, level)
+
+        return best_within(self.evaluated.values(), self.debt_cap), pareto_front(self.evaluated.values())
+
+
+def write_csv(path, candidates):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(Candidate._fields)
+        for c in sorted(candidates):
+            writer.writerow(c)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Optimize the signal timings of one route for TSP.")
+    parser.add_argument("--path", default="7-8-9-6", help="grid nodes, e.g. 7-8-9-6")
+    parser.add_argument("--lane", default="R", choices=("R", "L"))
+    parser.add_argument("--delay", type=int, default=5000, help="initial delay of the late bus (ms)")
+    parser.add_argument("--green", default="100:5000", help="green time range (ms)")
+    parser.add_argument("--yellow", default="100:5000", help="yellow time range (ms)")
+    parser.add_argument("--extension", default="0:5000", help="TSP extension range (ms)")
+    parser.add_argument("--debt-cap", type=float, default=math.inf, help="most extension time granted (ms)")
+    parser.add_argument("--points", type=int, default=5, help="grid points per axis in the coarse grid")
+    parser.add_argument("--levels", type=int, default=3, help="refinement rounds")
+    parser.add_argument("--resolution", type=int, default=100, help="finest step (ms)")
+    parser.add_argument("--slack", type=float, default=2.0,
+                        help="stop dominated runs slower than this times the best")
+    parser.add_argument("--max-time", type=int, default=600000, help="give up on a run after this long (ms)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--cache", default=default_path, help="results cache (sqlite)")
+    parser.add_argument("--no-cache", action="store_true", help="run every candidate and leave the cache alone")
+    parser.add_argument("-o", "--output", help="CSV file for every evaluated candidate")
+    args = parser.parse_args(argv)
+
+    cache = None if args.no_cache else ResultCache(args.cache)
+    optimizer = Optimizer(
+        [int(n) for n in args.path.split("-")], args.lane, args.delay,
+        parse_range(args.green), parse_range(args.yellow), parse_range(args.extension),
+        args.debt_cap, args.points, args.levels, args.resolution, args.slack, args.max_time,
+        args.workers, cache=cache,
+    )
+
+    def progress(optimizer, level):
+        sys.stderr.write(f"level {level}: {len(optimizer.evaluated)} candidates, {optimizer.runs} run, "
+                         f"{optimizer.stopped} stopped early as dominated (left out of the front)\n")
+
+    best, front = optimizer.run(progress)
+    if cache is not None:
+        cache.close()
+    if args.output:
+        write_csv(args.output, optimizer.evaluated.values())
+
+    sys.stdout.write("green  yellow  extension  recovery (s)  extension granted (ms)\n")
+    for c in front:
+        mark = "  *" if c == best else ""
+        sys.stdout.write(f"{c.green_time:>5}  {c.yellow_time:>6}  {c.extension_time:>9}  "
+                         f"{c.recovery_time:>12.2f}  {c.extension_granted:>22.0f}{mark}\n")
+    if optimizer.stopped:
+        sys.stdout.write(f"{optimizer.stopped} dominated runs were stopped early and are not in the front\n")
+    if best is None:
+        sys.stdout.write("no timing recovers within the debt cap\n")
+    elif best not in front:
+        sys.stdout.write(f"best within the debt cap: green {best.green_time}, yellow {best.yellow_time}, "
+                         f"extension {best.extension_time}: {best.recovery_time:.2f} s, "
+                         f"{best.extension_granted:.0f} ms extension granted\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import matplotlib.ticker
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.figure import Figure
+
+from sim.history import DelayHistory
+
+
+# Live delay plot. The axes are drawn once and cached; each refresh only blits the two lines.
+# The axes are redrawn only when the data leaves the current view (which then grows with headroom).
+# The samples live in a DelayHistory that may be filled before the plot exists or while it is hidden;
+# the next refresh shows all of them.
+class LivePlot:
+    def __init__(self, master, history=None, initial_delay=0):
+        self.history = history if history is not None else DelayHistory()
+
+        self.fig = Figure(figsize=(5, 4), dpi=100)
+        self.ax = self.fig.add_subplot(111)
+        ax = self.ax
+
+        ax.set_xlabel("Simulation Time (s)", fontweight="bold", fontfamily="Arial", fontsize=12, labelpad=10)
+        ax.set_ylabel("Delay (s)", fontweight="bold", fontfamily="Arial", fontsize=12)
+        ax.set_title("Delay Recovery", fontweight="bold", fontfamily="Arial", fontsize=12)
+
+        # animated lines are left out of full draws and blitted over the cached background
+        self.line_tsp,    = ax.plot([], [], label="With TSP",    color="blue", animated=True)
+        self.line_shadow, = ax.plot([], [], label="Without TSP", color="red",  animated=True)
+        ax.legend()
+
+        ax.spines["top"].set_visible(False)
+        ax.spines["right"].set_visible(False)
+        ax.yaxis.set_major_formatter(matplotlib.ticker.FormatStrFormatter('%.2f'))
+        ax.xaxis.set_major_formatter(matplotlib.ticker.FormatStrFormatter('%.2f'))
+
+        self.canvas = FigureCanvasTkAgg(self.fig, master=master)
+        self.canvas.get_tk_widget().pack(fill="both", expand=True)
+        self.fig.tight_layout()
+
+        # every full draw (resize, tab switch, rescale) refreshes the cached background
+        self.background = None
+        self.canvas.mpl_connect("draw_event", self.on_draw)
+
+        self.set_view(initial_delay)
+
+    def append(self, time, delay_tsp, delay_shadow):
+        self.history.append(time, delay_tsp, delay_shadow)
+
+    # show the samples appended since the last refresh
+    def refresh(self):
+        history = self.history
+        self.line_tsp.set_data(history.times, history.delay_tsp)
+        self.line_shadow.set_data(history.times, history.delay_shadow)
+
+        if self.rescale() or self.background is None:
+            self.canvas.draw() # redraws the axes, then blits the lines (on_draw)
+        else:
+            self.blit()
+
+    # grow the view if the data left it; True if the axes need redrawing
+    def rescale(self):
+        history = self.history
+        if history.count == 0:
+            return False
+
+        x0, x1 = self.ax.get_xlim()
+        y0, y1 = self.ax.get_ylim()
+        t = history.times[-1]
+        low = min(history.delay_tsp.min(), history.delay_shadow.min())
+        high = max(history.delay_tsp.max(), history.delay_shadow.max())
+
+        changed = False
+        if t > x1:
+            self.ax.set_xlim(x0, max(t, x0 + (x1 - x0) * 2)) # double the time span
+            changed = True
+        if high > y1 or low < y0:
+            self.ax.set_ylim(min(y0, low * 1.2), max(y1, high * 1.2))
+            changed = True
+        return changed
+
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_lines()
+
+    def blit(self):
+        self.canvas.restore_region(self.background)
+        self.draw_lines()
+
+    def draw_lines(self):
+        self.ax.draw_artist(self.line_tsp)
+        self.ax.draw_artist(self.line_shadow)
+        self.canvas.blit(self.fig.bbox)
+
+    # clear the history and start again with a view sized for the initial delay (s)
+    def reset(self, initial_delay=0):
+        self.history.clear()
+        self.set_view(initial_delay)
+
+    def set_view(self, initial_delay=0):
+        self.line_tsp.set_data([], [])
+        self.line_shadow.set_data([], [])
+        self.ax.set_xlim(0, 10)
+        self.ax.set_ylim(0, max(1.0, initial_delay * 1.2))
+        self.canvas.draw()
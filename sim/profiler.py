@@ -0,0 +1,111 @@
+import csv
+from collections import deque
+from itertools import islice
+from time import perf_counter
+
+# parts of a frame, in the order they run
+sections = ("controller", "bus", "base_shadow", "late_shadow", "plot", "labels", "draw")
+
+
+# Frame timing: the time spent in each section of a frame (summed over the ticks it ran), the whole
+# frame, and how late its timer fired. The last `window` frames give rolling percentiles; up to
+# `history` frames are kept for CSV export.
+class TickProfiler:
+    def __init__(self, window=500, history=100000):
+        self.window = window
+        self.frames = deque(maxlen=history)   # (frame, time, ticks, timer_late, frame, *sections) in s
+        self.count = 0
+        self.started = perf_counter()
+        self.begin_frame()
+
+    def begin_frame(self, timer_late=0.0):
+        self.frame_start = perf_counter()
+        self.timer_late = timer_late
+        self.ticks = 0
+        self.totals = dict.fromkeys(sections, 0.0)
+
+    # add the time since t to a section; returns the current time for the next section
+    def lap(self, section, t):
+        now = perf_counter()
+        self.totals[section] += now - t
+        return now
+
+    def end_frame(self, ticks):
+        now = perf_counter()
+        self.frames.append((
+            self.count, now - self.started, ticks, self.timer_late, now - self.frame_start,
+            *self.totals.values(),
+        ))
+        self.count += 1
+
+    def clear(self):
+        self.frames.clear()
+        self.count = 0
+        self.started = perf_counter()
+        self.begin_frame()
+
+    # (name, p50, p95, p99, max) in ms for the timer lateness, the frame and each section
+    # over the last `window` frames
+    def percentiles(self):
+        recent = list(islice(self.frames, max(0, len(self.frames) - self.window), None))
+        rows = []
+        for i, name in enumerate(("timer_late", "frame") + sections, start=3):
+            values = sorted(frame[i] for frame in recent)
+            if not values:
+                continue
+            n = len(values)
+            rows.append((name,) + tuple(values[min(n - 1, int(q * n))] * 1000 for q in (0.5, 0.95, 0.99)) +
+                        (values[-1] * 1000,))
+        return rows
+
+    def write_csv(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(["frame", "time_s", "ticks", "timer_late_ms", "frame_ms"] +
+                            [name + "_ms" for name in sections])
+            for frame, t, ticks, *times in self.frames:
+                writer.writerow([frame, f"{t:.4f}", ticks] + [f"{v * 1000:.4f}" for v in times])
+
+
+# Percentile table drawn in the top left corner of the visible part of a Tk canvas (the turtle
+# canvas has its origin at the centre of the map, so the corner comes from the view)
+class TimingOverlay:
+    def __init__(self, canvas, profiler, every=25):
+        self.canvas = canvas
+        self.profiler = profiler
+        self.every = every              # frames between refreshes
+        self.item = None
+        self.bound = False
+
+    def show(self):
+        if self.item is None:
+            self.item = self.canvas.create_text(
+                0, 0, anchor="nw", font=("Courier", 10), fill="black", text="", tags="timings")
+        if not self.bound:
+            # added to turtle's own resize binding; never unbound, since unbind would drop that too
+            self.canvas.bind("<Configure>", lambda event: self.place(), add="+")
+            self.bound = True
+        self.refresh()
+
+    def place(self):
+        if self.item is not None:
+            self.canvas.coords(self.item, self.canvas.canvasx(0) + 10, self.canvas.canvasy(0) + 10)
+
+    def hide(self):
+        if self.item is not None:
+            self.canvas.delete(self.item)
+            self.item = None
+
+    def refresh(self):
+        if self.item is None:
+            return
+        lines = [f"{'ms':<12}{'p50':>7}{'p95':>7}{'p99':>7}{'max':>7}"]
+        for name, p50, p95, p99, top in self.profiler.percentiles():
+            lines.append(f"{name:<12}{p50:7.2f}{p95:7.2f}{p99:7.2f}{top:7.2f}")
+        self.canvas.itemconfigure(self.item, text="\n".join(lines))
+        self.place()
+        self.canvas.tag_raise(self.item)
+
+    def end_frame(self):
+        if self.item is not None and self.profiler.count % self.every == 0:
+            self.refresh()
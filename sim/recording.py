@@ -0,0 +1,159 @@
+import json
+import os
+import struct
+
+from sim.signal_model import states
+
+# Trajectory recording: a small header followed by one fixed-width record per simulated tick.
+#
+#     magic      8 bytes   b"TSPREC02"
+#     length     uint32    bytes of JSON that follow
+#     header     JSON      scenario, tick, record layout; padded with spaces to a multiple of 8 bytes
+#     records    RECORD_SIZE bytes each, little-endian, appended as the run goes
+#
+# The records match record_dtype(), so a recording can be memory-mapped with NumPy (open_recording).
+MAGIC = b"TSPREC02"
+
+fields = (
+    ("tick", "I", "<u4"),          # ticks since the bus started
+    ("phase", "B", "u1"),          # index of the phase in the controller's plan (0 NS, 1 EW)
+    ("state", "B", "u1"),          # 0 GREEN, 1 YELLOW, 2 ALL_RED
+    ("flags", "B", "u1"),          # EXTENDED | PRIORITY | LATE | EXTENSION_USED, and the bus heading
+    ("pad", "x", None),
+    ("x", "f", "<f4"),             # bus position
+    ("y", "f", "<f4"),
+    # distances grow without bound over a long run; doubles keep them exact to the tick
+    ("distance", "d", "<f8"),      # distance travelled by the bus
+    ("base_shadow", "d", "<f8"),   # distance of the on-time shadow
+    ("late_shadow", "d", "<f8"),   # distance of the late shadow without TSP
+    ("remaining", "f", "<f4"),     # ms left in the current signal state
+    ("time_debt", "f", "<f4"),     # ms of green owed by the controller
+)
+record_format = "<" + "".join(f for _, f, _ in fields)
+record_struct = struct.Struct(record_format)
+RECORD_SIZE = record_struct.size
+
+# flags
+EXTENDED = 1        # an extension was granted on this tick
+PRIORITY = 2        # the controller holds a priority request
+LATE = 4            # the bus is still late
+EXTENSION_USED = 8  # the current phase has been extended
+HEADING_SHIFT = 4   # bits 4-5: bus heading / 90
+
+
+# NumPy dtype of a record (the padding byte is skipped)
+def record_dtype():
+    import numpy as np
+
+    names, formats, offsets = [], [], []
+    offset = 0
+    for name, code, dtype in fields:
+        if name != "pad":
+            names.append(name)
+            formats.append(dtype)
+            offsets.append(offset)
+        offset += struct.calcsize("<" + code)
+    return np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": RECORD_SIZE})
+
+
+# Appends one record per Simulation.step; attach it as simulation.recorder.
+# Records are buffered and written in blocks, so a crash loses at most the last block.
+class TrajectoryRecorder:
+    def __init__(self, path, scenario=None, tick=20, go_speed=4, block=256):
+        self.path = path
+        self.block = block
+        self.buffer = bytearray()
+        self.pending = 0
+        self.count = 0
+        self.extension_used = False
+
+        header = {
+            "version": 3,
+            "scenario": scenario or {},
+            "tick": tick,
+            "go_speed": go_speed,
+            "record_size": RECORD_SIZE,
+            "fields": [[name, code] for name, _, code in fields if name != "pad"],
+        }
+        text = json.dumps(header).encode()
+        text += b" " * (-(len(MAGIC) + 4 + len(text)) % 8)
+
+        self.file = open(path, "wb")
+        self.file.write(MAGIC + struct.pack("<I", len(text)) + text)
+
+    def record(self, simulation):
+        controller = simulation.controller
+        bus = simulation.bus
+
+        flags = 0
+        if controller.extension_used and not self.extension_used:
+            flags |= EXTENDED
+        self.extension_used = controller.extension_used
+        if controller.priority_requested:
+            flags |= PRIORITY
+        if bus.is_late:
+            flags |= LATE
+        if controller.extension_used:
+            flags |= EXTENSION_USED
+        flags |= (int(bus.heading) // 90 % 4) << HEADING_SHIFT
+
+        self.buffer += record_struct.pack(
+            simulation.ticks,
+            controller.phase_index,
+            states.index(controller.state),
+            flags,
+            bus.x, bus.y, bus.distance_travelled,
+            simulation.base_shadow_distance, simulation.late_shadow_distance,
+            controller.remaining, controller.time_debt,
+        )
+        self.pending += 1
+        self.count += 1
+        if self.pending >= self.block:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.file.write(self.buffer)
+            self.buffer.clear()
+            self.pending = 0
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+
+# (header, offset of the first record) of a recording
+def read_header(path):
+    with open(path, "rb") as f:
+        magic = f.read(len(MAGIC))
+        if magic != MAGIC:
+            if magic.startswith(MAGIC[:6]):
+                raise ValueError(f"{path} is a trajectory recording in an older format; record it again")
+            raise ValueError(f"{path} is not a trajectory recording")
+        (length,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(length))
+    return header, len(MAGIC) + 4 + length
+
+
+# header and records of a recording, memory-mapped as a NumPy structured array (read-only);
+# a partly written last record is ignored
+def open_recording(path):
+    import numpy as np
+
+    header, offset = read_header(path)
+    count = (os.path.getsize(path) - offset) // header["record_size"]
+    if count == 0:
+        return header, np.zeros(0, dtype=record_dtype())
+    return header, np.memmap(path, dtype=record_dtype(), mode="r", offset=offset, shape=(count,))
+
+
+# header and records as tuples, without NumPy
+def read_recording(path):
+    header, offset = read_header(path)
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    usable = len(data) - len(data) % RECORD_SIZE
+    return header, list(record_struct.iter_unpack(data[:usable]))
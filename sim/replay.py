@@ -0,0 +1,78 @@
+from collections import namedtuple
+
+import numpy as np
+
+from sim.recording import EXTENDED, EXTENSION_USED, HEADING_SHIFT, LATE, PRIORITY, open_recording
+from sim.signal_model import Phase, states
+from sim.timing import TimingPlan
+
+# What the GUI shows at one recorded tick. Times and delays are in seconds.
+ReplayFrame = namedtuple("ReplayFrame", [
+    "index", "time", "x", "y", "heading",
+    "phase_index", "phase", "state", "remaining", "time_debt",
+    "extended", "extension_used", "priority", "late",
+    "delay_tsp", "delay_shadow",
+])
+
+
+# A recorded run, memory-mapped: any tick is read straight from the file, so seeking is
+# constant time and memory does not grow with the length of the recording.
+class Replay:
+    def __init__(self, path, scan_block=65536):
+        self.path = path
+        self.header, self.records = open_recording(path)
+        self.count = len(self.records)
+        self.tick = self.header["tick"]
+        self.go_speed = self.header.get("go_speed", 4)
+        self.initial_delay = self.header["scenario"].get("delay", 0) / 1000.0
+
+        # the timing plan the run used (None for the two-phase NS/EW timing) and its phase names
+        plan = self.header["scenario"].get("plan")
+        self.plan = TimingPlan(plan) if plan else None
+        self.phase_names = [p.name for p in self.plan.phases] if self.plan else [Phase.NS, Phase.EW]
+
+        # ticks on which an extension was granted, found a block at a time
+        extensions = []
+        for start in range(0, self.count, scan_block):
+            flags = self.records["flags"][start:start + scan_block]
+            extensions.append(np.flatnonzero(flags & EXTENDED) + start)
+        self.extensions = np.concatenate(extensions) if extensions else np.zeros(0, dtype=int)
+
+    def frame(self, i):
+        r = self.records[i]
+        flags = int(r["flags"])
+        dt = self.tick / 1000
+        go = self.go_speed
+
+        scheduled_time = float(r["base_shadow"]) / go * dt
+        return ReplayFrame(
+            index=i,
+            time=int(r["tick"]) * dt,
+            x=float(r["x"]),
+            y=float(r["y"]),
+            heading=(flags >> HEADING_SHIFT & 3) * 90,
+            phase_index=int(r["phase"]),
+            phase=self.phase_names[r["phase"]],
+            state=states[r["state"]],
+            remaining=float(r["remaining"]),
+            time_debt=float(r["time_debt"]),
+            extended=bool(flags & EXTENDED),
+            extension_used=bool(flags & EXTENSION_USED),
+            priority=bool(flags & PRIORITY),
+            late=bool(flags & LATE),
+            delay_tsp=max(0, scheduled_time - float(r["distance"]) / go * dt),
+            delay_shadow=max(0, scheduled_time - float(r["late_shadow"]) / go * dt),
+        )
+
+    # index of the next (or previous) extension grant after (before) record i, or None
+    def next_extension(self, i):
+        j = np.searchsorted(self.extensions, i, side="right")
+        return int(self.extensions[j]) if j < len(self.extensions) else None
+
+    def previous_extension(self, i):
+        j = np.searchsorted(self.extensions, i, side="left")
+        return int(self.extensions[j - 1]) if j > 0 else None
+
+    # the mapping is released once nothing refers to the records
+    def close(self):
+        self.records = None
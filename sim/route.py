@@ -0,0 +1,47 @@
+from bisect import bisect_right
+
+
+class RouteIndex:
+    def __init__(self, path, approaches, stoplines):
+        self.path = path
+
+        # cumulative distance at the start of each leg and the length of the full loop
+        self.leg_starts = []
+        running = 0
+        for i in range(len(path)):
+            p1 = path[i]
+            p2 = path[(i + 1) % len(path)]
+            self.leg_starts.append(running)
+            running += ((p2[0] - p1[0]) ** 2 + (p2[1] - p1[1]) ** 2) ** 0.5
+        self.loop_length = running
+
+        # first stopline on each leg (the one a shadow bus reacts to), or None
+        self.leg_approach = tuple(leg[0] if leg else None for leg in approaches)
+
+        # distance of each stopline within one loop, measured on the first leg it belongs to
+        self.stopline_offsets = {}
+        for i, leg in enumerate(approaches):
+            p1 = path[i]
+            p2 = path[(i + 1) % len(path)]
+            for key in leg:
+                if key in self.stopline_offsets:
+                    continue
+                s = stoplines[key]
+                if p1[1] == p2[1]:
+                    self.stopline_offsets[key] = self.leg_starts[i] + abs(s.x - p1[0])
+                else:
+                    self.stopline_offsets[key] = self.leg_starts[i] + abs(s.y - p1[1])
+
+    # index of the leg containing a distance along the route (wraps around the loop)
+    def leg_at(self, total_dist):
+        return bisect_right(self.leg_starts, total_dist % self.loop_length) - 1
+
+    def approach_at(self, total_dist):
+        return self.leg_approach[self.leg_at(total_dist)]
+
+    # absolute distance to a stopline on the lap containing total_dist
+    def stopline_distance(self, key, total_dist=None):
+        offset = self.stopline_offsets.get(key)
+        if offset is None or total_dist is None:
+            return offset
+        return (total_dist // self.loop_length) * self.loop_length + offset
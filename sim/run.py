@@ -0,0 +1,136 @@
+# Run scenarios from the command line and print their metrics, without the GUI:
+#
+#     python -m sim.run --path 7-8-9-6 --lane R --green 1200 --yellow 500 --extension 700 --delay 5000
+#     python -m sim.run --scenario scenarios.json --format csv -o results.csv
+#     generate-scenarios | python -m sim.run --scenario - --format json
+#
+# A scenario file holds a JSON object, a list of them, or one object per line; its fields are path,
+# lane, green_time, yellow_time, extension_time, delay and max_time (times in ms), and missing fields
+# are taken from the arguments. Only the model modules are imported (no tkinter, matplotlib or NumPy),
+# so starting up takes tens of milliseconds.
+import argparse
+import json
+import sys
+
+from sim.engine import run_scenario
+from sim.geometry import valid_paths
+
+fields = ("path", "lane", "green_time", "yellow_time", "extension_time", "delay", "max_time")
+metrics = ("recovery_time", "delay_tsp", "delay_shadow", "recovered_tsp", "recovered_shadow", "time_debt")
+
+
+def parse_path(text):
+    return [int(n) for n in text.split("-")]
+
+
+# scenarios in a JSON document or JSON lines
+def read_scenarios(text):
+    text = text.strip()
+    if not text:
+        return []
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        data = [json.loads(line) for line in text.splitlines() if line.strip()]
+    return data if isinstance(data, list) else [data]
+
+
+def complete(scenario, base):
+    if not isinstance(scenario, dict):
+        raise ValueError("a scenario must be a JSON object")
+    unknown = set(scenario) - set(fields)
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(sorted(unknown))}")
+    scenario = dict(base, **scenario)
+    if isinstance(scenario["path"], str):
+        scenario["path"] = parse_path(scenario["path"])
+    if scenario["path"] not in valid_paths():
+        raise ValueError(f"not a valid path: {scenario['path']}")
+    if scenario["lane"] not in ("R", "L"):
+        raise ValueError("lane must be R or L")
+    for field in fields[2:]:
+        value = scenario[field]
+        if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            raise ValueError(f"{field} must be a non-negative whole number of ms, not {json.dumps(value)}")
+    if scenario["green_time"] == 0:
+        raise ValueError("green_time must be positive")
+    return scenario
+
+
+def run(scenario, engine="event"):
+    return run_scenario(
+        scenario["path"], scenario["lane"], scenario["green_time"], scenario["yellow_time"],
+        scenario["extension_time"], scenario["delay"], max_time=scenario["max_time"], engine=engine,
+    )
+
+
+def format_text(scenario, result):
+    recovery = "-" if result.recovery_time is None else f"{result.recovery_time:.2f}"
+    return (
+        f"{'-'.join(str(n) for n in scenario['path'])} {scenario['lane']} "
+        f"green {scenario['green_time']} yellow {scenario['yellow_time']} extension {scenario['extension_time']} "
+        f"delay {scenario['delay']}: recovery {recovery} s, delay {result.delay_tsp:.2f} s with TSP, "
+        f"{result.delay_shadow:.2f} s without, time debt {result.time_debt:.0f} ms"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run scenarios headless and print their metrics.")
+    parser.add_argument("--path", default="7-8-9-6", help="grid nodes, e.g. 7-8-9-6")
+    parser.add_argument("--lane", default="R", choices=("R", "L"))
+    parser.add_argument("--green", type=int, default=1200, help="green time (ms)")
+    parser.add_argument("--yellow", type=int, default=500, help="yellow time (ms)")
+    parser.add_argument("--extension", type=int, default=700, help="TSP extension time (ms)")
+    parser.add_argument("--delay", type=int, default=5000, help="initial delay of the late bus (ms)")
+    parser.add_argument("--max-time", type=int, default=600000, help="give up after this long (ms)")
+    parser.add_argument("--scenario", help="JSON file of scenarios ('-' for stdin)")
+    parser.add_argument("--engine", default="event", choices=("event", "tick"))
+    parser.add_argument("--format", default="text", choices=("text", "json", "csv"))
+    parser.add_argument("-o", "--output", help="file to write (default stdout)")
+    args = parser.parse_args(argv)
+
+    # --path stays text here; complete() parses it, so a bad one is reported like any bad scenario
+    base = dict(
+        path=args.path, lane=args.lane, green_time=args.green, yellow_time=args.yellow,
+        extension_time=args.extension, delay=args.delay, max_time=args.max_time,
+    )
+    if args.scenario is None:
+        scenarios = [base]
+    elif args.scenario == "-":
+        scenarios = read_scenarios(sys.stdin.read())
+    else:
+        with open(args.scenario) as f:
+            scenarios = read_scenarios(f.read())
+
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        if args.format == "csv":
+            import csv
+
+            writer = csv.writer(out, lineterminator="\n")
+            writer.writerow(fields + metrics)
+
+        for scenario in scenarios:
+            try:
+                scenario = complete(scenario, base)
+                result = run(scenario, args.engine)
+            except (ValueError, KeyError, IndexError) as e:
+                sys.stderr.write(f"bad scenario {json.dumps(scenario)}: {e}\n")
+                return 2
+
+            if args.format == "json":
+                record = dict(scenario, **{m: getattr(result, m) for m in metrics})
+                out.write(json.dumps(record) + "\n")
+            elif args.format == "csv":
+                path = "-".join(str(n) for n in scenario["path"])
+                writer.writerow([path] + [scenario[f] for f in fields[1:]] + [getattr(result, m) for m in metrics])
+            else:
+                out.write(format_text(scenario, result) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
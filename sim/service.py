@@ -0,0 +1,483 @@
+# Local simulation service: headless sessions run on a pool of worker processes and are served
+# over HTTP and WebSocket on localhost (standard library only, so it works offline):
+#
+#     python -m sim.service --port 8765 --workers 4
+#
+#     POST   /sessions              {"path": [7, 8, 9, 6], "lane": "R", "green_time": 1200, "yellow_time": 500,
+#                                    "extension_time": 700, "delay": 5000}  ->  201 {"id": ..., ...}
+#     GET    /sessions              every session and its status
+#     GET    /sessions/<id>         status, and the result once finished
+#     GET    /sessions/<id>/series  delay samples so far; ?since=n skips the first n
+#     DELETE /sessions/<id>         forget a session
+#     GET    /sessions/<id>/stream  WebSocket: JSON messages {"type": "samples", "samples": [[t, tsp, shadow], ...]}
+#                                   as the run goes, then {"type": "result", ...} or {"type": "error", ...}
+#
+# A scenario may also give "max_time" (ms) and "speed" (simulated seconds per real second; by default
+# runs go as fast as they can). Samples are taken like the live plot's. Finished results with their
+# series are added to the results cache (sim/cache.py), and a scenario found there is answered at once.
+# The service is for local scripts and tools: requests sent by web pages (with an Origin header) are
+# refused, so a page open in a browser cannot start runs or read them.
+import argparse
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import signal
+import struct
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlsplit
+
+from sim.cache import ResultCache, default_path, fingerprint
+from sim.engine import build
+from sim.geometry import valid_paths
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+defaults = dict(lane="R", green_time=1200, yellow_time=500, extension_time=700, delay=5000, max_time=600000,
+                speed=None)
+
+
+# scenario from a request body, with defaults filled in; ValueError if it is not one the map allows
+def parse_scenario(body):
+    if not isinstance(body, dict):
+        raise ValueError("expected a JSON object")
+    unknown = set(body) - set(defaults) - {"path"}
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(sorted(unknown))}")
+
+    scenario = dict(defaults, **body)
+    if scenario.get("path") not in valid_paths():
+        raise ValueError(f"not a valid path: {scenario.get('path')!r}")
+    if scenario["lane"] not in ("R", "L"):
+        raise ValueError("lane must be R or L")
+    for name in ("green_time", "yellow_time", "extension_time", "delay", "max_time"):
+        value = scenario[name]
+        if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            raise ValueError(f"{name} must be a non-negative integer (ms)")
+    if scenario["green_time"] == 0 or scenario["yellow_time"] == 0:
+        raise ValueError("green_time and yellow_time must be positive")
+    speed = scenario["speed"]
+    if speed is not None and not (isinstance(speed, (int, float)) and not isinstance(speed, bool) and speed > 0):
+        raise ValueError("speed must be a positive number")
+    return scenario
+
+
+def scenario_key(scenario):
+    return fingerprint(
+        scenario["path"], scenario["lane"], scenario["green_time"], scenario["yellow_time"],
+        scenario["extension_time"], scenario["delay"], max_time=scenario["max_time"],
+    )
+
+
+def result_fields(result):
+    fields = result._asdict()
+    del fields["series"]
+    return fields
+
+
+# Worker process: runs sessions from the job queue in slices of simulated time, putting
+# (session id, kind, payload) messages for the service on the message queue: "started" with its
+# pid when it takes a session, then samples after each slice.
+def worker(jobs, messages, slice_time=5000):
+    pid = os.getpid()
+    for session_id, scenario in iter(jobs.get, None):
+        messages.put((session_id, "started", pid))
+        try:
+            simulation = build(
+                scenario["path"], scenario["lane"], scenario["green_time"], scenario["yellow_time"],
+                scenario["extension_time"], scenario["delay"],
+            )
+            simulation.record = True
+            speed = scenario["speed"]
+            started = time.monotonic()
+            sent = 0
+            until = 0
+            while True:
+                until = min(until + slice_time, scenario["max_time"])
+                if speed:
+                    time.sleep(max(0.0, started + until / 1000 / speed - time.monotonic()))
+                result = simulation.run(until)
+
+                samples = list(zip(simulation.times[sent:], simulation.delay_tsp[sent:], simulation.delay_shadow[sent:]))
+                if samples:
+                    messages.put((session_id, "samples", samples))
+                    sent += len(samples)
+                if not simulation.bus.is_late or until >= scenario["max_time"]:
+                    break
+            messages.put((session_id, "result", result))
+        except Exception:
+            messages.put((session_id, "error", traceback.format_exc()))
+
+
+class Session:
+    def __init__(self, session_id, scenario):
+        self.id = session_id
+        self.scenario = scenario
+        self.status = "queued"          # queued, running, done, failed
+        self.worker = None              # pid of the worker process running it
+        self.samples = []               # [time (s), delay with TSP (s), delay without TSP (s)]
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.subscribers = set()        # asyncio queues of open streams
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def describe(self):
+        info = dict(id=self.id, status=self.status, scenario=self.scenario, samples=len(self.samples))
+        if self.result is not None:
+            info["result"] = result_fields(self.result)
+        if self.error is not None:
+            info["error"] = self.error
+        return info
+
+    def publish(self, message):
+        for queue in self.subscribers:
+            queue.put_nowait(message)
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+reasons = {200: "OK", 201: "Created", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large", 426: "Upgrade Required",
+           500: "Internal Server Error"}
+
+
+# The service: sessions in memory (the oldest finished ones are dropped past keep_sessions),
+# a pool of worker processes, and one thread passing their messages to the event loop.
+# Workers are checked every watch_interval seconds; the sessions of one that died fail, and it is replaced.
+class SimulationService:
+    def __init__(self, workers=None, cache=None, keep_sessions=10000, slice_time=5000, watch_interval=1.0):
+        self.workers = workers or os.cpu_count()
+        self.cache = cache
+        self.keep_sessions = keep_sessions
+        self.slice_time = slice_time
+        self.watch_interval = watch_interval
+        self.sessions = OrderedDict()
+        self.ids = itertools.count(1)
+        self.loop = None
+        self.processes = []
+        self.watcher = None
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.context = multiprocessing.get_context("spawn")
+        self.jobs = self.context.Queue()
+        self.messages = self.context.Queue()
+        for _ in range(self.workers):
+            self.processes.append(self.spawn())
+        threading.Thread(target=self.pump, daemon=True).start()
+        self.watcher = self.loop.create_task(self.watch())
+
+    def spawn(self):
+        process = self.context.Process(target=worker, args=(self.jobs, self.messages, self.slice_time), daemon=True)
+        process.start()
+        return process
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.watch_interval)
+            self.check_workers()
+
+    # fail the sessions of workers that died, and start new workers in their place
+    def check_workers(self):
+        for i, process in enumerate(self.processes):
+            if process.is_alive():
+                continue
+            error = f"worker process died (exit code {process.exitcode})"
+            for session in self.sessions.values():
+                if session.worker == process.pid and not session.finished:
+                    self.dispatch(session.id, "error", error)
+            self.processes[i] = self.spawn()
+
+    def stop(self):
+        if self.watcher is not None:
+            self.watcher.cancel()
+            self.watcher = None
+        for _ in self.processes:
+            self.jobs.put(None)
+        self.messages.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+
+    def pump(self):
+        for message in iter(self.messages.get, None):
+            self.loop.call_soon_threadsafe(self.dispatch, *message)
+
+    def submit(self, scenario):
+        session = Session(str(next(self.ids)), scenario)
+        self.sessions[session.id] = session
+        self.prune()
+
+        cached = self.cache.get(scenario_key(scenario)) if self.cache is not None else None
+        if cached is not None and cached.series[0]:
+            session.samples = [list(s) for s in zip(*cached.series)]
+            session.result = cached
+            session.status = "done"
+        else:
+            self.jobs.put((session.id, scenario))
+        return session
+
+    # message from a worker
+    def dispatch(self, session_id, kind, payload):
+        session = self.sessions.get(session_id)
+        if session is None:
+            return                      # forgotten while it ran
+        if kind == "started":
+            session.status = "running"
+            session.worker = payload
+        elif kind == "samples":
+            session.status = "running"
+            session.samples.extend(list(s) for s in payload)
+            session.publish({"type": "samples", "samples": [list(s) for s in payload]})
+        elif kind == "result":
+            session.status = "done"
+            session.result = payload
+            session.publish(dict(type="result", **result_fields(payload)))
+            if self.cache is not None:
+                series = tuple(list(column) for column in zip(*session.samples)) or ([], [], [])
+                self.cache.put(scenario_key(session.scenario), payload._replace(series=series))
+        else:
+            session.status = "failed"
+            session.error = payload
+            session.publish({"type": "error", "error": payload})
+
+    def prune(self):
+        excess = len(self.sessions) - self.keep_sessions
+        for session in [s for s in self.sessions.values() if s.finished][:max(0, excess)]:
+            del self.sessions[session.id]
+
+    def session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HttpError(404, f"no session {session_id}")
+        return session
+
+    # -- HTTP
+
+    async def handle(self, reader, writer):
+        try:
+            method, target, headers, body = await read_request(reader)
+            if "origin" in headers:
+                raise HttpError(403, "requests from web pages are not accepted")
+            url = urlsplit(target)
+            parts = [p for p in url.path.split("/") if p]
+            if headers.get("upgrade", "").lower() == "websocket":
+                await self.stream(reader, writer, parts, headers)
+                return
+            status, payload = self.route(method, parts, parse_qs(url.query), body)
+        except HttpError as e:
+            status, payload = e.status, {"error": str(e)}
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        except Exception:
+            status, payload = 500, {"error": traceback.format_exc()}
+
+        data = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {reasons[status]}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode()
+            + data
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    def route(self, method, parts, query, body):
+        if parts == ["sessions"]:
+            if method == "GET":
+                return 200, [s.describe() for s in self.sessions.values()]
+            if method == "POST":
+                try:
+                    scenario = parse_scenario(json.loads(body or b"{}"))
+                except ValueError as e:
+                    raise HttpError(400, str(e))
+                return 201, self.submit(scenario).describe()
+        elif len(parts) == 2 and parts[0] == "sessions":
+            session = self.session(parts[1])
+            if method == "GET":
+                return 200, session.describe()
+            if method == "DELETE":
+                del self.sessions[session.id]
+                return 200, {"id": session.id, "deleted": True}
+        elif len(parts) == 3 and parts[0] == "sessions" and parts[2] == "series":
+            session = self.session(parts[1])
+            if method == "GET":
+                try:
+                    since = int(query.get("since", ["0"])[0])
+                except ValueError:
+                    since = -1
+                if since < 0:
+                    raise HttpError(400, "since must be a non-negative integer")
+                return 200, {"id": session.id, "status": session.status, "since": since,
+                             "samples": session.samples[since:]}
+        elif len(parts) == 3 and parts[0] == "sessions" and parts[2] == "stream":
+            raise HttpError(426, "the stream is a WebSocket")
+        else:
+            raise HttpError(404, "not found")
+        raise HttpError(405, f"{method} not allowed")
+
+    # -- WebSocket
+
+    async def stream(self, reader, writer, parts, headers):
+        if len(parts) != 3 or parts[0] != "sessions" or parts[2] != "stream":
+            raise HttpError(404, "not found")
+        session = self.session(parts[1])
+
+        accept = base64.b64encode(hashlib.sha1((headers["sec-websocket-key"] + WEBSOCKET_GUID).encode()).digest())
+        writer.write(
+            b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n"
+        )
+
+        # what happened so far, then everything new
+        queue = asyncio.Queue()
+        if session.samples:
+            queue.put_nowait({"type": "samples", "samples": list(session.samples)})
+        if session.result is not None:
+            queue.put_nowait(dict(type="result", **result_fields(session.result)))
+        elif session.error is not None:
+            queue.put_nowait({"type": "error", "error": session.error})
+        else:
+            session.subscribers.add(queue)
+
+        closed = asyncio.ensure_future(read_until_close(reader, writer))
+        try:
+            while True:
+                get = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({get, closed}, return_when=asyncio.FIRST_COMPLETED)
+                if get not in done:
+                    get.cancel()
+                    break
+                message = get.result()
+                writer.write(ws_frame(json.dumps(message).encode()))
+                await writer.drain()
+                if message["type"] in ("result", "error"):
+                    writer.write(ws_frame(struct.pack("!H", 1000), opcode=0x8))
+                    await writer.drain()
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            session.subscribers.discard(queue)
+            closed.cancel()
+            writer.close()
+
+
+# (method, target, headers with lower-case names, body) of one HTTP request
+async def read_request(reader, max_body=1 << 20):
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "bad request line")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise HttpError(400, "bad Content-Length")
+    if length > max_body:
+        raise HttpError(413, "request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method, target, headers, body
+
+
+# one unmasked, unfragmented frame (servers do not mask)
+def ws_frame(payload, opcode=0x1):
+    n = len(payload)
+    if n < 126:
+        header = struct.pack("!BB", 0x80 | opcode, n)
+    elif n < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, n)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, n)
+    return header + payload
+
+
+# (opcode, payload) of one client frame; client frames are masked
+async def read_ws_frame(reader):
+    first, second = await reader.readexactly(2)
+    n = second & 0x7F
+    if n == 126:
+        (n,) = struct.unpack("!H", await reader.readexactly(2))
+    elif n == 127:
+        (n,) = struct.unpack("!Q", await reader.readexactly(8))
+    mask = await reader.readexactly(4) if second & 0x80 else b"\0\0\0\0"
+    payload = bytes(b ^ mask[i % 4] for i, b in enumerate(await reader.readexactly(n)))
+    return first & 0x0F, payload
+
+
+# answer pings and return once the client closes (clients have nothing else to say)
+async def read_until_close(reader, writer):
+    try:
+        while True:
+            opcode, payload = await read_ws_frame(reader)
+            if opcode == 0x8:
+                return
+            if opcode == 0x9:
+                writer.write(ws_frame(payload, opcode=0xA))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return
+
+
+async def serve(host, port, workers, cache):
+    service = SimulationService(workers, cache)
+    service.start()
+    server = await asyncio.start_server(service.handle, host, port)
+    sys.stderr.write(f"serving on http://{host}:{port} with {service.workers} workers\n")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve headless simulations over HTTP and WebSocket.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--cache", default=default_path, help="results cache (sqlite)")
+    parser.add_argument("--no-cache", action="store_true", help="always run, and leave the cache alone")
+    args = parser.parse_args(argv)
+
+    cache = None if args.no_cache else ResultCache(args.cache)
+    # stop like on Ctrl-C, so the workers are shut down rather than left behind
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, cache))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+from bisect import bisect_right
+from collections import OrderedDict
+from math import gcd
+
+
+def _ceil_div(a, b):
+    return int(-(-a // b))
+
+
+class ShadowTrajectory:
+    def __init__(self, route, windows, tick, start, go_speed, slow_speed, stop_zone, slow_zone, clock=0):
+        self.route = route          # RouteIndex of the bus route
+        self.windows = windows      # per leg: natural green windows (((start, green), ...), cycle) of its first approach, or None
+        self.tick = tick            # ms per tick
+        self.clock = clock          # signal clock (ms) at tick 0
+
+        self.go_speed = go_speed
+        self.slow_speed = slow_speed
+        self.stop_zone = stop_zone
+        self.slow_zone = slow_zone
+
+        # the signal pattern seen by the shadow repeats every cycle (lcm over the approaches on the route)
+        self.cycle = 1
+        for w in windows:
+            if w is not None:
+                self.cycle = self.cycle * w[1] // gcd(self.cycle, w[1])
+
+        # piecewise-linear trajectory: the distance at tick m, for ticks[i] <= m <= ticks[i + 1],
+        # is dists[i] + (m - ticks[i]) * speeds[i]; the last breakpoint is the frontier
+        self.ticks = [0]
+        self.dists = [start]
+        self.speeds = []
+
+        # once the (position in loop, time in cycle) state repeats, the trajectory is periodic
+        self.seen = {}
+        self.period = None          # (first periodic tick, ticks per period, distance per period)
+
+    # number of ticks and per-tick speed of the next stretch of constant speed, starting at tick m
+    def next_stretch(self, m, d):
+        route = self.route
+        go = self.go_speed
+        loop_length = route.loop_length
+
+        i = route.leg_at(d)
+        lap = d - d % loop_length
+        leg_end = lap + (route.leg_starts[i + 1] if i + 1 < len(route.leg_starts) else loop_length)
+        leg_ticks = _ceil_div(leg_end - d, go)   # ticks until the shadow moves onto the next leg at go_speed
+
+        window = self.windows[i]
+        if window is None:                      # no stopline on this leg
+            return leg_ticks, go
+
+        # time within each green window's cycle on the next tick
+        greens, cycle = window
+        t = self.clock + (m + 1) * self.tick
+        wait = cycle
+        for start, green in greens:
+            u = (t - start) % cycle
+            if u < green:                       # green until the end of the window
+                return min(leg_ticks, _ceil_div(green - u, self.tick)), go
+            wait = min(wait, cycle - u)         # red until the next window opens
+
+        red_ticks = _ceil_div(wait, self.tick)
+        dist_to_stop = route.stopline_distance(route.leg_approach[i], d) - d
+
+        if dist_to_stop <= self.stop_zone:      # held at (or past) the stopline until the next green
+            return red_ticks, 0
+        if dist_to_stop <= self.slow_zone:      # creeping through the slow zone
+            return 1, min(self.slow_speed, dist_to_stop - self.stop_zone)
+        if dist_to_stop - self.stop_zone < go or self.slow_zone < self.stop_zone + go:
+            return 1, min(go, dist_to_stop - self.stop_zone)
+
+        # full speed until the slow zone is reached
+        return min(red_ticks, _ceil_div(dist_to_stop - self.slow_zone, go)), go
+
+    def extend(self):
+        m = self.ticks[-1]
+        d = self.dists[-1]
+
+        state = (d % self.route.loop_length, (self.clock + m * self.tick) % self.cycle)
+        first = self.seen.get(state)
+        if first is not None:
+            self.period = (first, m - first, d - self.distance_at(first))
+            return
+        self.seen[state] = m
+
+        k, v = self.next_stretch(m, d)
+        if self.speeds and self.speeds[-1] == v:  # same speed: lengthen the previous stretch
+            self.ticks[-1] = m + k
+            self.dists[-1] = d + k * v
+        else:
+            self.speeds.append(v)
+            self.ticks.append(m + k)
+            self.dists.append(d + k * v)
+
+    # shadow distance after n ticks
+    def distance_at(self, n):
+        if self.period is not None and n > self.ticks[-1]:
+            first, ticks, dist = self.period
+            laps, r = divmod(n - first, ticks)
+            return self.distance_at(first + r) + laps * dist
+
+        while self.ticks[-1] < n and self.period is None:
+            self.extend()
+        if self.period is not None and n > self.ticks[-1]:
+            return self.distance_at(n)
+
+        i = bisect_right(self.ticks, n) - 1
+        if i == len(self.speeds):
+            return self.dists[i]
+        return self.dists[i] + (n - self.ticks[i]) * self.speeds[i]
+
+    # first tick after n at which the shadow may change speed
+    def next_change(self, n):
+        if self.period is not None and n >= self.ticks[-1]:
+            first, ticks, _ = self.period
+            laps, r = divmod(n - first, ticks)
+            return n + self.next_change(first + r) - (first + r)
+
+        while self.ticks[-1] <= n and self.period is None:
+            self.extend()
+        if self.period is not None and n >= self.ticks[-1]:
+            return self.next_change(n)
+
+        return self.ticks[bisect_right(self.ticks, n)]
+
+
+# trajectories are shared between runs with the same route, timing and start distance
+_cache = OrderedDict()
+cache_size = 256
+
+
+def shadow_trajectory(bus, controller, tick, start, clock=0):
+    route = bus.route
+    windows = tuple(None if key is None else controller.natural_green(key) for key in route.leg_approach)
+    key = (
+        tuple(route.leg_starts), route.loop_length, route.leg_approach,
+        tuple(sorted(route.stopline_offsets.items())), windows, tick, start, clock,
+        bus.go_speed, bus.slow_speed, bus.stop_zone, bus.slow_zone,
+    )
+
+    trajectory = _cache.get(key)
+    if trajectory is not None:
+        _cache.move_to_end(key)
+        return trajectory
+
+    trajectory = ShadowTrajectory(
+        route, windows, tick, start,
+        bus.go_speed, bus.slow_speed, bus.stop_zone, bus.slow_zone, clock,
+    )
+    _cache[key] = trajectory
+    if len(_cache) > cache_size:
+        _cache.popitem(last=False)
+    return trajectory
@@ -0,0 +1,222 @@
+from bisect import bisect_right
+from enum import Enum
+
+from sim.timing import PlanPhase, TimingPlan
+
+
+class Phase(Enum):
+    NS = "NS" # northbound and southbound approaches
+    EW = "EW" # eastbound and westbound approaches
+
+
+class SignalState(Enum):
+    GREEN = "GREEN"
+    YELLOW = "YELLOW"
+    ALL_RED = "ALL_RED" # clearance after a phase's yellow (timing plans only)
+
+
+# SignalState of each interval kind of a TimingPlan
+states = (SignalState.GREEN, SignalState.YELLOW, SignalState.ALL_RED)
+
+
+# Stopline groups by phase
+# keys make reference to approach direction
+NS_KEYS = ("NB", "SB", "RN_L", "RN_R", "RN_C", "RS_L", "RS_R", "RS_C")
+EW_KEYS = ("EB", "WB", "RE_T", "RE_B", "RE_C", "RW_T", "RW_B", "RW_C")
+
+
+class SignalModel:
+    def __init__(self, stoplines, ns_keys=NS_KEYS, ew_keys=EW_KEYS):
+        self.stoplines = stoplines      # stopline keys (any container supporting "in")
+
+        # Timing (milliseconds)
+        self.green_time = 3000
+        self.yellow_time = 2000
+        self.extension_time = 2500
+        self.offset = 0                 # time into the cycle at which the controller starts
+        self.remaining = self.green_time
+        self.time_debt = 0
+        self.extension_granted = 0      # total extension time granted since the start (ms)
+
+        # A TimingPlan to run instead; None runs NS then EW, each for green_time and yellow_time
+        self.plan = None
+        self.compiled = None            # the two-phase plan, and the (green, yellow) it was built for
+        self.compiled_for = None
+
+        # State
+        self.phase = Phase.NS           # name of the active phase (its index in the plan is phase_index)
+        self.phase_index = 0
+        self.state = SignalState.GREEN
+        self.priority_requested = False
+        self.extension_used = False
+
+        self.ns_keys = ns_keys
+        self.ew_keys = ew_keys
+
+        self.running = False
+
+    # the plan being run: self.plan, or the two-phase plan of green_time and yellow_time
+    def timing(self):
+        if self.plan is not None:
+            return self.plan
+        if self.compiled_for != (self.green_time, self.yellow_time):
+            self.compiled = TimingPlan([
+                PlanPhase(Phase.NS, self.ns_keys, self.green_time, self.yellow_time),
+                PlanPhase(Phase.EW, self.ew_keys, self.green_time, self.yellow_time),
+            ])
+            self.compiled_for = (self.green_time, self.yellow_time)
+        return self.compiled
+
+    # timings of the active phase
+    def phase_timing(self):
+        return self.timing().phases[self.phase_index]
+
+    def start(self):
+        self.running = True
+        self.remaining = self.phase_timing().green # phase timer set to the phase's green time
+        if self.offset:
+            self.seek(self.offset)
+
+    # jump to a point in the natural cycle (ms from the start of the first phase's green)
+    def seek(self, time):
+        plan = self.timing()
+        index, kind, remaining = plan.state_at(time)
+        self.phase_index = index
+        self.phase = plan.phases[index].name
+        self.state = states[kind]
+        self.remaining = remaining
+
+    def reset(self):
+        self.running = False
+        self.phase_index = 0
+        self.phase = self.timing().phases[0].name
+        self.state = SignalState.GREEN
+        self.priority_requested = False
+        self.extension_used = False
+        self.remaining = self.phase_timing().green
+        self.time_debt = 0
+        self.extension_granted = 0
+        self.clear_notice()
+
+    def tick(self, dt):
+        if not self.running:
+            return
+
+        if self.remaining > 0: # while the current phase is green...
+            # check whether conditions for green light extension have been met:
+            # 1. priority has been requested
+            # 2. an extension has not been used during this phase
+            # (and not during an all-red clearance)
+            if (self.priority_requested and not self.extension_used and self.remaining < self.extension_level()
+                    and self.state != SignalState.ALL_RED):
+                self.grant_extension()
+
+            self.remaining -= dt # reduce green_time
+        else: # swap phase
+            if self.state == SignalState.GREEN:
+                self.to_yellow()
+            elif self.state == SignalState.YELLOW and self.phase_timing().all_red > 0:
+                self.to_all_red()
+            else:
+                self.swap_phase()
+
+    # an extension is granted once less than this is left of the phase (ms)
+    def extension_level(self):
+        return self.phase_timing().yellow + 200
+
+    def grant_extension(self):
+        self.remaining += self.extension_time # extend green_time
+        self.extension_used = True            # do not allow another extension during this phase
+        self.time_debt += self.extension_time # increment borrowed green time
+        self.extension_granted += self.extension_time
+        self.notify("GREEN+")                 # notify the user of green light extension
+
+    def swap_phase(self):
+        plan = self.timing()
+        self.phase_index = (self.phase_index + 1) % len(plan.phases) # move to the next phase of the plan
+        phase = plan.phases[self.phase_index]
+        self.phase = phase.name
+        self.state = SignalState.GREEN                                 # set active phase state to GREEN
+        self.priority_requested = False                                # set active phase priority to default state
+        self.extension_used = False
+        self.clear_notice()                                            # clear previous output
+
+        # Apply time debt recovery
+        reduction = min(self.time_debt, phase.green * 0.2)  # cap reduction (avoid zero/negative greens)
+        self.remaining = phase.green - reduction
+        self.time_debt -= reduction
+
+    def to_yellow(self):
+        self.state = SignalState.YELLOW
+        self.remaining = self.phase_timing().yellow  # Set timer for the yellow duration
+
+    def to_all_red(self):
+        self.state = SignalState.ALL_RED
+        self.remaining = self.phase_timing().all_red
+
+    def request_priority(self, approach):
+        if self.accepts_priority(approach):
+            self.priority_requested = True
+            return True
+        return False
+
+    # whether a priority request from this approach would be accepted right now
+    def accepts_priority(self, approach):
+        # only allow requests during GREEN
+        if self.state != SignalState.GREEN:
+            return False
+
+        # reject unknown approaches
+        if approach not in self.stoplines:
+            return False
+
+        # approaches served by the active phase
+        plan = self.timing()
+        return bool(plan.phase_masks[self.phase_index] & plan.bits.get(approach, 0))
+
+    # check whether the current stoplight would be red without TSP:
+    # the approach is not green at this point of the natural cycle (one modulo and a bisect)
+    def would_be_red_without_tsp(self, approach, time):
+        if approach is None:
+            return False
+
+        plan = self.timing()
+        return not plan.green_masks[bisect_right(plan.ends, (time + self.offset) % plan.cycle)] & plan.bits.get(approach, 0)
+
+    # natural (no TSP) green windows of an approach: ((start, green), ...) within the cycle, and the cycle length (ms)
+    # would_be_red_without_tsp(approach, t) is False exactly when (t - start) % cycle < green for one of the windows
+    def natural_green(self, approach):
+        plan = self.timing()
+        cycle = plan.cycle
+        windows = plan.green_windows(approach) or [(0, 0)] # unknown approaches are always red
+        return tuple(((start - self.offset) % cycle, green) for start, green in windows), cycle
+
+    # determine the phase to which each stopline/approach belongs (the first phase serving it)
+    def approach_phase(self, approach):
+        for phase in self.timing().phases:
+            if approach in phase.approaches:
+                return phase.name
+        return None
+
+    # colors shown by each phase: the active phase is either green or yellow, the other phase is red
+    def phase_colors(self):
+        if self.state == SignalState.ALL_RED:
+            return "red", "red"
+        active = "green" if self.state == SignalState.GREEN else "yellow"
+        if self.phase == Phase.NS:
+            return active, "red"
+        return "red", active
+
+    # get the current color of a stopline/approach
+    def get_color(self, approach):
+        plan = self.timing()
+        if self.state != SignalState.ALL_RED and plan.phase_masks[self.phase_index] & plan.bits.get(approach, 0):
+            return "green" if self.state == SignalState.GREEN else "yellow"
+        return "red"
+
+    # hooks for displaying priority state; the headless model has no display
+    def notify(self, text):
+        pass
+
+    def clear_notice(self):
+        pass
@@ -1,33 +1,19 @@
 import turtle
 
-class SignalController:
+from sim.signal_model import SignalModel
+
+
+class SignalController(SignalModel):
     def __init__(self, screen, stoplines):
+        super().__init__(stoplines)
         self.screen = screen
-        self.stoplines = stoplines
-
-        # Timing (milliseconds)
-        self.green_time = 3000
-        self.yellow_time = 2000
-        self.extension_time = 2500
-        self.remaining = self.green_time
-        self.time_debt = 0
-
-        # State
-        self.phase = "NS"               # "NS" or "EW"
-        self.state = "GREEN"            # "GREEN" or "YELLOW"
-        self.priority_requested = False
-        self.extension_used = False
-
-        # Stopline groups by phase
-        # keys make reference to approach direction
-        self.ns_keys = ("NB", "SB", "RN_L", "RN_R", "RN_C", "RS_L", "RS_R", "RS_C")
-        self.ew_keys = ("EB", "WB", "RE_T", "RE_B", "RE_C", "RW_T", "RW_B", "RW_C")
-        self.ns_set = set(self.ns_keys)
-        self.ew_set = set(self.ew_keys)
 
-        self.apply_colors()
+        # Stopline colors: shown on screen, and changed since the last draw
+        self.shown = {}
+        self.dirty = {}
 
-        self.running = False
+        self.apply_colors()
+        self.draw()
 
         # Printer Turtle for displaying priority state
         self.printer = turtle.Turtle()
@@ -36,159 +22,48 @@ class SignalController:
         self.printer.goto(220, 320)
 
     def start(self):
-        self.running = True
-        self.remaining = self.green_time # phase timer set to green_time
-        self.apply_colors_green_approach_only() # default signal color is red
+        super().start()
         self.apply_colors()
 
     def reset(self):
-        self.running = False
-        self.phase = "NS"
-        self.state = "GREEN"
-        self.priority_requested = False
-        self.extension_used = False
-        self.remaining = self.green_time
-        self.time_debt = 0
-        self.printer.clear()
-        self.apply_colors_green_approach_only()
+        super().reset()
         self.apply_colors()
 
-    def tick(self, dt):
-        if not self.running:
-            return
-
-        if self.remaining > 0: # while the current phase is green...
-            # check whether conditions for green light extension have been met:
-            # 1. priority has been requested
-            # 2. an extension has not been used during this phase
-            if self.priority_requested and not self.extension_used and self.remaining < self.yellow_time + 200:
-                self.remaining += self.extension_time # extend green_time
-                self.extension_used = True            # do not allow another extension during this phase
-                self.time_debt += self.extension_time # increment borrowed green time
-                self.printer.clear()
-                self.printer.write("GREEN+", font=("Arial", 14, "bold")) # notify the user of green light extension
-
-            self.remaining -= dt # reduce green_time
-        else: # swap phase
-            if self.state == "GREEN":
-                self.to_yellow()
-            else:
-                self.swap_phase()
-
-    # schedule the next green phase for the end of yellow_time
-    def schedule_next(self):
-        if self.state == "YELLOW":
-            self.screen.ontimer(self.swap_phase, self.yellow_time)
-
     def swap_phase(self):
-        self.phase = "EW" if self.phase == "NS" else "NS" # swap active phase
-        self.state = "GREEN"                              # set active phase state to "GREEN"
-        self.priority_requested = False                   # set active phase priority to default state
-        self.extension_used = False
-        self.printer.clear()                              # clear previous output
-
-        # Apply time debt recovery
-        reduction = min(self.time_debt, self.green_time * 0.2)  # cap reduction (avoid zero/negative greens)
-        self.remaining = self.green_time - reduction
-        self.time_debt -= reduction
-
-        self.apply_colors_green_approach_only()           # recolor the phases separately to avoid a huge redraw spike
-        self.screen.ontimer(self.apply_colors, 25)
-
-    def request_priority(self, approach):
-        # only allow requests during GREEN
-        if self.state != "GREEN":
-            return False
-
-        # reject unknown approaches
-        if approach not in self.stoplines:
-            return False
-
-        # NS phase approaches
-        if approach in self.ns_set and self.phase == "NS":
-            self.priority_requested = True
-            return True
-
-        # EW phase approaches
-        if approach in self.ew_set and self.phase == "EW":
-            self.priority_requested = True
-            return True
-
-        return False
-
-    # check whether the current stoplight would be red without TSP
-    def would_be_red_without_tsp(self, approach, time):
-        if approach is None:
-            return False
-
-        phase_length = self.green_time + self.yellow_time
-        cycle_length = phase_length * 2
-
-        t = time % cycle_length
-
-        # determine phase and state at this point in the cycle
-        if t < self.green_time:
-            natural_phase = "NS"
-            natural_state = "GREEN"
-        elif t < phase_length:
-            natural_phase = "NS"
-            natural_state = "YELLOW"
-        elif t < phase_length + self.green_time:
-            natural_phase = "EW"
-            natural_state = "GREEN"
-        else:
-            natural_phase = "EW"
-            natural_state = "YELLOW"
-
-        approach_phase = self.approach_phase(approach)
-
-        return approach_phase != natural_phase or natural_state == "YELLOW"
-
-    # determine the phase to which each stopline/approach belongs
-    def approach_phase(self, approach):
-        if approach in self.ns_set:
-            return "NS"
-        if approach in self.ew_set:
-            return "EW"
-        return None
+        super().swap_phase()
+        self.apply_colors()
 
     def to_yellow(self):
-            self.state = "YELLOW"
-            self.remaining = self.yellow_time  # Set timer for the yellow duration
-            self.apply_colors()
+        super().to_yellow()
+        self.apply_colors()
+
+    def to_all_red(self):
+        super().to_all_red()
+        self.apply_colors()
 
+    # mark the stoplines whose color changed; nothing is redrawn until draw()
     def apply_colors(self):
-            # the active phase is either green or yellow
-            # the other phase is red
-            if self.phase == "NS":
-                ns = "green" if self.state == "GREEN" else "yellow"
-                ew = "red"
-            else:
-                ew = "green" if self.state == "GREEN" else "yellow"
-                ns = "red"
-
-            # only recolor the phase that is not turning green
-            # this avoids a huge redraw spike
-            if ns != "green":
-                for k in self.ns_keys:
-                    self.stoplines[k].fillcolor(ns)
-
-            if ew != "green":
-                for k in self.ew_keys:
-                        self.stoplines[k].fillcolor(ew)
-
-    def apply_colors_green_approach_only(self):
-        # only recolor the phase that is turning green.
-        # this avoids a huge redraw spike.
-
-        if self.phase == "NS":
-            green_group = self.ns_keys
+        # approaches served by the active phase are green or yellow, the rest red
+        # (a timing plan may serve any subset of the stoplines in a phase)
+        for k in self.stoplines:
+            self.set_color(k, self.get_color(k))
+
+    def set_color(self, key, color):
+        if self.shown.get(key) != color:
+            self.dirty[key] = color
         else:
-            green_group = self.ew_keys
+            self.dirty.pop(key, None) # changed back before it was drawn
+
+    # recolor the changed stoplines (shown on the next screen update)
+    def draw(self):
+        for key, color in self.dirty.items():
+            self.stoplines[key].fillcolor(color)
+            self.shown[key] = color
+        self.dirty.clear()
 
-        for k in green_group:
-            self.stoplines[k].fillcolor("green")
+    def notify(self, text):
+        self.printer.clear()
+        self.printer.write(text, font=("Arial", 14, "bold"))
 
-    # get the current color of a stopline/approach
-    def get_color(self, approach):
-        return self.stoplines[approach].fillcolor()
\ No newline at end of file
+    def clear_notice(self):
+        self.printer.clear()
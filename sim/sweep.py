@@ -0,0 +1,283 @@
+# Sweep every valid route, lane and signal timing headless across all cores:
+#
+#     python -m sim.sweep --green 600:3000:600 --extension 0,700,1400 --delay 5000,15000 -o sweep.csv
+#
+# Timing values are comma-separated lists or inclusive start:stop:step ranges, in ms.
+# Results are appended to the CSV as chunks finish; a summary ranking the routes by TSP
+# benefit is printed at the end. Scenarios already in the results cache (sim/cache.py) are
+# written from it without running; new results are added to it (--no-cache to bypass).
+import argparse
+import csv
+import itertools
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from sim.cache import ResultCache, default_path, fingerprint
+from sim.engine import Result, run_scenario
+from sim.geometry import MapGeometry, valid_paths
+
+columns = [
+    "path", "lane", "green_time", "yellow_time", "extension_time", "delay",
+    "recovery_time", "delay_tsp", "delay_shadow", "recovered_tsp", "recovered_shadow", "time_debt",
+    "extension_granted",
+]
+
+
+# "600,1200" or "600:3000:600" (inclusive) -> list of ints
+def parse_values(text):
+    values = []
+    for part in text.split(","):
+        if ":" in part:
+            start, stop, step = (int(v) for v in part.split(":"))
+            values.extend(range(start, stop + 1, step))
+        else:
+            values.append(int(part))
+    return values
+
+
+# one unit of work: timings for one path and lane (split if there are many timings)
+def make_chunks(work, chunk_size):
+    chunks = []
+    for path, lane, timings in work:
+        for i in range(0, len(timings), chunk_size):
+            chunks.append((path, lane, timings[i:i + chunk_size]))
+    return chunks
+
+
+def scenario_key(path, lane, timing, max_time):
+    return fingerprint(path, lane, *timing, max_time=max_time)
+
+
+# CSV rows of the scenarios found in the cache, and (path, lane, timings) still to run
+def split_cached(cache, paths, lanes, timings, max_time):
+    rows = []
+    work = []
+    for path in paths:
+        for lane in lanes:
+            keys = {scenario_key(path, lane, t, max_time): t for t in timings}
+            found = cache.get_many(keys) if cache is not None else {}
+            for key, result in found.items():
+                rows.append(row(path, lane, keys[key], (
+                    result.recovery_time, result.delay_tsp, result.delay_shadow,
+                    result.recovered_tsp, result.recovered_shadow, result.time_debt,
+                    result.extension_granted,
+                )))
+            missing = [t for key, t in keys.items() if key not in found]
+            if missing:
+                work.append((path, lane, missing))
+    return rows, work
+
+
+# cache entries for the rows of a finished chunk (without delay series)
+def cache_items(path, lane, rows, max_time):
+    items = []
+    for r in rows:
+        timing = tuple(r[2:6])
+        recovery_time, delay_tsp, delay_shadow, recovered_tsp, recovered_shadow, time_debt, granted = r[6:]
+        items.append((scenario_key(path, lane, timing, max_time), Result(
+            recovery_time, timing[3] / 1000.0, delay_tsp, delay_shadow, recovered_tsp, recovered_shadow,
+            time_debt, granted, ([], [], []),
+        )))
+    return items
+
+
+def run_chunk(chunk, max_time, engine):
+    path, lane, timings = chunk
+    rows = []
+
+    if engine == "batch":
+        from sim.batch import run_batch
+
+        green, yellow, extension, delay = (list(v) for v in zip(*timings))
+        result = run_batch(path, lane, green, yellow, extension, delay, max_time=max_time, record=False)
+        for j, timing in enumerate(timings):
+            recovery_time = result.recovery_time[j]
+            initial_delay = timing[3] / 1000.0
+            rows.append(row(path, lane, timing, (
+                None if recovery_time != recovery_time else recovery_time,  # NaN: not recovered
+                result.delay_tsp[j],
+                result.delay_shadow[j],
+                max(0, initial_delay - result.delay_tsp[j]),
+                max(0, initial_delay - result.delay_shadow[j]),
+                result.time_debt[j],
+                result.extension_granted[j],
+            )))
+        return rows
+
+    for timing in timings:
+        result = run_scenario(path, lane, *timing, max_time=max_time)
+        rows.append(row(path, lane, timing, (
+            result.recovery_time, result.delay_tsp, result.delay_shadow,
+            result.recovered_tsp, result.recovered_shadow, result.time_debt,
+            result.extension_granted,
+        )))
+    return rows
+
+
+def row(path, lane, timing, outcome):
+    outcome = [None if v is None else float(v) for v in outcome]
+    return ["-".join(str(n) for n in path), lane, *timing, *outcome]
+
+
+# worker entry point: a failing chunk reports its error instead of taking the sweep down
+def safe_run_chunk(chunk, max_time, engine):
+    try:
+        return chunk, run_chunk(chunk, max_time, engine), None
+    except Exception:
+        return chunk, None, traceback.format_exc()
+
+
+class Progress:
+    def __init__(self, total, stream=sys.stderr):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.stream = stream
+        self.started = time.monotonic()
+
+    def update(self, scenarios, failed=False):
+        self.done += scenarios
+        self.failed += scenarios if failed else 0
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0
+        eta = (self.total - self.done) / rate if rate > 0 else float("inf")
+        self.stream.write(
+            f"\r{self.done}/{self.total} scenarios  {rate:.1f}/s  ETA {format_seconds(eta)}"
+            + (f"  ({self.failed} failed)" if self.failed else "")
+        )
+        self.stream.flush()
+
+    def finish(self):
+        self.stream.write(f"\ndone in {format_seconds(time.monotonic() - self.started)}\n")
+
+
+def format_seconds(seconds):
+    if seconds == float("inf"):
+        return "--:--"
+    m, s = divmod(int(seconds), 60)
+    h, m = divmod(m, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m:02d}:{s:02d}"
+
+
+# run the chunks on a process pool, yielding (chunk, rows, error) as they finish.
+# At most one chunk per worker is in flight. If a worker dies outright the pool breaks: the chunks that
+# were in flight are run one at a time, so only a chunk that kills a worker on its own is charged (and
+# retried once), and the chunks not yet started go on in a new pool of full width.
+def run_pool(chunks, max_time, engine, workers):
+    pending = list(reversed(chunks))
+    while pending:
+        suspects = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            running = {}
+            try:
+                while pending or running:
+                    while pending and len(running) < workers:
+                        chunk = pending.pop()
+                        running[pool.submit(safe_run_chunk, chunk, max_time, engine)] = chunk
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        result = future.result()
+                        del running[future]
+                        yield result
+            except BrokenProcessPool:
+                for future, chunk in running.items():
+                    if future.done() and future.exception() is None:
+                        yield future.result()
+                    else:
+                        suspects.append(chunk)
+        yield from run_alone(suspects, max_time, engine)
+
+
+# run each chunk in a pool of its own worker, giving each two attempts
+def run_alone(chunks, max_time, engine):
+    pool = None
+    try:
+        for chunk in chunks:
+            result = None
+            for attempt in range(2):
+                if pool is None:
+                    pool = ProcessPoolExecutor(max_workers=1)
+                try:
+                    result = pool.submit(safe_run_chunk, chunk, max_time, engine).result()
+                    break
+                except BrokenProcessPool:
+                    pool.shutdown(wait=False)
+                    pool = None
+            yield result or (chunk, None, "worker process died")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def summarize(benefit, stream=sys.stdout, top=10):
+    # mean delay saved by TSP (without-TSP delay minus with-TSP delay) per route
+    ranking = sorted(((sum(v) / len(v), k) for k, v in benefit.items()), reverse=True)
+    stream.write("route      lane  mean TSP benefit (s)\n")
+    for mean, (path, lane) in ranking[:top]:
+        stream.write(f"{path:<10} {lane:<5} {mean:.2f}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep every route, lane and signal timing headless.")
+    parser.add_argument("--green", default="1200", help="green times (ms)")
+    parser.add_argument("--yellow", default="500", help="yellow times (ms)")
+    parser.add_argument("--extension", default="700", help="TSP extension times (ms)")
+    parser.add_argument("--delay", default="5000", help="initial delays of the late bus (ms)")
+    parser.add_argument("--lanes", default=",".join(MapGeometry().grid), help="lanes to sweep (default: all)")
+    parser.add_argument("--max-time", type=int, default=600000, help="give up on a scenario after this long (ms)")
+    parser.add_argument("--engine", choices=("scalar", "batch"), default="scalar",
+                        help="scalar runs one scenario at a time; batch vectorizes each chunk with NumPy")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--chunk-size", type=int, default=64, help="timings per chunk")
+    parser.add_argument("-o", "--output", default="sweep.csv", help="CSV file to write")
+    parser.add_argument("--cache", default=default_path, help="results cache (sqlite)")
+    parser.add_argument("--no-cache", action="store_true", help="run every scenario and leave the cache alone")
+    args = parser.parse_args(argv)
+
+    timings = list(itertools.product(
+        parse_values(args.green), parse_values(args.yellow), parse_values(args.extension), parse_values(args.delay)))
+    lanes = args.lanes.split(",")
+    cache = None if args.no_cache else ResultCache(args.cache)
+    cached_rows, work = split_cached(cache, valid_paths(), lanes, timings, args.max_time)
+    chunks = make_chunks(work, args.chunk_size)
+
+    progress = Progress(sum(len(c[2]) for c in chunks))
+    benefit = {}
+    if cached_rows:
+        sys.stderr.write(f"{len(cached_rows)} scenarios from the cache\n")
+
+    with open(args.output, "w", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(columns)
+
+        writer.writerows(cached_rows)
+        for r in cached_rows:
+            benefit.setdefault((r[0], r[1]), []).append(r[8] - r[7])
+
+        for chunk, rows, error in run_pool(chunks, args.max_time, args.engine, args.workers):
+            if error is not None:
+                path, lane, timings = chunk
+                sys.stderr.write(f"\nchunk {'-'.join(map(str, path))} {lane} failed:\n{error}\n")
+                progress.update(len(timings), failed=True)
+                continue
+
+            writer.writerows(rows)
+            f.flush()
+            for r in rows:
+                benefit.setdefault((r[0], r[1]), []).append(r[8] - r[7])
+            if cache is not None:
+                cache.put_many(cache_items(chunk[0], chunk[1], rows, args.max_time))
+            progress.update(len(rows))
+
+    if cache is not None:
+        cache.close()
+    progress.finish()
+    summarize(benefit)
+
+
+if __name__ == "__main__":
+    main()
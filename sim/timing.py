@@ -0,0 +1,97 @@
+from bisect import bisect_right
+from collections import namedtuple
+
+# interval kinds
+GREEN = 0
+YELLOW = 1
+ALL_RED = 2
+
+# One phase of a plan: the approaches (stopline keys) it serves, and its green, yellow and
+# all-red clearance times (ms). A protected turn is a phase of its own; an approach may be
+# served by several phases (e.g. a protected left followed by the through movement).
+PlanPhase = namedtuple("PlanPhase", ["name", "approaches", "green", "yellow", "all_red"], defaults=(0,))
+
+
+# A fixed-time signal plan with any number of phases, run in order.
+# It is compiled into the end times of the cycle's intervals (green, yellow, all-red of each phase)
+# and, per interval, a bitmask of the approaches it shows green or yellow, so the natural color
+# of an approach at any time takes one modulo and one bisect.
+class TimingPlan:
+    def __init__(self, phases):
+        self.phases = tuple(PlanPhase(*p) for p in phases)
+        if not self.phases:
+            raise ValueError("a timing plan needs at least one phase")
+        for phase in self.phases:
+            if phase.green <= 0 or phase.yellow < 0 or phase.all_red < 0:
+                raise ValueError(f"bad timing for phase {phase.name}: {phase}")
+
+        # one bit per approach
+        self.bits = {}
+        for phase in self.phases:
+            for approach in phase.approaches:
+                self.bits.setdefault(approach, 1 << len(self.bits))
+        self.phase_masks = [self.mask(phase.approaches) for phase in self.phases]
+
+        # cumulative interval boundaries; empty intervals (no yellow or all-red) are left out
+        self.ends = []              # ms from the start of the cycle at which each interval ends
+        self.intervals = []         # (phase index, kind) of each interval
+        self.green_masks = []       # approaches green during each interval
+        self.yellow_masks = []      # approaches yellow during each interval
+        t = 0
+        for i, phase in enumerate(self.phases):
+            for kind, length in ((GREEN, phase.green), (YELLOW, phase.yellow), (ALL_RED, phase.all_red)):
+                if length <= 0:
+                    continue
+                t += length
+                self.ends.append(t)
+                self.intervals.append((i, kind))
+                self.green_masks.append(self.phase_masks[i] if kind == GREEN else 0)
+                self.yellow_masks.append(self.phase_masks[i] if kind == YELLOW else 0)
+        self.cycle = t
+
+    def mask(self, approaches):
+        m = 0
+        for approach in approaches:
+            m |= self.bits.get(approach, 0)
+        return m
+
+    # index of the interval at time t (ms from the start of a cycle; any t, taken modulo the cycle)
+    def interval_at(self, t):
+        return bisect_right(self.ends, t % self.cycle)
+
+    # (phase index, kind, ms left in the interval) at time t
+    def state_at(self, t):
+        t %= self.cycle
+        i = bisect_right(self.ends, t)
+        phase, kind = self.intervals[i]
+        return phase, kind, self.ends[i] - t
+
+    def is_green(self, approach, t):
+        return bool(self.green_masks[bisect_right(self.ends, t % self.cycle)] & self.bits.get(approach, 0))
+
+    def color(self, approach, t):
+        i = bisect_right(self.ends, t % self.cycle)
+        bit = self.bits.get(approach, 0)
+        if self.green_masks[i] & bit:
+            return "green"
+        if self.yellow_masks[i] & bit:
+            return "yellow"
+        return "red"
+
+    # green windows of an approach as (start, length) in ms from the start of the cycle;
+    # consecutive green intervals are merged, including across the end of the cycle
+    def green_windows(self, approach):
+        bit = self.bits.get(approach, 0)
+        windows = []
+        start = 0
+        for end, green in zip(self.ends, self.green_masks):
+            if green & bit:
+                if windows and windows[-1][0] + windows[-1][1] == start:
+                    windows[-1] = (windows[-1][0], end - windows[-1][0])
+                else:
+                    windows.append((start, end - start))
+            start = end
+        if len(windows) > 1 and windows[0][0] == 0 and sum(windows[-1]) == self.cycle:
+            first = windows.pop(0)
+            windows[-1] = (windows[-1][0], windows[-1][1] + first[1])
+        return windows
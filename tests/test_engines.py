@@ -0,0 +1,82 @@
+# Every headless engine against the tick loop (run_scenario with engine="tick" and tick-stepped
+# shadows), over every valid path and lane of the map.
+import math
+from functools import lru_cache
+
+import pytest
+
+from sim.engine import run_scenario
+from sim.fleet import build_fleet
+from sim.geometry import valid_paths
+
+MAX_TIME = 60000
+BATCH_MAX_TIME = 30000      # NumPy steps a whole tick per scenario, so batches are kept short
+
+# (green, yellow, extension, delay) in ms: the default timing, short phases without extensions,
+# long phases with long extensions and a long delay, and a bus that is not late at all
+timings = [
+    (1200, 500, 700, 5000),
+    (300, 100, 0, 500),
+    (3000, 2000, 2500, 15000),
+    (500, 500, 700, 0),
+]
+
+routes = [(tuple(path), lane) for path in valid_paths() for lane in "RL"]
+route_ids = [f"{'-'.join(map(str, path))}-{lane}" for path, lane in routes]
+
+
+@lru_cache(maxsize=None)
+def reference(path, lane, timing, max_time=MAX_TIME):
+    return run_scenario(list(path), lane, *timing, max_time=max_time, record=True, engine="tick", shadows="tick")
+
+
+def outcome(result):
+    return (result.recovery_time, result.delay_tsp, result.delay_shadow, result.recovered_tsp,
+            result.recovered_shadow, result.time_debt, result.extension_granted)
+
+
+@pytest.mark.parametrize("path, lane", routes, ids=route_ids)
+def test_event_engine(path, lane):
+    for timing in timings:
+        result = run_scenario(list(path), lane, *timing, max_time=MAX_TIME, record=True, engine="event")
+        expected = reference(path, lane, timing)
+        assert outcome(result) == outcome(expected), timing
+        assert result.series == expected.series, timing
+
+
+@pytest.mark.parametrize("path, lane", routes, ids=route_ids)
+def test_analytic_shadows(path, lane):
+    for timing in timings:
+        result = run_scenario(list(path), lane, *timing, max_time=MAX_TIME, record=True, engine="tick",
+                              shadows="analytic")
+        expected = reference(path, lane, timing)
+        assert outcome(result) == outcome(expected), timing
+        assert result.series == expected.series, timing
+
+
+@pytest.mark.parametrize("path, lane", routes, ids=route_ids)
+def test_fleet(path, lane):
+    for timing in timings:
+        green, yellow, extension, delay = timing
+        fleet = build_fleet(green, yellow, extension)
+        fleet.add_bus(list(path), lane, delay)
+        fleet.start()
+        (result,) = fleet.run(MAX_TIME)
+        assert outcome(result) == outcome(reference(path, lane, timing)), timing
+
+
+@pytest.mark.parametrize("path, lane", routes, ids=route_ids)
+def test_batch(path, lane):
+    np = pytest.importorskip("numpy")
+    from sim.batch import run_batch
+
+    green, yellow, extension, delay = (np.array(column) for column in zip(*timings))
+    batch = run_batch(list(path), lane, green, yellow, extension, delay, max_time=BATCH_MAX_TIME, record=False)
+    for i, timing in enumerate(timings):
+        expected = reference(path, lane, timing, BATCH_MAX_TIME)
+        recovery_time = None if math.isnan(batch.recovery_time[i]) else float(batch.recovery_time[i])
+        assert recovery_time == expected.recovery_time, timing
+        assert batch.delay_tsp[i] == pytest.approx(expected.delay_tsp, abs=1e-9), timing
+        assert batch.delay_shadow[i] == pytest.approx(expected.delay_shadow, abs=1e-9), timing
+        assert batch.time_debt[i] == expected.time_debt, timing
+        assert batch.extension_granted[i] == expected.extension_granted, timing
@@ -0,0 +1,28 @@
+import io
+
+from sim.engine import Result
+from sim.montecarlo import Summary
+
+
+def result(recovery_time, delay_tsp=1.0, delay_shadow=2.0):
+    return Result(recovery_time, 5.0, delay_tsp, delay_shadow, 0.0, 0.0, 0, False, ([], [], []))
+
+
+def report(results):
+    summary = Summary()
+    for r in results:
+        summary.add(r)
+    out = io.StringIO()
+    summary.report(out)
+    return out.getvalue()
+
+
+def test_report_without_recoveries():
+    text = report([result(None), result(None)])
+    assert "recovery time (s)   n/a" in text
+    assert "inf" not in text and "nan" not in text
+
+
+def test_report_with_recoveries():
+    text = report([result(20.0), result(None)])
+    assert "mean 20.00" in text and "p50" in text
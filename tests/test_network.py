@@ -0,0 +1,76 @@
+# Networks against the tick loop on the same network (Simulation with tick-stepped shadows), over
+# every valid path and lane of a 3×3 grid: analytic shadows, the controller bank and fleets.
+from functools import lru_cache
+
+import pytest
+
+from sim.bus_model import BusModel
+from sim.engine import EventSimulation, Simulation
+from sim.fleet import Fleet
+from sim.geometry import valid_paths
+from sim.network import Network, grid_geometry
+
+MAX_TIME = 60000
+DELAY = 8000
+
+routes = [(tuple(path), lane) for path in valid_paths() for lane in "RL"]
+route_ids = [f"{'-'.join(map(str, path))}-{lane}" for path, lane in routes]
+
+
+# a 3×3 grid whose intersections all run different timings and offsets
+def make_network(kind=Network):
+    network = kind(grid_geometry(3, 3))
+    for i, node in enumerate(sorted(network.controllers)):
+        network.set_timing(node, green_time=(600, 1200, 2000)[i % 3], yellow_time=(300, 500)[i % 2],
+                           extension_time=(700, 1500)[i % 2], offset=i * 740)
+    return network
+
+
+def simulate(network, path, lane, shadows):
+    g = network.geometry.grid[lane]
+    bus = BusModel(network, network.geometry, lane=lane, path=[g[n] for n in path], is_late=True)
+    simulation = Simulation(network, bus, shadows=shadows)
+    simulation.start(DELAY)
+    return simulation.run(MAX_TIME)
+
+
+@lru_cache(maxsize=None)
+def reference(path, lane):
+    return simulate(make_network(), path, lane, "tick")
+
+
+def outcome(result):
+    return (result.recovery_time, result.delay_tsp, result.delay_shadow, result.time_debt, result.extension_granted)
+
+
+@pytest.mark.parametrize("path, lane", routes, ids=route_ids)
+def test_analytic_shadows(path, lane):
+    result = simulate(make_network(), path, lane, "analytic")
+    assert outcome(result) == outcome(reference(path, lane))
+
+
+@pytest.mark.parametrize("path, lane", routes, ids=route_ids)
+def test_bank_network(path, lane):
+    pytest.importorskip("numpy")
+    from sim.bank import BankNetwork
+
+    result = simulate(make_network(BankNetwork), path, lane, "tick")
+    assert outcome(result) == outcome(reference(path, lane))
+
+
+@pytest.mark.parametrize("path, lane", routes, ids=route_ids)
+def test_fleet(path, lane):
+    network = make_network()
+    fleet = Fleet(network, network.geometry)
+    fleet.add_bus(list(path), lane, DELAY)
+    fleet.start()
+    (result,) = fleet.run(MAX_TIME)
+    assert outcome(result) == outcome(reference(path, lane))
+
+
+def test_event_engine_rejects_network():
+    network = make_network()
+    g = network.geometry.grid["R"]
+    bus = BusModel(network, network.geometry, lane="R", path=[g[n] for n in valid_paths()[0]], is_late=True)
+    with pytest.raises(TypeError, match="tick engine"):
+        EventSimulation(network, bus)
@@ -0,0 +1,16 @@
+import json
+
+from sim.run import main
+
+
+def test_bad_path_argument_is_a_bad_scenario(capsys):
+    assert main(["--path", "7-8-9-x"]) == 2
+    err = capsys.readouterr().err
+    assert err.startswith("bad scenario") and "7-8-9-x" in err
+    assert "Traceback" not in err
+
+
+def test_path_argument(capsys):
+    assert main(["--path", "7-8-9-6", "--max-time", "60000", "--format", "json"]) == 0
+    record = json.loads(capsys.readouterr().out)
+    assert record["path"] == [7, 8, 9, 6]
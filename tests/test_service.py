@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+from sim.service import HttpError, Session, SimulationService, read_request
+
+
+def read(data):
+    async def go():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await read_request(reader)
+    return asyncio.run(go())
+
+
+@pytest.mark.parametrize("since", ["x", "1.5", "-1"])
+def test_bad_since_is_a_400(since):
+    service = SimulationService(workers=1)
+    session = Session("1", {})
+    session.samples = [[0.1, 0.0, 0.0], [0.2, 0.1, 0.1]]
+    service.sessions[session.id] = session
+    with pytest.raises(HttpError) as e:
+        service.route("GET", ["sessions", "1", "series"], {"since": [since]}, b"")
+    assert e.value.status == 400
+    status, payload = service.route("GET", ["sessions", "1", "series"], {"since": ["1"]}, b"")
+    assert status == 200 and payload["samples"] == [[0.2, 0.1, 0.1]]
+
+
+@pytest.mark.parametrize("length", ["abc", "-5"])
+def test_bad_content_length_is_a_400(length):
+    with pytest.raises(HttpError) as e:
+        read(f"POST /sessions HTTP/1.1\r\nContent-Length: {length}\r\n\r\n{{}}".encode())
+    assert e.value.status == 400
+    assert read(b"POST /sessions HTTP/1.1\r\nContent-Length: 2\r\n\r\n{}")[3] == b"{}"
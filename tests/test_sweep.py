@@ -0,0 +1,34 @@
+import os
+import time
+
+from sim import sweep
+
+
+# stands in for safe_run_chunk in the (forked) workers; a "boom" chunk kills its worker
+def fake_run_chunk(chunk, max_time, engine):
+    time.sleep(0.005)
+    if chunk[0] == "boom":
+        os._exit(1)
+    return chunk, [chunk[0]], None
+
+
+def test_crash_is_charged_to_its_chunk_only(monkeypatch):
+    alone = []
+    run_alone = sweep.run_alone
+
+    def spy(chunks, *args):
+        alone.extend(chunks)
+        return run_alone(chunks, *args)
+
+    monkeypatch.setattr(sweep, "safe_run_chunk", fake_run_chunk)
+    monkeypatch.setattr(sweep, "run_alone", spy)
+    chunks = [(i, "R", []) for i in range(60)]
+    chunks.insert(20, ("boom", "R", []))
+    chunks.insert(45, ("boom", "L", []))
+
+    results = list(sweep.run_pool(chunks, 1000, "event", 3))
+
+    assert sorted(map(repr, (chunk for chunk, _, _ in results))) == sorted(map(repr, chunks))
+    assert sorted(chunk for chunk, _, error in results if error) == [("boom", "L", []), ("boom", "R", [])]
+    # only the chunks in flight when the pool broke ran one at a time
+    assert len(alone) <= 2 * 3